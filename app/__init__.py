@@ -1,21 +1,33 @@
+import time
+
 import click
 from flask import Flask
 from flask_wtf.csrf import generate_csrf
-from werkzeug.security import generate_password_hash
 
-from config import DevConfig
+from config import get_config
 from app.extensions import database, csrf, socketio
-import os
+from app import cache, concurrency, executors, instrumentation, profiling, security, storage
+from app.db import engines, features  # noqa: F401  (features: sync listeners)
+from app.realtime import socketio_options
 
-def create_app(config_class=DevConfig):
+def create_app(config_class=None):
     app = Flask(__name__)
-    app.config.from_object(config_class)
-
-    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    app.config.from_object(config_class or get_config())
 
+    concurrency.init_app(app)       # before anything imports cv2 / torch
+    engines.configure_pools(app)
     database.init_app(app)
+    engines.init_app(app)
     csrf.init_app(app)
-    socketio.init_app(app)
+    executors.init_app(app)
+    # not socketio's own detection: it picks eventlet whenever it is installed
+    socketio.init_app(app, async_mode=executors.async_mode(),
+                      **socketio_options(app.config["SOCKETIO_MESSAGE_QUEUE"]))
+    security.init_app(app)
+    instrumentation.init_app(app)
+    profiling.init_app(app)
+    storage.init_app(app)
+    cache.init_app(app)
     app.jinja_env.globals["csrf_token"] = generate_csrf
 
     from app.routes import main
@@ -26,7 +38,129 @@ def create_app(config_class=DevConfig):
         """Create every table defined in SQLAlchemy models."""
         click.echo("Creating tables …")
         database.create_all()
-        click.echo("✓ Database ready")
+        from app.classification.versioning import sync_rules
+        click.echo(f"✓ Database ready (rules version {sync_rules()})")
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """Add the tables / columns introduced since the database was created."""
+        from app.db.upgrade import upgrade_db
+        upgrade_db()
+        from app.classification.versioning import sync_rules
+        click.echo(f"✓ Database schema up to date (rules version {sync_rules()})")
+
+    @app.cli.command("reclassify")
+    @click.option("--batch-size", default=5000, show_default=True)
+    def reclassify(batch_size):
+        """Rescore automatic labels produced by an older rules version."""
+        from app.classification.versioning import current_version, reclassify_stale
+        click.echo(f"Rescoring images older than rules version {current_version()} …")
+        changed = reclassify_stale(batch_size, progress=lambda n: click.echo(f"  {n} images"))
+        click.echo(f"✓ {changed} label(s) changed")
+
+    @app.cli.command("export-features")
+    @click.argument("out_dir")
+    @click.option("--format", "fmt", type=click.Choice(["parquet", "npz"]), default=None,
+                  help="parquet if pyarrow is installed, npz otherwise")
+    @click.option("--incremental", is_flag=True, help="only images added since the last export")
+    @click.option("--chunk-size", default=50_000, show_default=True)
+    def export_features_command(out_dir, fmt, incremental, chunk_size):
+        """Export features, labels, flags, timestamps and coordinates."""
+        from app.db.export import export_features
+        total = export_features(out_dir, fmt, incremental, chunk_size,
+                                progress=lambda n: click.echo(f"  {n} rows"))
+        click.echo(f"✓ {total} rows exported to {out_dir}")
+
+    @app.cli.command("tune-rules")
+    @click.option("--out", default="candidate_rules.json", show_default=True)
+    @click.option("--folds", default=5, show_default=True)
+    @click.option("--restarts", default=2, show_default=True, help="random restarts per fold")
+    @click.option("--jobs", default=None, type=int, help="worker processes (default: all cores)")
+    @click.option("--metric", type=click.Choice(["balanced", "accuracy"]), default="balanced",
+                  show_default=True)
+    def tune_rules(out, folds, restarts, jobs, metric):
+        """Tune thresholds / weights on the manually labelled images."""
+        import json
+        from app.classification.rules_store import get_rules
+        from app.classification.tuning import load_labelled_matrix, tune
+
+        X, y = load_labelled_matrix()
+        if len(y) < 10 * folds or y.all() or not y.any():
+            click.echo(f"Not enough labelled images ({len(y)}, {int(y.sum())} full), abort.")
+            return
+        click.echo(f"Tuning on {len(y)} images ({int(y.sum())} full) …")
+        rules = tune(X, y, get_rules(), folds, restarts, jobs, metric)
+        with open(out, "w") as fh:
+            json.dump(rules, fh, indent=2)
+
+        t = rules["tuning"]
+        for name in ("current_rules", "cv_mean", "train"):
+            click.echo(f"  {name:<14}" + "  ".join(f"{k}={v:.3f}" for k, v in t[name].items()))
+        click.echo(f"✓ Candidate rules written to {out} (review it before publishing it)")
+
+    @app.cli.command("backfill-features")
+    @click.option("--batch-size", default=10_000, show_default=True)
+    def backfill_features(batch_size):
+        """Pack the feature columns of existing images into Image.features_vec."""
+        click.echo(f"{features.missing_count()} image(s) to pack …")
+        done = features.backfill(batch_size, progress=lambda n: click.echo(f"  {n} images"))
+        click.echo(f"✓ {done} image(s) packed (schema v{features.FEATURE_SCHEMA_VERSION})")
+
+    @app.cli.command("purge")
+    @click.option("--user", "user_id", type=int, help="images of this user id")
+    @click.option("--since", type=click.DateTime(), help="taken at or after this date")
+    @click.option("--until", type=click.DateTime(), help="taken before this date")
+    @click.option("--location-id", type=int)
+    @click.option("--address", help="exact address of the location")
+    @click.option("--all", "purge_all", is_flag=True, help="every image (no filter)")
+    @click.option("--gc-files", is_flag=True, help="also delete unreferenced stored files")
+    @click.option("--grace-hours", default=24.0, show_default=True,
+                  help="keep the files written more recently (pending uploads)")
+    @click.option("--batch-size", default=5000, show_default=True)
+    @click.option("--yes", is_flag=True, help="don't ask for confirmation")
+    def purge_command(user_id, since, until, location_id, address, purge_all,
+                      gc_files, grace_hours, batch_size, yes):
+        """Delete images in bulk, then orphaned locations and files."""
+        from app.db import purge
+        clauses = purge.image_filter(user_id, since, until, location_id, address)
+        if not clauses and not purge_all and not gc_files:
+            raise click.UsageError("give a filter, --all or --gc-files")
+
+        unlinker, touched = purge.Unlinker(app, grace_hours=grace_hours), set()
+        try:
+            if clauses or purge_all:
+                total = purge.count(clauses)
+                if not yes:
+                    click.confirm(f"Delete {total} image(s)?", abort=True)
+                start = time.perf_counter()
+
+                def report(n):
+                    rate = n / max(time.perf_counter() - start, 1e-9)
+                    eta  = (total - n) / rate if rate else 0
+                    click.echo(f"  {n}/{total} images  {rate:,.0f}/s  ETA {eta:,.0f}s")
+                deleted = purge.purge(clauses, batch_size, unlinker, progress=report,
+                                      locations=touched)
+                click.echo(f"✓ {deleted} image(s) deleted")
+            # only the locations of the purged images (the whole table without a filter)
+            locations = purge.gc_locations(batch_size, location_ids=touched if clauses else None)
+            click.echo(f"✓ {locations} orphaned location(s) deleted")
+            if gc_files:
+                queued = purge.gc_files(grace_hours, unlinker,
+                                        progress=lambda n: click.echo(f"  {n} files queued"))
+                click.echo(f"✓ {queued} unreferenced file(s) queued")
+        finally:
+            click.echo("  waiting for the file deletions …")
+            unlinker.close()
+        click.echo(f"✓ {unlinker.deleted} file(s) removed, {unlinker.shared} kept "
+                   f"(shared with other images), {unlinker.recent} kept (written less than "
+                   f"{grace_hours:g} h ago), {unlinker.failed} failed")
+
+    @app.cli.command("migrate-storage")
+    @click.option("--batch-size", default=500, show_default=True)
+    def migrate_storage(batch_size):
+        """Move the images stored flat in UPLOAD_FOLDER to sharded storage keys."""
+        moved = storage.migrate_legacy(batch_size, progress=lambda n: click.echo(f"  {n} images"))
+        click.echo(f"✓ {moved} image(s) moved to {app.config['STORAGE_BACKEND']} storage")
 
     @app.cli.command("drop-db")
     @click.confirmation_option("--yes", prompt="Drop **ALL** tables?")
@@ -49,7 +183,7 @@ def create_app(config_class=DevConfig):
 
         user = User(name=name,
                     mail=email,
-                    password=generate_password_hash(pwd, method='pbkdf2:sha256', salt_length=8),
+                    password=security.hash_password(pwd),
                     is_admin=True,
                     is_superadmin=True)
         database.session.add(user)
@@ -0,0 +1,165 @@
+"""
+Response / fragment cache and conditional requests.
+
+Cached values are keyed by the *data version*, a counter stored in the
+``data_version`` table and bumped (``bump_data_version``) in the same
+transaction as every write that changes what the dashboard shows (image
+added, edited, deleted, relabelled). A new version simply makes the old keys
+unreachable, so nothing has to be invalidated and every worker / backend
+agrees on what is fresh.
+
+Backends (``CACHE_BACKEND``):
+
+* ``lru``   – in-process LRU of ``CACHE_MAX_ENTRIES`` entries (default);
+* ``redis`` – shared by all the workers / servers (``CACHE_REDIS_URL``, needs
+  the ``redis`` package);
+* ``none``  – disabled.
+
+The version and its timestamp also give the ETag / Last-Modified of the
+pages, so browsers and nginx revalidate with a cheap 304.
+"""
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, g, request
+
+from app.instrumentation import inc
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int = None) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class RedisCache:
+    def __init__(self, url: str, prefix: str = "wdp:"):
+        import redis                        # optional dependency
+        self.client, self.prefix = redis.Redis.from_url(url), prefix
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value, ttl: int = None) -> None:
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+
+class NullCache:
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value, ttl: int = None) -> None:
+        pass
+
+
+def init_app(app) -> None:
+    cfg = app.config
+    backend = cfg["CACHE_BACKEND"]
+    if backend == "redis":
+        cache = RedisCache(cfg["CACHE_REDIS_URL"])
+    elif backend == "none":
+        cache = NullCache()
+    else:
+        cache = LRUCache(cfg["CACHE_MAX_ENTRIES"])
+    app.extensions["wdp_cache"] = cache
+
+
+def cached(name: str, params: dict, compute):
+    """``compute()``, memoised for the current data version and ``params``."""
+    version, _ = data_version()
+    digest = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:16]
+    key    = f"{name}:{version}:{digest}"
+    cache  = current_app.extensions["wdp_cache"]
+    value  = cache.get(key)
+    if value is None:
+        inc("wdp_cache_requests_total", {"name": name, "result": "miss"})
+        value = compute()
+        cache.set(key, value, current_app.config["CACHE_TTL_SECONDS"])
+    else:
+        inc("wdp_cache_requests_total", {"name": name, "result": "hit"})
+    return value
+
+
+# --------------------------------------------------------------------------- #
+# Data version
+# --------------------------------------------------------------------------- #
+def data_version() -> tuple:
+    """(version, last change as an aware UTC datetime or None), read once per
+    request.
+
+    Read from the session the cached values are computed from (the replica if
+    configured): under replication lag the key / ETag then trail the data
+    instead of a stale replica result being cached under the new version."""
+    if "wdp_data_version" not in g:
+        from app.db.engines import read_session
+        from app.db.models import DataVersion
+        row = (
+            read_session().query(DataVersion.version, DataVersion.updated_at)
+            .filter(DataVersion.id == 1)
+            .first()
+        )
+        if row is None:
+            g.wdp_data_version = (0, None)
+        else:
+            updated = row.updated_at.replace(tzinfo=timezone.utc) if row.updated_at else None
+            g.wdp_data_version = (row.version, updated)
+    return g.wdp_data_version
+
+
+def bump_data_version() -> None:
+    """Mark the data as changed; committed with the caller's transaction."""
+    from app.db.models import DataVersion
+    from app.extensions import database
+    now = datetime.utcnow()
+    updated = database.session.query(DataVersion).filter(DataVersion.id == 1).update(
+        {DataVersion.version: DataVersion.version + 1, DataVersion.updated_at: now},
+        synchronize_session=False,
+    )
+    if not updated:                         # fresh database (create-db)
+        database.session.add(DataVersion(id=1, version=1, updated_at=now))
+    g.pop("wdp_data_version", None)
+
+
+# --------------------------------------------------------------------------- #
+# Conditional requests
+# --------------------------------------------------------------------------- #
+def make_etag(*parts) -> str:
+    return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:20]
+
+
+def not_modified(etag: str, last_modified: datetime = None) -> bool:
+    """True if the client's copy (If-None-Match / If-Modified-Since) is fresh."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag: str, last_modified: datetime = None):
+    """Private, always-revalidated response carrying ``etag`` / ``last_modified``."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
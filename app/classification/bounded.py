@@ -0,0 +1,218 @@
+"""
+Memory-bounded variant of ``extract_features`` (``FEATURE_MAX_SIDE`` > 0).
+
+``extract_features`` allocates, per call, several images the size of the
+input (HSV, two masks, two morphology outputs, grey ROI, edges, HSV ROI) plus
+a float32 copy of every ROI pixel for k-means: ~30 bytes per pixel, more than
+a GB for a 40 MP panorama. Here:
+
+* the image is decoded with at most ``max_side`` pixels on its longest side –
+  JPEGs directly at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling), so the full
+  resolution never exists in memory. Other formats (PNG, WebP…) can only be
+  decoded whole, then downscaled: above ``MAX_FULL_DECODE_PIXELS`` they are
+  refused (no features) rather than decoded;
+* the intermediates are written into scratch buffers owned by the thread and
+  reused from one call to the next (at most ``max_side``², so bounded);
+* k-means runs on at most ``KMEANS_SAMPLES`` pixels taken on a regular grid,
+  and the pixel counts come from the grey histogram / ``countNonZero``
+  instead of boolean temporaries.
+
+The features are computed on the reduced image, so they differ slightly from
+the full-resolution ones (the contour count most): tune the rules on
+features extracted in the mode used in production.
+"""
+import logging
+import math
+import threading
+
+import cv2
+import numpy as np
+
+from app.classification.rules import _Stopwatch, find_bin
+
+log = logging.getLogger("wdp")
+
+KMEANS_SAMPLES = 4096
+# largest non-JPEG decoded at full resolution (3 bytes per pixel: 72 MB)
+MAX_FULL_DECODE_PIXELS = 24_000_000
+JPEG_MAGIC = b"\xff\xd8\xff"
+FULL_RES_KERNEL = 15        # morphology kernel of bin_mask at full resolution
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+class _Scratch(threading.local):
+    """Per-thread buffers, grown to the largest size seen and then reused."""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        size = math.prod(shape)
+        buf  = self.buffers.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = self.buffers[name] = np.empty(size, dtype)
+        return buf[:size].reshape(shape)
+
+
+_scratch = _Scratch()
+
+
+def _source_size(image_path: str):
+    """(width, height) read from the file header, None if too large to tell."""
+    from PIL import Image as PILImage
+    try:
+        with PILImage.open(image_path) as im:
+            return im.size
+    except PILImage.DecompressionBombError:
+        return None
+    except OSError:
+        return (0, 0)           # not a format PIL knows: OpenCV decodes it as is
+
+
+def _is_jpeg(image_path: str) -> bool:
+    try:
+        with open(image_path, "rb") as fh:
+            return fh.read(3) == JPEG_MAGIC
+    except OSError:
+        return False
+
+
+def decode_bounded(image_path: str, max_side: int):
+    """BGR image with its longest side <= ``max_side`` (None if unreadable or
+    too large to decode in bounded memory), and the scale applied to it."""
+    size = _source_size(image_path)
+    if not _is_jpeg(image_path):
+        if size is None or size[0] * size[1] > MAX_FULL_DECODE_PIXELS:
+            log.warning("%s: non-JPEG image too large to decode (%s)", image_path,
+                        "x".join(map(str, size)) if size else "unknown size")
+            return None, 1.0
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if img is None:
+            return None, 1.0
+        return downscale(img, max_side)
+
+    longest = max(size) if size else math.inf
+    flag, factor = cv2.IMREAD_COLOR, 1
+    for f, reduced in REDUCED_FLAGS.items():
+        if longest / f >= max_side:
+            flag, factor = reduced, f
+            break
+    img = cv2.imread(image_path, flag)
+    if img is None:
+        return None, 1.0
+    img, scale = downscale(img, max_side)
+    return img, scale / factor
+
+
+def downscale(img: np.ndarray, max_side: int):
+    """``img`` resized (into the scratch buffer) so that its longest side is
+    <= ``max_side``, and the scale applied."""
+    h, w = img.shape[:2]
+    if max(h, w) <= max_side:
+        return img, 1.0
+    scale = max_side / max(h, w)
+    size  = (max(int(w * scale), 1), max(int(h * scale), 1))
+    dst   = _scratch.get("img", (size[1], size[0], 3))
+    cv2.resize(img, size, dst=dst, interpolation=cv2.INTER_AREA)
+    return dst, scale
+
+
+def extract_features_bounded(image_path: str, max_side: int, timings: dict = None,
+                             img: np.ndarray = None):
+    """Same features as ``extract_features``, in bounded memory."""
+    tick = _Stopwatch(timings)
+    if img is None:
+        img, scale = decode_bounded(image_path, max_side)
+    else:
+        img, scale = downscale(img, max_side)
+    tick("decode")
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+
+    # 1-2) HSV segment + clean up (kernel scaled with the image)
+    hsv    = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=_scratch.get("hsv", (h, w, 3)))
+    mask   = cv2.inRange(hsv, (35,50,50), (85,255,255), dst=_scratch.get("mask", (h, w)))
+    other  = cv2.inRange(hsv, (0,0,50), (180,40,200), dst=_scratch.get("mask2", (h, w)))
+    cv2.bitwise_or(mask, other, dst=mask)
+    tick("hsv_mask")
+    k      = max(int(round(FULL_RES_KERNEL * scale)), 3)
+    kern   = cv2.getStructuringElement(cv2.MORPH_RECT, (k, k))
+    cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kern, dst=other)
+    cv2.morphologyEx(other, cv2.MORPH_OPEN, kern, dst=mask)
+    tick("morphology")
+
+    # 3) Find bin contour
+    bin_cnt = find_bin(mask)
+    tick("bin_contour")
+    if bin_cnt is None:
+        return None
+
+    # 4) Crop ROI + mask (views, no copy)
+    x,y,bw,bh = cv2.boundingRect(bin_cnt)
+    roi       = img[y:y+bh, x:x+bw]
+    roi_mask  = mask[y:y+bh, x:x+bw]
+    if roi.size == 0:
+        return None
+
+    # 5) Grayscale & edges
+    gray  = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=_scratch.get("gray", (bh, bw)))
+    edges = cv2.Canny(gray, 50, 150, edges=_scratch.get("edges", (bh, bw)))
+    a2    = bh * bw
+    tick("canny")
+
+    hist          = cv2.calcHist([gray],[0],None,[256],[0,256]).ravel()
+    dark_ratio    = float(hist[:80].sum()) / a2
+    edge_density  = cv2.countNonZero(edges) / a2
+    cnts2, _      = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contour_count = len(cnts2)
+    tick("edge_contours")
+    small         = cv2.resize(roi, (50,50))
+    color_div     = int(len(np.unique(small.reshape(-1,3), axis=0)))
+    tick("unique_colors")
+
+    # the HSV ROI is a view of the HSV image computed above
+    avg_sat       = cv2.mean(hsv[y:y+bh, x:x+bw])[1] / 255.0
+    bright_ratio  = float(hist[181:].sum()) / a2
+    std_int       = float(cv2.meanStdDev(gray)[1][0, 0]) / 255.0
+    tick("intensity_stats")
+
+    hn            = hist/(hist.sum()+1e-6)
+    entropy       = -float(np.sum(hn*np.log2(hn+1e-6)))
+    tick("entropy")
+
+    # color clusters (k=3) on a grid sample of the ROI
+    step          = max(int(math.ceil(math.sqrt(a2 / KMEANS_SAMPLES))), 1)
+    pix           = roi[::step, ::step].reshape(-1,3).astype(np.float32)
+    term_crit     = (cv2.TERM_CRITERIA_EPS|cv2.TERM_CRITERIA_MAX_ITER, 10,1.0)
+    _,labels,_    = cv2.kmeans(pix,3,None,term_crit,1,cv2.KMEANS_RANDOM_CENTERS)
+    counts        = np.bincount(labels.flatten(),minlength=3)/pix.shape[0]
+    color_clusters= int(np.sum(counts>0.05))
+    tick("kmeans")
+
+    aspect_dev    = abs((bw/float(bh)) - 1.0)
+
+    # bin pixels that are not blown out (gray < 250)
+    not_white     = cv2.threshold(gray, 249, 255, cv2.THRESH_BINARY_INV,
+                                  dst=_scratch.get("edges", (bh, bw)))[1]
+    cv2.bitwise_and(not_white, roi_mask, dst=not_white)
+    fill_ratio    = cv2.countNonZero(not_white) / (cv2.countNonZero(roi_mask)+1e-6)
+    tick("fill_ratio")
+
+    return {
+      "dark_ratio":      float(dark_ratio),
+      "edge_density":    float(edge_density),
+      "contour_count":   int(contour_count),
+      "color_diversity": int(color_div),
+      "avg_saturation":  float(avg_sat),
+      "bright_ratio":    float(bright_ratio),
+      "std_intensity":   float(std_int),
+      "entropy":         float(entropy),
+      "color_clusters":  int(color_clusters),
+      "aspect_dev":      float(aspect_dev),
+      "fill_ratio":      float(fill_ratio),
+    }
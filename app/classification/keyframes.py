@@ -0,0 +1,128 @@
+"""
+Automatic keyframe sampling of long videos (dashcam, garbage-truck footage).
+
+The video is read once, front to back. ``sample_fps`` frames per second are
+decoded (the others are only grabbed) and analysed on a ``analysis_width``
+pixels wide thumbnail:
+
+* scene change – Bhattacharyya distance between the hue / saturation
+  histograms of the frame and of the last kept frame;
+* bin present  – the bin mask of ``extract_features`` (``bin_mask`` /
+  ``find_bin``) finds a large enough blob.
+
+A frame is a keyframe when a bin is visible and the scene changed since the
+last keyframe (at least ``min_gap`` seconds earlier). Keyframes are yielded
+one at a time, so memory does not depend on the length of the video.
+"""
+import time
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+from app.classification.rules import bin_mask, find_bin
+
+HIST_BINS = [16, 16]            # hue, saturation
+HIST_RANGES = [0, 180, 0, 256]
+
+
+@dataclass
+class Keyframe:
+    time : float                # seconds from the start of the video
+    index: int                  # frame number
+    image: np.ndarray           # full resolution BGR frame
+    change: float               # histogram distance to the previous keyframe
+
+
+@dataclass
+class SamplerStats:
+    frames   : int = 0          # frames read (grabbed or decoded)
+    analysed : int = 0          # frames decoded and analysed
+    with_bin : int = 0
+    keyframes: int = 0
+    duration : float = 0.0      # seconds of video read
+    elapsed  : float = 0.0      # wall-clock seconds
+    started  : float = field(default_factory=time.perf_counter, repr=False)
+
+    def report(self) -> dict:
+        elapsed = self.elapsed or 1e-9
+        return {
+            "frames"        : self.frames,
+            "analysed"      : self.analysed,
+            "with_bin"      : self.with_bin,
+            "keyframes"     : self.keyframes,
+            "video_seconds" : round(self.duration, 1),
+            "elapsed_s"     : round(self.elapsed, 2),
+            "fps"           : round(self.frames / elapsed, 1),
+            "analysed_fps"  : round(self.analysed / elapsed, 1),
+            "realtime_x"    : round(self.duration / elapsed, 2),
+        }
+
+
+def _hs_histogram(small: np.ndarray) -> np.ndarray:
+    hsv  = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, HIST_BINS, HIST_RANGES)
+    return cv2.normalize(hist, hist).astype(np.float32)
+
+
+def sample_keyframes(video_path: str, stats: SamplerStats = None, sample_fps: float = 2.0,
+                     scene_threshold: float = 0.3, min_gap: float = 2.0,
+                     max_keyframes: int = 100, analysis_width: int = 160,
+                     min_bin_ratio: float = 0.02):
+    """Yield the ``Keyframe`` of ``video_path`` (at most ``max_keyframes``)."""
+    stats = stats if stats is not None else SamplerStats()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"cannot open video {video_path!r}")
+    fps  = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(int(round(fps / sample_fps)), 1)
+
+    last_hist, last_time = None, -min_gap
+    try:
+        index = -1
+        while stats.keyframes < max_keyframes:
+            if not cap.grab():
+                break
+            index += 1
+            stats.frames += 1
+            stats.duration = index / fps
+            if index % step:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                continue
+            stats.analysed += 1
+
+            h, w = frame.shape[:2]
+            small = cv2.resize(frame, (analysis_width, max(int(h * analysis_width / w), 1)),
+                               interpolation=cv2.INTER_AREA)
+            # kernel scaled down with the thumbnail (15 px at full size)
+            if find_bin(bin_mask(small, kernel=3), min_bin_ratio) is None:
+                continue
+            stats.with_bin += 1
+
+            hist = _hs_histogram(small)
+            change = 1.0 if last_hist is None else \
+                cv2.compareHist(last_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+            t = index / fps
+            if change < scene_threshold or t - last_time < min_gap:
+                continue
+
+            last_hist, last_time = hist, t
+            stats.keyframes += 1
+            yield Keyframe(time=t, index=index, image=frame, change=float(change))
+    finally:
+        cap.release()
+        stats.elapsed = time.perf_counter() - stats.started
+
+
+def batched(iterable, size: int):
+    """Lists of ``size`` items (the last one may be shorter)."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,69 @@
+"""
+Trained models used by the app, loaded once per process on first use.
+
+Importing this module is cheap: torch / ultralytics are only imported by the
+loaders, so the CLI commands, the dashboard and the workers that never serve
+``/classifier`` don't pay for them (several seconds and hundreds of MB).
+``preload()`` loads them up front instead.
+"""
+import os
+import threading
+import time
+
+from app import concurrency
+from app.instrumentation import log_event
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
+
+_models = {}
+_lock   = threading.Lock()
+
+
+def _load_yolo(path: str):
+    from ultralytics import YOLO
+    concurrency.apply()         # torch just imported: TORCH_THREADS
+    return YOLO(path)
+
+
+# name -> (weights file in MODEL_DIR, loader)
+MODELS = {
+    "yolo": ("yolo.pt", _load_yolo),
+}
+
+
+def get_model(name: str):
+    """The loaded model ``name``, shared by every request of the process."""
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                filename, loader = MODELS[name]
+                start = time.perf_counter()
+                model = loader(os.path.join(MODEL_DIR, filename))
+                log_event("model_loaded", model=name,
+                          seconds=round(time.perf_counter() - start, 3))
+                _models[name] = model
+    return model
+
+
+def preload(names=None) -> list:
+    """Load ``names`` (default: every model) now; return the names loaded."""
+    names = list(MODELS) if names is None else names
+    for name in names:
+        get_model(name)
+    return names
+
+
+def loaded() -> list:
+    return sorted(_models)
+
+
+def _after_fork() -> None:
+    # models loaded in the gunicorn master are shared copy-on-write; the
+    # lock may have been held by another thread at fork time
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -1,7 +1,9 @@
+import time
 import cv2
 import numpy as np
 from dataclasses import dataclass
-from app.classification.rules_store import get_rules
+from app.classification.rules_store import get_compiled_rules
+from app.classification.scoring import FEATURE_KEYS
 
 @dataclass
 class BinRules:
@@ -18,30 +20,73 @@ class BinRules:
     fill_ratio       : float = 0.85
     full_score_thresh: int   = 4
 
-def extract_features(image_path: str):
-    img = cv2.imread(image_path)
-    if img is None:
-        return None
-    h, w = img.shape[:2]
-    area = h * w
-
+class _Stopwatch:
+    """Records the time spent in each stage into ``timings`` (no-op if None)."""
+    def __init__(self, timings):
+        self.timings = timings
+        self.last    = time.perf_counter()
+
+    def __call__(self, stage: str):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self.last)
+        self.last = now
+
+def bin_mask(img: np.ndarray, tick=None, kernel: int = 15) -> np.ndarray:
+    """Mask of the green / grey (bin coloured) pixels of a BGR image."""
     # 1) HSV segment
     hsv       = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
     mask_g    = cv2.inRange(hsv, (35,50,50), (85,255,255))
     mask_gray = cv2.inRange(hsv, (0,0,50),   (180,40,200))
     mask      = cv2.bitwise_or(mask_g, mask_gray)
+    if tick:
+        tick("hsv_mask")
 
     # 2) Clean up
-    kern = cv2.getStructuringElement(cv2.MORPH_RECT, (15,15))
+    kern = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel,kernel))
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kern)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN,  kern)
+    if tick:
+        tick("morphology")
+    return mask
 
-    # 3) Find bin contour
+def find_bin(mask: np.ndarray, min_ratio: float = 0.02):
+    """Largest blob of ``mask`` if it covers at least ``min_ratio`` of the image."""
     cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not cnts:
         return None
     bin_cnt = max(cnts, key=cv2.contourArea)
-    if cv2.contourArea(bin_cnt) < 0.02 * area:
+    if cv2.contourArea(bin_cnt) < min_ratio * mask.shape[0] * mask.shape[1]:
+        return None
+    return bin_cnt
+
+def extract_features(image_path: str, timings: dict = None, img: np.ndarray = None,
+                     max_side: int = 0):
+    """Compute the 11 rule features of an image, or None if no bin is found.
+
+    ``img`` (BGR) can be given instead of a path, e.g. for video frames. When
+    ``timings`` is a dict, the seconds spent in each stage are added to it
+    (used by the benchmark suite, see ``benchmarks/rules.py``). ``max_side``
+    > 0 selects the memory-bounded mode (``app/classification/bounded.py``).
+    """
+    if max_side:
+        from app.classification.bounded import extract_features_bounded
+        return extract_features_bounded(image_path, max_side, timings, img)
+    tick = _Stopwatch(timings)
+    if img is None:
+        img = cv2.imread(image_path)
+    tick("decode")
+    if img is None:
+        return None
+
+    # 1-2) HSV segment + clean up
+    mask = bin_mask(img, tick)
+
+    # 3) Find bin contour
+    bin_cnt = find_bin(mask)
+    tick("bin_contour")
+    if bin_cnt is None:
         return None
 
     # 4) Crop ROI + mask
@@ -55,25 +100,30 @@ def extract_features(image_path: str):
     gray  = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
     edges = cv2.Canny(gray, 50,150)
     a2    = gray.shape[0] * gray.shape[1]
+    tick("canny")
 
     # base features
     dark_ratio    = np.sum(gray < 80) / a2
     edge_density  = np.sum(edges > 0) / a2
     cnts2, _      = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     contour_count = len(cnts2)
+    tick("edge_contours")
     small         = cv2.resize(roi, (50,50))
     color_div     = int(len(np.unique(small.reshape(-1,3), axis=0)))
+    tick("unique_colors")
 
     # new features
     hsv_roi       = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
     avg_sat       = float(np.mean(hsv_roi[:,:,1]))/255.0
     bright_ratio  = float(np.sum(gray>180))/a2
     std_int       = float(np.std(gray))/255.0
+    tick("intensity_stats")
 
     # entropy
     hist          = cv2.calcHist([gray],[0],None,[256],[0,256]).ravel()
     hn            = hist/(hist.sum()+1e-6)
     entropy       = -float(np.sum(hn*np.log2(hn+1e-6)))
+    tick("entropy")
 
     # color clusters (k=3)
     pix           = roi.reshape(-1,3).astype(np.float32)
@@ -81,12 +131,14 @@ def extract_features(image_path: str):
     _,labels,_    = cv2.kmeans(pix,3,None,term_crit,1,cv2.KMEANS_RANDOM_CENTERS)
     counts        = np.bincount(labels.flatten(),minlength=3)/pix.shape[0]
     color_clusters= int(np.sum(counts>0.05))
+    tick("kmeans")
 
     # aspect deviation (empty AR≈1)
     aspect_dev    = abs((bw/float(bh)) - 1.0)
 
     # fill ratio
     fill_ratio    = float(np.sum((roi_mask>0)&(gray<250))) / (np.sum(roi_mask>0)+1e-6)
+    tick("fill_ratio")
 
     return {
       "dark_ratio":      float(dark_ratio),
@@ -102,42 +154,18 @@ def extract_features(image_path: str):
       "fill_ratio":      float(fill_ratio),
     }
 
-def classify_image_by_rules(image_path: str) -> (str, dict):
-    # load thresholds
-    rules_dict = get_rules()
-    # filter to only fields we need
-    init = {k: rules_dict[k] for k in BinRules.__annotations__ if k in rules_dict}
-    rules = BinRules(**init)
+def classify_image_by_rules(image_path: str, timings: dict = None, img: np.ndarray = None,
+                            max_side: int = 0) -> (str, dict):
+    # load thresholds (immutable snapshot, no lock / file access)
+    rules = get_compiled_rules()
 
-    feat = extract_features(image_path)
+    feat = extract_features(image_path, timings, img, max_side)
     if feat is None:
         # Return empty features dict when extraction fails
-        empty_features = {
-            "dark_ratio": 0.0,
-            "edge_density": 0.0,
-            "contour_count": 0,
-            "color_diversity": 0,
-            "avg_saturation": 0.0,
-            "bright_ratio": 0.0,
-            "std_intensity": 0.0,
-            "entropy": 0.0,
-            "color_clusters": 0,
-            "aspect_dev": 0.0,
-            "fill_ratio": 0.0,
-        }
+        empty_features = {k: 0 if k in ("contour_count", "color_diversity", "color_clusters") else 0.0
+                          for k in FEATURE_KEYS}
         return "empty", empty_features
 
-    score = 0
-    score += 2 if feat["dark_ratio"]      > rules.dark_ratio       else 0
-    score += 1 if feat["edge_density"]    > rules.edge_density     else 0
-    score += 1 if feat["contour_count"]   > rules.contour_count    else 0
-    score += 1 if feat["color_diversity"] > rules.color_diversity  else 0
-    score += 1 if feat["avg_saturation"]  > rules.avg_saturation   else 0
-    score += 1 if feat["bright_ratio"]    < rules.bright_ratio     else 0
-    score += 1 if feat["std_intensity"]   > rules.std_intensity    else 0
-    score += 1 if feat["entropy"]         > rules.entropy          else 0
-    score += 1 if feat["color_clusters"]  >= rules.color_clusters  else 0
-    score += 1 if feat["aspect_dev"]      > rules.aspect_dev       else 0
-    score += 1 if feat["fill_ratio"]      < rules.fill_ratio       else 0
-
-    return ("full" if score >= rules.full_score_thresh else "empty"), feat
+    score = rules.scorer.score([feat[k] for k in FEATURE_KEYS])[0]
+
+    return ("full" if score >= rules.scorer.full_score_thresh else "empty"), feat
@@ -1,16 +1,27 @@
 """
 Central place to load / save the bin-classification thresholds.
 No other code, so nothing here depends on Flask routes.
+
+Readers never lock nor touch the disk: the current rules live in an immutable
+``RulesSnapshot`` that is replaced as a whole (a single reference assignment)
+when the file changes. A daemon thread polls the file's mtime every
+``POLL_SECONDS``; ``save_rules`` publishes its snapshot immediately.
 """
-import json, pathlib, threading
-from typing import Dict, Any
+import json, os, pathlib, tempfile, threading, time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Any, Mapping
+
+from app.classification.scoring import (  # noqa: F401  (FEATURE_KEYS re-exported)
+    DEFAULT_SPEC, FEATURE_KEYS, Scorer, compile_rules, validate_spec,
+)
 
 RULES_PATH   = pathlib.Path(__file__).with_name("rules.json")
-_lock        = threading.RLock()
-_cache: Dict[str, Any] = None
-_mtime: float = None
+POLL_SECONDS = 2.0
+_lock        = threading.Lock()          # writers / watcher start only
 
 DEFAULTS = {
+    "version"          : 0,
     "dark_ratio"       : 0.12,
     "edge_density"     : 0.056,
     "contour_count"    : 8,
@@ -22,28 +33,123 @@ DEFAULTS = {
     "color_clusters"   : 3,
     "aspect_dev"       : 0.40,
     "fill_ratio"       : 0.85,
-    "full_score_thresh": 4
+    "full_score_thresh": 4,
+    "spec"             : DEFAULT_SPEC,
 }
 
-def _touch_file_with_defaults() -> None:
-    RULES_PATH.write_text(json.dumps(DEFAULTS, indent=2))
+# Keys the rules editor can change, with their type
+EDITABLE = {k: type(DEFAULTS[k]) for k in FEATURE_KEYS + ("full_score_thresh",)}
+
+# Key names written by older versions of the rules editor
+LEGACY_KEYS = {
+    "DARK_RATIO_TH"     : "dark_ratio",
+    "EDGE_DENSITY_TH"   : "edge_density",
+    "CONTOUR_COUNT_TH"  : "contour_count",
+    "COLOR_DIVERSITY_TH": "color_diversity",
+    "SAT_MEAN_TH"       : "avg_saturation",
+    "BRIGHT_RATIO_TH"   : "bright_ratio",
+    "STD_INTENSITY_TH"  : "std_intensity",
+    "ENTROPY_TH"        : "entropy",
+    "COLOR_CLUSTERS_TH" : "color_clusters",
+    "ASPECT_DEV_TH"     : "aspect_dev",
+    "FILL_RATIO_TH"     : "fill_ratio",
+    "FULL_SCORE_THRESH" : "full_score_thresh",
+}
+
+
+@dataclass(frozen=True)
+class RulesSnapshot:
+    values: Mapping[str, Any]   # read-only view of the rules
+    scorer: Scorer              # compiled thresholds + rule spec
+    mtime : float
+
+
+def _compile(raw: Dict[str, Any], mtime: float) -> RulesSnapshot:
+    values = {**DEFAULTS, **{LEGACY_KEYS.get(k, k): v for k, v in raw.items()}}
+    return RulesSnapshot(
+        values = MappingProxyType(values),
+        scorer = compile_rules(values, values["spec"]),
+        mtime  = mtime,
+    )
+
+
+def _write_atomic(rules: Dict[str, Any]) -> None:
+    """Write to a temp file next to RULES_PATH then rename it over the old one,
+    so a reader (or another worker) never sees a half-written file."""
+    fd, tmp = tempfile.mkstemp(dir=RULES_PATH.parent, prefix=".rules-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(rules, fh, indent=2)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, RULES_PATH)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _load() -> RulesSnapshot:
+    if not RULES_PATH.exists():
+        _write_atomic(DEFAULTS)
+    mtime = RULES_PATH.stat().st_mtime
+    return _compile(json.loads(RULES_PATH.read_text()), mtime)
+
 
-def get_rules() -> Dict[str, Any]:
-    """Return the latest rules, auto-reloading when the file changes."""
-    global _cache, _mtime
+_snapshot: RulesSnapshot = None
+_watcher: threading.Thread = None
+
+
+def _watch() -> None:
+    global _snapshot
+    while True:
+        time.sleep(POLL_SECONDS)
+        try:
+            if RULES_PATH.stat().st_mtime != _snapshot.mtime:
+                _snapshot = _load()
+        except (OSError, ValueError):
+            continue        # file being replaced / invalid: keep the old rules
+
+
+def _ensure_loaded() -> RulesSnapshot:
+    global _snapshot, _watcher
     with _lock:
-        if not RULES_PATH.exists():
-            _touch_file_with_defaults()
+        if _snapshot is None:
+            _snapshot = _load()
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name="rules-watcher", daemon=True)
+            _watcher.start()
+        return _snapshot
+
+
+def _after_fork() -> None:
+    # threads don't survive fork(): the child starts its own watcher lazily
+    global _watcher, _lock
+    _watcher, _lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_compiled_rules() -> RulesSnapshot:
+    """Return the current rules snapshot (no lock, no I/O once loaded)."""
+    snap = _snapshot
+    if snap is None or _watcher is None:
+        snap = _ensure_loaded()
+    return snap
+
+
+def get_rules() -> Mapping[str, Any]:
+    """Return the latest rules as a read-only mapping."""
+    return get_compiled_rules().values
 
-        mtime = RULES_PATH.stat().st_mtime
-        if _cache is None or mtime != _mtime:
-            _cache = json.loads(RULES_PATH.read_text())
-            _mtime = mtime
-        return _cache
 
 def save_rules(new_rules: Dict[str, Any]) -> None:
+    """Persist ``new_rules``; the current version / rule spec are kept if
+    not given (see ``app.classification.versioning`` to publish a new version)."""
+    global _snapshot
+    current   = get_rules()
+    new_rules = {"version": current["version"], **new_rules}
+    new_rules["spec"] = validate_spec(new_rules.get("spec") or current["spec"])
     with _lock:
-        RULES_PATH.write_text(json.dumps(new_rules, indent=2))
-        # force reload on next get_rules()
-        global _cache, _mtime
-        _cache, _mtime = None, None
+        _write_atomic(new_rules)
+        _snapshot = _compile(new_rules, RULES_PATH.stat().st_mtime)
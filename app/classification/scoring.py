@@ -0,0 +1,95 @@
+"""
+Declarative rule scoring.
+
+A rule spec is a list of ``{"feature", "op", "weight"[, "threshold"]}`` items,
+stored in ``rules.json`` next to the thresholds (a rule without its own
+``threshold`` uses the top-level value of its feature). ``compile_rules``
+turns it into a ``Scorer`` that scores one feature vector or an (N, 11)
+matrix (columns in ``FEATURE_KEYS`` order) with a single NumPy expression, so
+live classification, batch rescoring and what-if analysis share one engine.
+"""
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+
+# The features, in the order used by every vector / matrix of the app
+FEATURE_KEYS = (
+    "dark_ratio", "edge_density", "contour_count", "color_diversity",
+    "avg_saturation", "bright_ratio", "std_intensity", "entropy",
+    "color_clusters", "aspect_dev", "fill_ratio",
+)
+
+OPS = (">", ">=", "<", "<=")
+
+DEFAULT_SPEC = [
+    {"feature": "dark_ratio",      "op": ">",  "weight": 2},
+    {"feature": "edge_density",    "op": ">",  "weight": 1},
+    {"feature": "contour_count",   "op": ">",  "weight": 1},
+    {"feature": "color_diversity", "op": ">",  "weight": 1},
+    {"feature": "avg_saturation",  "op": ">",  "weight": 1},
+    {"feature": "bright_ratio",    "op": "<",  "weight": 1},
+    {"feature": "std_intensity",   "op": ">",  "weight": 1},
+    {"feature": "entropy",         "op": ">",  "weight": 1},
+    {"feature": "color_clusters",  "op": ">=", "weight": 1},
+    {"feature": "aspect_dev",      "op": ">",  "weight": 1},
+    {"feature": "fill_ratio",      "op": "<",  "weight": 1},
+]
+
+
+@dataclass(frozen=True)
+class Scorer:
+    names            : tuple        # one label per rule, e.g. "dark_ratio>"
+    columns          : np.ndarray   # rule -> column of the feature matrix
+    thresholds       : np.ndarray
+    weights          : np.ndarray
+    sign             : np.ndarray   # +1 for > / >=, -1 for < / <=
+    strict           : np.ndarray   # True for > / <
+    full_score_thresh: float
+
+    def contributions(self, X) -> np.ndarray:
+        """Points given by each rule: shape (N, n_rules) for N feature rows."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        d = (X[:, self.columns] - self.thresholds) * self.sign
+        return np.where(self.strict, d > 0, d >= 0) * self.weights
+
+    def score(self, X) -> np.ndarray:
+        """Total score of each row, shape (N,)."""
+        return self.contributions(X).sum(axis=1)
+
+    def is_full(self, X) -> np.ndarray:
+        return self.score(X) >= self.full_score_thresh
+
+
+def validate_spec(spec: Iterable[Mapping[str, Any]]) -> list:
+    """Return the spec as a list of plain dicts, raising ValueError if invalid."""
+    cleaned = []
+    for rule in spec:
+        if rule.get("feature") not in FEATURE_KEYS:
+            raise ValueError(f"unknown feature {rule.get('feature')!r}")
+        if rule.get("op") not in OPS:
+            raise ValueError(f"unknown operator {rule.get('op')!r}")
+        item = {"feature": rule["feature"], "op": rule["op"], "weight": float(rule.get("weight", 1))}
+        if "threshold" in rule:
+            item["threshold"] = float(rule["threshold"])
+        cleaned.append(item)
+    return cleaned
+
+
+def compile_rules(values: Mapping[str, Any], spec: Iterable[Mapping[str, Any]] = None) -> Scorer:
+    """Compile thresholds ``values`` + rule ``spec`` into a vectorized scorer."""
+    spec = validate_spec(DEFAULT_SPEC if spec is None else spec)
+    arrays = dict(
+        columns    = np.array([FEATURE_KEYS.index(r["feature"]) for r in spec], dtype=np.intp),
+        thresholds = np.array([r.get("threshold", values[r["feature"]]) for r in spec], dtype=np.float64),
+        weights    = np.array([r["weight"] for r in spec], dtype=np.float64),
+        sign       = np.array([1.0 if r["op"] in (">", ">=") else -1.0 for r in spec]),
+        strict     = np.array([r["op"] in (">", "<") for r in spec], dtype=bool),
+    )
+    for a in arrays.values():
+        a.setflags(write=False)
+    return Scorer(
+        names             = tuple(f"{r['feature']}{r['op']}" for r in spec),
+        full_score_thresh = float(values["full_score_thresh"]),
+        **arrays,
+    )
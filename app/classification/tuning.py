@@ -0,0 +1,203 @@
+"""
+Offline tuning of the rules against the manually verified labels.
+
+The feature matrix of the ``label_manual`` images is loaded once; the search
+never touches pixels. Starting from the live rules (and from random restarts,
+run in parallel processes), a coordinate descent tries, for one rule at a
+time, every candidate threshold (quantiles of the feature) with every weight
+in ``WEIGHTS`` in a single vectorized pass, then re-tunes
+``full_score_thresh``, until a sweep no longer improves the agreement.
+
+Quality is reported by k-fold cross-validation (tune on k-1 folds, measure on
+the held-out one); the candidate rules are then tuned on all the data.
+
+The matrix is sent to each worker process once, by the pool initializer; a
+task only names its fold and restart seed.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.classification.scoring import FEATURE_KEYS, compile_rules, validate_spec
+
+QUANTILES  = np.linspace(0.02, 0.98, 49)
+WEIGHTS    = (0.0, 1.0, 2.0, 3.0)
+MAX_SWEEPS = 20
+
+# set in each worker process by _init_worker
+_X = _y = _fold_of = None
+
+
+@dataclass
+class Candidate:
+    thresholds       : np.ndarray
+    weights          : np.ndarray
+    full_score_thresh: float
+    score            : float
+
+
+def load_labelled_matrix():
+    """(X, y) of the manually labelled images; y is True for 'full'."""
+    from app.db.features import features_blob, matrix
+    from app.db.models import Image
+    from app.extensions import database
+
+    rows = (
+        database.session.query(Image.label, features_blob())
+        .filter(Image.label_manual.is_(True), Image.label.in_(("full", "empty")))
+        .all()
+    )
+    if not rows:
+        return np.empty((0, len(FEATURE_KEYS))), np.empty(0, dtype=bool)
+    labels, blobs = zip(*rows)
+    y = np.array(labels) == "full"
+    # missing features come out as NaN -> 0
+    X = np.nan_to_num(matrix(blobs).astype(np.float64))
+    keep = X.any(axis=1)                 # all-zero rows: feature extraction failed
+    return X[keep], y[keep]
+
+
+def objective(pred: np.ndarray, y: np.ndarray, metric: str) -> np.ndarray:
+    """Agreement of each column of ``pred`` (N, K) with ``y`` (N,)."""
+    y = y[:, None]
+    if metric == "accuracy":
+        return np.mean(pred == y, axis=0)
+    tpr = np.sum(pred & y, axis=0) / max(int(y.sum()), 1)
+    tnr = np.sum(~pred & ~y, axis=0) / max(int((~y).sum()), 1)
+    return (tpr + tnr) / 2
+
+
+def _passed(d: np.ndarray, strict) -> np.ndarray:
+    return np.where(strict, d > 0, d >= 0)
+
+
+def coordinate_descent(X, y, scorer, thresholds, weights, full_thresh, metric) -> Candidate:
+    Xc   = X[:, scorer.columns]
+    sign = scorer.sign
+    thresholds, weights = thresholds.copy(), weights.copy()
+    P = _passed((Xc - thresholds) * sign, scorer.strict).astype(np.float64)
+    cands = [np.unique(np.quantile(Xc[:, r], QUANTILES)) for r in range(Xc.shape[1])]
+
+    best = objective((P @ weights >= full_thresh)[:, None], y, metric)[0]
+    for _ in range(MAX_SWEEPS):
+        improved = False
+        for r in range(Xc.shape[1]):
+            base = P @ weights - weights[r] * P[:, r]
+            Pc = _passed((Xc[:, r, None] - cands[r][None, :]) * sign[r], scorer.strict[r])
+            for w in WEIGHTS:
+                values = objective(base[:, None] + w * Pc >= full_thresh, y, metric)
+                i = int(np.argmax(values))
+                if values[i] > best + 1e-12:
+                    best, thresholds[r], weights[r] = values[i], cands[r][i], w
+                    P[:, r] = Pc[:, i]
+                    improved = True
+
+        scores = P @ weights
+        levels = np.unique(scores)
+        values = objective(scores[:, None] >= levels[None, :], y, metric)
+        i = int(np.argmax(values))
+        if values[i] > best + 1e-12:
+            best, full_thresh, improved = values[i], float(levels[i]), True
+        if not improved:
+            break
+    return Candidate(thresholds, weights, full_thresh, float(best))
+
+
+def _init_worker(X, y, fold_of) -> None:
+    global _X, _y, _fold_of
+    _X, _y, _fold_of = X, y, fold_of
+
+
+def _search(args) -> Candidate:
+    fold, values, spec, metric, seed = args
+    train  = _fold_of != fold
+    X, y   = _X[train], _y[train]
+    scorer = compile_rules(values, spec)
+    thresholds = scorer.thresholds.copy()
+    weights    = scorer.weights.copy()
+    full       = scorer.full_score_thresh
+    if seed:
+        # random restart: random quantile per rule, random weights
+        rng = np.random.default_rng(seed)
+        Xc = X[:, scorer.columns]
+        thresholds = np.array([np.quantile(Xc[:, r], rng.uniform(0.05, 0.95))
+                               for r in range(Xc.shape[1])])
+        weights = rng.choice(WEIGHTS[1:], size=len(weights))
+        full = float(rng.integers(1, int(weights.sum()) + 1))
+    return coordinate_descent(X, y, scorer, thresholds, weights, full, metric)
+
+
+def metrics(pred: np.ndarray, y: np.ndarray) -> dict:
+    tp = int(np.sum(pred & y)); tn = int(np.sum(~pred & ~y))
+    fp = int(np.sum(pred & ~y)); fn = int(np.sum(~pred & y))
+    return {
+        "accuracy"         : (tp + tn) / max(len(y), 1),
+        "balanced_accuracy": float(objective(pred[:, None], y, "balanced")[0]),
+        "precision_full"   : tp / max(tp + fp, 1),
+        "recall_full"      : tp / max(tp + fn, 1),
+    }
+
+
+def _predict(X, values, spec, cand: Candidate) -> np.ndarray:
+    scorer = compile_rules(values, spec)
+    P = _passed((X[:, scorer.columns] - cand.thresholds) * scorer.sign, scorer.strict)
+    return P @ cand.weights >= cand.full_score_thresh
+
+
+def tune(X, y, values, folds: int = 5, restarts: int = 2, jobs: int = None,
+         metric: str = "balanced", seed: int = 0) -> dict:
+    """Tune ``values`` (current rules) on (X, y); return candidate rules with
+    their cross-validated metrics under ``"tuning"``."""
+    values = dict(values)
+    spec = validate_spec(values["spec"])
+    rng  = np.random.default_rng(seed)
+    fold_of = rng.permutation(len(y)) % folds
+    seeds = [0] + [int(s) for s in rng.integers(1, 2**31, size=restarts)]
+
+    # one task per (fold, restart) + the final fit on all the data (fold -1)
+    tasks = [(fold, values, spec, metric, s) for fold in [*range(folds), -1] for s in seeds]
+    keys  = [t[0] for t in tasks]
+
+    best = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(X, y, fold_of)) as pool:
+        for fold, cand in zip(keys, pool.map(_search, tasks)):
+            if fold not in best or cand.score > best[fold].score:
+                best[fold] = cand
+
+    per_fold = []
+    for fold in range(folds):
+        test = fold_of == fold
+        per_fold.append(metrics(_predict(X[test], values, spec, best[fold]), y[test]))
+    cv = {k: float(np.mean([m[k] for m in per_fold])) for k in per_fold[0]}
+    cv_std = {k: float(np.std([m[k] for m in per_fold])) for k in per_fold[0]}
+
+    current = compile_rules(values, spec).is_full(X)
+    final = best[-1]
+
+    rules = {k: v for k, v in values.items() if k not in ("version", "tuning")}
+    features = [rule["feature"] for rule in spec]
+    new_spec = []
+    for rule, w, t in zip(spec, final.weights, final.thresholds):
+        rule = {**rule, "weight": float(w)}
+        rule.pop("threshold", None)
+        if features.count(rule["feature"]) > 1:
+            rule["threshold"] = round(float(t), 6)    # feature shared by several rules
+        else:
+            rules[rule["feature"]] = round(float(t), 6)
+        new_spec.append(rule)
+    rules["full_score_thresh"] = final.full_score_thresh
+    rules["spec"] = new_spec
+    rules["tuning"] = {
+        "samples"      : int(len(y)),
+        "full_ratio"   : float(np.mean(y)) if len(y) else 0.0,
+        "metric"       : metric,
+        "folds"        : folds,
+        "restarts"     : restarts,
+        "current_rules": metrics(current, y),
+        "cv_mean"      : cv,
+        "cv_std"       : cv_std,
+        "train"        : metrics(_predict(X, values, spec, final), y),
+    }
+    return rules
@@ -0,0 +1,139 @@
+"""
+Rules versions and incremental reclassification.
+
+Publishing thresholds stores them as a new ``RulesVersion`` row and writes
+``rules.json`` with that version number. Automatically labelled images keep
+the version that labelled them (``Image.rules_version``), so after an edit only
+the rows scored under an older version are rescored, from their stored
+features (no pixel is read again).
+
+The database is authoritative: version numbers are ``RulesVersion`` ids, which
+restart with the database, while ``rules.json`` lives in the source tree.
+``sync_rules`` (run by ``create-db`` / ``upgrade-db`` / ``reclassify`` and once
+per process at the first request) makes the file agree with the latest row.
+"""
+import logging
+import threading
+from typing import Any, Dict
+
+import numpy as np
+from sqlalchemy import func, or_
+
+from app.cache import bump_data_version
+from app.classification.rules_store import get_compiled_rules, get_rules, save_rules
+from app.classification.scoring import FEATURE_KEYS
+from app.db.models import Image, RulesVersion
+from app.extensions import database
+
+
+log = logging.getLogger("wdp")
+_synced, _sync_lock = False, threading.Lock()
+
+
+def current_version() -> int:
+    """Latest published version (0 before the first one)."""
+    return database.session.query(func.max(RulesVersion.id)).scalar() or 0
+
+
+def sync_rules() -> int:
+    """Make ``rules.json`` agree with the database; return the live version.
+
+    The latest ``RulesVersion`` wins; an empty table (new / recreated database)
+    records the current ``rules.json`` as the first version."""
+    latest = database.session.query(RulesVersion).order_by(RulesVersion.id.desc()).first()
+    if latest is None:
+        return publish_rules({}).id
+    if get_rules()["version"] != latest.id:
+        log.warning("rules.json is version %s, the database %s: reloading it from the database",
+                    get_rules()["version"], latest.id)
+        save_rules({**latest.rules, "version": latest.id})
+    return latest.id
+
+
+def sync_rules_once() -> None:
+    """``sync_rules`` at the first request of the process."""
+    global _synced
+    if _synced:
+        return
+    with _sync_lock:
+        if not _synced:
+            try:
+                sync_rules()
+                _synced = True
+            except Exception as e:      # no tables yet (before create-db)
+                database.session.rollback()
+                log.warning("could not check the rules version: %s", e)
+
+
+def publish_rules(values: Dict[str, Any], user_id: int = None) -> RulesVersion:
+    """Store ``values`` as a new version and make it the live rules."""
+    rules = {**dict(get_rules()), **values}
+    rules.pop("version", None)
+    version = RulesVersion(rules=rules, user_id=user_id)
+    database.session.add(version)
+    database.session.commit()
+    save_rules({**rules, "version": version.id})
+    return version
+
+
+def reclassify_stale(batch_size: int = 5000, progress=None) -> int:
+    """Rescore every automatic label produced by an older rules version.
+
+    Returns the number of labels that changed. ``progress(done)`` is called
+    after each batch.
+    """
+    version  = sync_rules()
+    scorer   = get_compiled_rules().scorer
+    cols     = [getattr(Image, k) for k in FEATURE_KEYS]
+
+    changed, done, last_id = 0, 0, 0
+    while True:
+        rows = (
+            database.session.query(Image.id, Image.label, *cols)
+            .filter(Image.id > last_id,
+                    Image.label_manual.isnot(True),
+                    or_(Image.rules_version.is_(None), Image.rules_version < version))
+            .order_by(Image.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        ids    = np.array([r[0] for r in rows])
+        labels = np.array([r[1] for r in rows], dtype=object)
+        X      = np.array([r[2:] for r in rows], dtype=np.float64)
+        X      = np.nan_to_num(X, nan=0.0)
+
+        new_labels = np.where(scorer.is_full(X), "full", "empty")
+        # all-zero rows are images whose extraction failed: keep their label
+        failed     = ~X.any(axis=1)
+        new_labels = np.where(failed, labels, new_labels)
+
+        database.session.bulk_update_mappings(Image, [
+            {"id": int(i), "label": str(l), "rules_version": version}
+            for i, l in zip(ids, new_labels)
+        ])
+        # every row got a new rules_version: the cached per-version stats are
+        # stale even when no label flipped
+        bump_data_version()
+        database.session.commit()
+
+        changed += int(np.sum(new_labels != labels))
+        done    += len(rows)
+        last_id  = int(ids[-1])
+        if progress:
+            progress(done)
+    return changed
+
+
+def label_stats_by_version(session=None) -> list:
+    """[(rules_version, full, empty)] over the automatic labels."""
+    full  = func.count().filter(Image.label == "full")
+    empty = func.count().filter(Image.label == "empty")
+    return (
+        (session or database.session).query(Image.rules_version, full, empty)
+        .filter(Image.label_manual.isnot(True))
+        .group_by(Image.rules_version)
+        .order_by(Image.rules_version)
+        .all()
+    )
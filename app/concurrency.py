@@ -0,0 +1,66 @@
+"""
+Thread budgets of the native libraries, set from one place (``config.py``).
+
+OpenCV and torch each start a pool of one thread per core in every process
+that uses them. With 3 gunicorn workers and 4 classification processes each
+on an 8-core machine that is ~120 threads fighting for 8 cores: throughput
+drops and the latency tail explodes. Every gunicorn worker has its own pool of
+``CLASSIFY_WORKERS`` processes (``app.executors``), so the budget is
+
+    gunicorn workers x (max(CV2_THREADS, TORCH_THREADS)
+                        + CLASSIFY_WORKERS x CV2_THREADS)   <=   cores
+
+``init_app`` exports the thread counts to the environment (read by OpenMP,
+MKL and OpenCV when they start, also in the classification processes, which
+inherit it) and applies them to the libraries already imported. The libraries
+imported later (lazily, see ``app.classification.registry``) call ``apply``.
+"""
+import logging
+import os
+import sys
+
+ENV_VARS = {
+    "OMP_NUM_THREADS"       : "torch",
+    "MKL_NUM_THREADS"       : "torch",
+    "OPENCV_FOR_THREADS_NUM": "cv2",
+}
+
+_threads = {"cv2": None, "torch": None}
+log = logging.getLogger("wdp")
+
+
+def configure(cv2_threads: int, torch_threads: int) -> None:
+    _threads.update(cv2=cv2_threads, torch=torch_threads)
+    for var, lib in ENV_VARS.items():
+        if _threads[lib]:
+            os.environ[var] = str(_threads[lib])
+    apply()
+
+
+def apply() -> None:
+    """Set the thread counts of cv2 / torch, if imported (cheap, idempotent)."""
+    cv2, torch = sys.modules.get("cv2"), sys.modules.get("torch")
+    if cv2 is not None and _threads["cv2"]:
+        cv2.setNumThreads(_threads["cv2"])
+    if torch is not None and _threads["torch"] and torch.get_num_threads() != _threads["torch"]:
+        torch.set_num_threads(_threads["torch"])
+
+
+def budget() -> dict:
+    return dict(_threads)
+
+
+def init_app(app) -> None:
+    cfg = app.config
+    configure(cfg["CV2_THREADS"], cfg["TORCH_THREADS"])
+
+    cores   = os.cpu_count() or 1
+    # each worker: its own threads + its own pool of classification processes
+    threads = cfg["WEB_CONCURRENCY"] * (max(cfg["CV2_THREADS"], cfg["TORCH_THREADS"])
+                                        + cfg["CLASSIFY_WORKERS"] * cfg["CV2_THREADS"])
+    if threads > cores:
+        log.warning("thread budget: %d native threads for %d cores (WEB_CONCURRENCY=%d, "
+                    "CLASSIFY_WORKERS=%d, CV2_THREADS=%d, TORCH_THREADS=%d)", threads, cores,
+                    cfg["WEB_CONCURRENCY"], cfg["CLASSIFY_WORKERS"],
+                    cfg["CV2_THREADS"], cfg["TORCH_THREADS"])
+    app.extensions["wdp_concurrency"] = budget()
@@ -3,10 +3,8 @@
 Script pour nettoyer la base de données (supprimer toutes les images et locations)
 """
 
-import os
 from app import create_app
-from app.extensions import database
-from app.db.models import Image, Location
+from app.db.purge import count, gc_locations, purge
 
 def clean_database():
     """Supprime toutes les images et locations de la base de données."""
@@ -14,25 +12,20 @@ def clean_database():
     
     with app.app_context():
         try:
-            # Compter les éléments avant suppression
-            image_count = Image.query.count()
-            location_count = Location.query.count()
+            image_count = count([])
+            print(f"🔄 Suppression de {image_count} images...")
             
-            print(f"🔄 Suppression de {image_count} images et {location_count} locations...")
+            # Par lots : chaque lot est une courte transaction, les fichiers
+            # sont supprimés en arrière-plan
+            purge([], progress=lambda n: print(f"   {n}/{image_count} images supprimées"))
             
-            # Supprimer toutes les images
-            Image.query.delete()
-            
-            # Supprimer toutes les locations
-            Location.query.delete()
-            
-            # Commit les modifications
-            database.session.commit()
+            # Puis les locations qui ne sont plus référencées
+            location_count = gc_locations()
+            print(f"   {location_count} locations supprimées")
             
             print("✅ Base de données nettoyée avec succès!")
             
         except Exception as e:
-            database.session.rollback()
             print(f"❌ Erreur: {e}")
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+"""
+Engine pools and read-replica routing.
+
+The pool settings come from ``SQLALCHEMY_ENGINE_OPTIONS`` (config.py). Each
+pool reports to the metrics registry:
+
+* ``wdp_db_pool_wait_seconds{bind}``  – time to get a connection (waiting for a
+  free one, or opening it);
+* ``wdp_db_pool_checkouts_total{bind}`` / ``wdp_db_pool_checkins_total{bind}``
+  – their difference is the number of connections in use;
+* ``wdp_db_pool_timeouts_total{bind}`` – ``pool_timeout`` exceeded.
+
+``read_session()`` is the session for read-only aggregate queries (dashboard):
+bound to the ``replica`` bind when ``DATABASE_REPLICA_URL`` is set, so they do
+not compete with the upload commits on the primary; the primary session
+otherwise. Its results may lag the primary by the replication delay.
+"""
+import time
+
+from flask import g
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from app.extensions import database
+from app.instrumentation import inc, observe
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waits."""
+
+    bind_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            inc("wdp_db_pool_timeouts_total", {"bind": self.bind_name})
+            raise
+        finally:
+            observe("wdp_db_pool_wait_seconds", time.perf_counter() - start, {"bind": self.bind_name})
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.bind_name = self.bind_name
+        return pool
+
+
+def _instrument(pool, name: str) -> None:
+    labels = {"bind": name}
+    pool.bind_name = name
+    # instance listeners survive pool.recreate() (engine.dispose())
+    event.listen(pool, "checkout", lambda *args: inc("wdp_db_pool_checkouts_total", labels))
+    event.listen(pool, "checkin", lambda *args: inc("wdp_db_pool_checkins_total", labels))
+
+
+def configure_pools(app) -> None:
+    """Before ``database.init_app``: use the instrumented pool class."""
+    cfg = app.config
+    cfg["SQLALCHEMY_ENGINE_OPTIONS"] = {"poolclass": TimedQueuePool,
+                                       **cfg.get("SQLALCHEMY_ENGINE_OPTIONS", {})}
+    cfg["SQLALCHEMY_BINDS"] = {
+        key: {"poolclass": TimedQueuePool, **bind} if isinstance(bind, dict) else bind
+        for key, bind in (cfg.get("SQLALCHEMY_BINDS") or {}).items()
+    }
+
+
+def init_app(app) -> None:
+    with app.app_context():
+        for key, engine in database.engines.items():
+            if isinstance(engine.pool, TimedQueuePool):
+                _instrument(engine.pool, key or "primary")
+
+    @app.teardown_appcontext
+    def _close_read_session(exc=None):
+        session = g.pop("wdp_read_session", None)
+        if session is not None:
+            session.close()
+
+
+def read_session():
+    """Session for read-only aggregates: the replica if configured."""
+    engine = database.engines.get("replica")
+    if engine is None:
+        return database.session
+    session = g.get("wdp_read_session")
+    if session is None:
+        session = g.wdp_read_session = Session(bind=engine)
+    return session
@@ -0,0 +1,178 @@
+"""
+Columnar export of the image features (training data for the rules and for
+``cls.pkl``).
+
+Rows are read with a server-side cursor and handled ``chunk_size`` at a time,
+so memory stays bounded whatever the table size. Each chunk becomes a Parquet
+row group (pyarrow installed) or a ``part-*.npz`` file (NumPy only).
+
+The output directory keeps a ``_watermark.json`` with the last exported image
+id; ``incremental=True`` only exports the images added since. Edits of
+already exported rows (manual relabelling...) are not picked up by an
+incremental export: run a full one to refresh them. A full export replaces
+the ``part-*`` files already in the directory (once it has succeeded), so
+reading the directory as a dataset never sees a row twice.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+
+from app.classification.scoring import FEATURE_KEYS
+from app.db.features import features_blob, matrix
+from app.db.models import Image, Location
+from app.extensions import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:          # optional dependency
+    pa = pq = None
+
+WATERMARK = "_watermark.json"
+LABEL_CODES = {"empty": 0, "full": 1}   # anything else -> -1
+
+_COLUMNS = [
+    Image.id, Image.timestamp, Image.label, Image.label_manual,
+    Image.timestamp_manual, Image.location_manual, Image.rules_version,
+    Image.user_id, Image.location_id, Location.latitude, Location.longitude,
+    features_blob(),
+]
+
+
+def iter_chunks(since_id: int = 0, chunk_size: int = 50_000):
+    """Yield dicts of NumPy columns, ``chunk_size`` images at a time."""
+    stmt = (
+        select(*_COLUMNS)
+        .outerjoin(Location, Image.location_id == Location.id)
+        .where(Image.id > since_id)
+        .order_by(Image.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    result = database.session.execute(stmt)
+    for rows in result.partitions(chunk_size):
+        cols = list(zip(*rows))
+        yield {
+            "id"              : np.array(cols[0], dtype=np.int64),
+            "timestamp"       : np.array(cols[1], dtype="datetime64[us]"),
+            "label"           : np.array([LABEL_CODES.get(l, -1) for l in cols[2]], dtype=np.int8),
+            "label_manual"    : np.array(cols[3], dtype=bool),
+            "timestamp_manual": np.array(cols[4], dtype=bool),
+            "location_manual" : np.array(cols[5], dtype=bool),
+            "rules_version"   : np.array([v if v is not None else -1 for v in cols[6]], dtype=np.int32),
+            "user_id"         : np.array(cols[7], dtype=np.int32),
+            "location_id"     : np.array(cols[8], dtype=np.int32),
+            "latitude"        : np.array(cols[9], dtype=np.float64),
+            "longitude"       : np.array(cols[10], dtype=np.float64),
+            "features"        : matrix(cols[11]),
+        }
+
+
+def read_watermark(out_dir: str) -> dict:
+    path = os.path.join(out_dir, WATERMARK)
+    if not os.path.exists(path):
+        return {"last_id": 0}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _arrow_table(chunk: dict):
+    columns = {k: v for k, v in chunk.items() if k != "features"}
+    for i, key in enumerate(FEATURE_KEYS):
+        columns[key] = chunk["features"][:, i]
+    return pa.table(columns)
+
+
+def export_features(out_dir: str, fmt: str = None, incremental: bool = False,
+                    chunk_size: int = 50_000, progress=None) -> int:
+    """Export the images to ``out_dir``; return the number of rows written."""
+    fmt = fmt or ("parquet" if pq is not None else "npz")
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("pyarrow is required for the parquet format")
+    os.makedirs(out_dir, exist_ok=True)
+
+    since_id = read_watermark(out_dir)["last_id"] if incremental else 0
+    stamp    = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    previous = [] if incremental else [f for f in os.listdir(out_dir) if f.startswith("part-")]
+    writer, total, last_id = None, 0, since_id
+
+    try:
+        for n, chunk in enumerate(iter_chunks(since_id, chunk_size)):
+            if fmt == "parquet":
+                table = _arrow_table(chunk)
+                if writer is None:
+                    writer = pq.ParquetWriter(os.path.join(out_dir, f"part-{stamp}.parquet"), table.schema)
+                writer.write_table(table)
+            else:
+                np.savez(os.path.join(out_dir, f"part-{stamp}-{n:05d}.npz"),
+                         feature_keys=np.array(FEATURE_KEYS), **chunk)
+            total  += len(chunk["id"])
+            last_id = int(chunk["id"][-1])
+            if progress:
+                progress(total)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    with open(os.path.join(out_dir, WATERMARK), "w") as fh:
+        json.dump({"last_id": last_id, "exported_at": stamp, "format": fmt}, fh)
+    for name in previous:
+        if stamp not in name:               # not just rewritten by this export
+            os.remove(os.path.join(out_dir, name))
+    return total
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose content is handed over chunk by chunk."""
+    def __init__(self):
+        self.parts, self.pos = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_export(chunk_size: int = 10_000):
+    """Yield the export as bytes: an Arrow IPC stream if pyarrow is available,
+    CSV otherwise. Used by the admin download endpoint."""
+    if pa is not None:
+        drain, writer = _Drain(), None
+        for chunk in iter_chunks(0, chunk_size):
+            table = _arrow_table(chunk)
+            if writer is None:
+                writer = pa.ipc.new_stream(pa.PythonFile(drain, mode="w"), table.schema)
+            writer.write_table(table)
+            yield drain.take()
+        if writer is not None:
+            writer.close()
+            yield drain.take()
+        return
+
+    header = ["id", "timestamp", "label", "label_manual", "timestamp_manual",
+              "location_manual", "rules_version", "user_id", "location_id",
+              "latitude", "longitude", *FEATURE_KEYS]
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    out.writerow(header)
+    for chunk in iter_chunks(0, chunk_size):
+        for i in range(len(chunk["id"])):
+            out.writerow([chunk[k][i] for k in header[:11]] + list(chunk["features"][i]))
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
@@ -0,0 +1,109 @@
+"""
+Packed feature vectors.
+
+Besides the 11 legacy float columns, ``Image.features_vec`` holds the
+features as one blob of float32 in ``FEATURE_KEYS`` order, and
+``Image.features_version`` the ``FEATURE_SCHEMA_VERSION`` it was written
+with. A result set loads into an (N, 11) matrix with one ``np.frombuffer``
+over the joined blobs, without converting the fields one by one in Python.
+
+The floats are big-endian (network order) so that PostgreSQL can build the
+same blob with ``float4send``: ``backfill`` packs the existing rows with
+set-based ``UPDATE``s, batch by batch. New and edited rows are packed by the
+``before_insert`` / ``before_update`` listeners below, from the legacy
+columns, which stay the source of truth until the backfill is done: readers
+select ``features_blob()``, the stored vector where it is current and the same
+blob built from the legacy columns otherwise.
+"""
+import numpy as np
+from sqlalchemy import LargeBinary, and_, case, event, func, inspect, literal_column, text
+
+from app.classification.scoring import FEATURE_KEYS
+from app.db.models import Image
+from app.extensions import database
+
+FEATURE_SCHEMA_VERSION = 1          # bump when FEATURE_KEYS changes
+DTYPE = np.dtype(">f4")
+MISSING = np.full(len(FEATURE_KEYS), np.nan, dtype=DTYPE).tobytes()
+
+
+def pack(values) -> bytes:
+    """Blob of ``values`` (FEATURE_KEYS order, None -> NaN)."""
+    return np.array([np.nan if v is None else v for v in values], dtype=DTYPE).tobytes()
+
+
+def unpack(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=DTYPE).astype(np.float32)
+
+
+def matrix(blobs) -> np.ndarray:
+    """(N, 11) float32 matrix of a sequence of blobs (NaN rows for None)."""
+    joined = b"".join(b if b is not None else MISSING for b in blobs)
+    return np.frombuffer(joined, dtype=DTYPE).reshape(-1, len(FEATURE_KEYS)).astype(np.float32)
+
+
+@event.listens_for(Image, "before_insert")
+def _pack_on_insert(mapper, connection, target) -> None:
+    target.features_vec     = pack([getattr(target, k) for k in FEATURE_KEYS])
+    target.features_version = FEATURE_SCHEMA_VERSION
+
+
+@event.listens_for(Image, "before_update")
+def _pack_on_update(mapper, connection, target) -> None:
+    state = inspect(target)
+    if any(state.attrs[k].history.has_changes() for k in FEATURE_KEYS):
+        _pack_on_insert(mapper, connection, target)
+
+
+# float4send(x::real) = 4 big-endian bytes, the same as DTYPE
+_PACK_SQL = " || ".join(
+    f"float4send(coalesce({k}::real, 'NaN'::real))" for k in FEATURE_KEYS
+)
+
+
+def features_blob():
+    """Column expression of the packed features of an ``Image`` row, current
+    even before ``backfill`` has reached it."""
+    return case(
+        (and_(Image.features_vec.isnot(None),
+              Image.features_version == FEATURE_SCHEMA_VERSION), Image.features_vec),
+        else_=literal_column(f"({_PACK_SQL})", LargeBinary),
+    ).label("features_vec")
+
+
+def backfill(batch_size: int = 10_000, progress=None) -> int:
+    """Pack the rows written before the vector column (or with an older
+    schema version); return the number of rows updated."""
+    stmt = text(f"""
+        UPDATE image SET features_vec = {_PACK_SQL}, features_version = :version
+        WHERE id IN (
+            SELECT id FROM image
+            WHERE id > :last_id
+              AND (features_vec IS NULL OR features_version IS DISTINCT FROM :version)
+            ORDER BY id LIMIT :limit
+        )
+        RETURNING id
+    """)
+    done, last_id = 0, 0
+    while True:
+        ids = database.session.execute(stmt, {"version": FEATURE_SCHEMA_VERSION,
+                                              "last_id": last_id, "limit": batch_size}
+                                       ).scalars().all()
+        database.session.commit()
+        if not ids:
+            break
+        done   += len(ids)
+        last_id = max(ids)
+        if progress:
+            progress(done)
+    return done
+
+
+def missing_count() -> int:
+    """Rows whose vector is absent or stale (backfill not run yet)."""
+    return (
+        database.session.query(func.count(Image.id))
+        .filter((Image.features_vec.is_(None)) |
+                (Image.features_version != FEATURE_SCHEMA_VERSION))
+        .scalar()
+    )
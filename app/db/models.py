@@ -23,6 +23,17 @@ class Image(database.Model):
     aspect_dev = database.Column(database.Float)
     fill_ratio = database.Column(database.Float)
 
+    # The same features packed as float32 (app/db/features.py), kept in sync
+    # with the columns above
+    features_vec = database.Column(database.LargeBinary)
+    features_version = database.Column(database.SmallInteger)
+
+    # Version of the rules (RulesVersion.id) that produced the automatic label
+    rules_version = database.Column(database.Integer, index=True)
+
+    # 64-bit difference hash, to spot near-duplicate uploads
+    phash = database.Column(database.BigInteger)
+
     # FK vers Location (une seule location par image)
     location_id = database.Column(database.Integer, database.ForeignKey("location.id", ondelete="CASCADE"), nullable=False)
     location = database.relationship("Location", back_populates="images")
@@ -30,6 +41,11 @@ class Image(database.Model):
     # FK vers User
     user_id = database.Column(database.Integer, database.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
 
+    __table_args__ = (
+        # time-series range scans (app/db/timeseries.py), index-only for the counts
+        database.Index("ix_image_timestamp_label", "timestamp", "label"),
+    )
+
 
 class User(database.Model):
     __tablename__ = "user"
@@ -53,4 +69,33 @@ class Location(database.Model):
     images = database.relationship("Image", back_populates="location", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
 
+class RulesVersion(database.Model):
+    """Every set of thresholds ever published; ``id`` is the version number."""
+    __tablename__ = "rules_version"
+    id = database.Column(database.Integer, primary_key=True)
+    created_at = database.Column(database.DateTime, default=datetime.utcnow)
+    user_id = database.Column(database.Integer, database.ForeignKey("user.id", ondelete="SET NULL"))
+    rules = database.Column(database.JSON, nullable=False)
+
+
+class DataVersion(database.Model):
+    """Single row (id=1) counting the changes to the images, used to key the
+    caches and as ETag / Last-Modified of the dashboard."""
+    __tablename__ = "data_version"
+    id = database.Column(database.Integer, primary_key=True)
+    version = database.Column(database.BigInteger, nullable=False, default=0)
+    updated_at = database.Column(database.DateTime, default=datetime.utcnow)
+
 
+class Job(database.Model):
+    """A long operation started from a page and run in the background
+    (``app/jobs.py``); any worker can report its state."""
+    __tablename__ = "job"
+    id = database.Column(database.String(32), primary_key=True)     # uuid4 hex
+    kind = database.Column(database.String(40), nullable=False)
+    state = database.Column(database.String(10), nullable=False, default="running")  # running / done / failed
+    user_id = database.Column(database.Integer, database.ForeignKey("user.id", ondelete="SET NULL"))
+    created_at = database.Column(database.DateTime, default=datetime.utcnow)
+    finished_at = database.Column(database.DateTime)
+    result = database.Column(database.JSON)
+    error = database.Column(database.Text)
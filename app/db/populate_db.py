@@ -6,12 +6,13 @@ et des adresses parisiennes réalistes.
 
 import os
 import random
-import shutil
 from datetime import datetime, timedelta
 from app import create_app
+from app.cache import bump_data_version
 from app.extensions import database
 from app.db.models import Image, Location, User
 from app.classification.rules import classify_image_by_rules
+from app.storage import get_storage
 from ultralytics import YOLO
 import json
 
@@ -189,22 +190,10 @@ def get_random_timestamp():
     timestamp = now - timedelta(days=days_ago, hours=hours_ago, minutes=minutes_ago)
     return timestamp
 
-def copy_image_to_uploads(source_path, upload_folder):
-    """Copie une image vers le dossier uploads et retourne le nom du fichier."""
-    filename = os.path.basename(source_path)
-    destination = os.path.join(upload_folder, filename)
-    
-    # Éviter les doublons
-    if os.path.exists(destination):
-        name, ext = os.path.splitext(filename)
-        counter = 1
-        while os.path.exists(destination):
-            filename = f"{name}_{counter}{ext}"
-            destination = os.path.join(upload_folder, filename)
-            counter += 1
-    
-    shutil.copy2(source_path, destination)
-    return filename
+def copy_image_to_uploads(source_path):
+    """Copie une image dans le stockage et retourne sa clé."""
+    with open(source_path, "rb") as fh:
+        return get_storage().save(fh, source_path)
 
 def create_location(address_data):
     """Crée ou récupère une location."""
@@ -268,7 +257,6 @@ def populate_database():
         # Dossiers source
         test_folder = "Data/test"
         train_clean_folder = "Data/train/with_label/clean"
-        upload_folder = app.config["UPLOAD_FOLDER"]
         
         # Vérifier que les dossiers existent
         if not os.path.exists(test_folder):
@@ -281,9 +269,6 @@ def populate_database():
         
         print(f"✅ Dossiers source trouvés")
         
-        # Créer le dossier uploads s'il n'existe pas
-        os.makedirs(upload_folder, exist_ok=True)
-        
         # Récupérer les images
         test_images = []
         clean_images = []
@@ -319,11 +304,11 @@ def populate_database():
                 print(f"Traitement de l'image {i}/{len(all_images)}: {os.path.basename(source_path)}")
                 
                 # Copier l'image vers uploads
-                filename = copy_image_to_uploads(source_path, upload_folder)
-                filepath = os.path.join(upload_folder, filename)
+                filename = copy_image_to_uploads(source_path)
                 
                 # Classifier l'image avec YOLO
-                label, features = classify_with_yolo(filepath, yolo_model)
+                with get_storage().local_path(filename) as filepath:
+                    label, features = classify_with_yolo(filepath, yolo_model)
                 
                 if label is None:
                     print(f"  ⚠️  Échec classification YOLO, utilisation du fallback")
@@ -356,7 +341,7 @@ def populate_database():
                 location = create_location(address_data)
                 
                 # Ajouter l'image à la DB
-                add_image_to_db(filepath, filename, label, location, timestamp, admin_user.id, features)
+                add_image_to_db(filename, filename, label, location, timestamp, admin_user.id, features)
                 
                 success_count += 1
                 print(f"  ✅ Image ajoutée: {filename} ({label})")
@@ -370,6 +355,7 @@ def populate_database():
         
         # Commit toutes les modifications
         try:
+            bump_data_version()
             database.session.commit()
             print(f"\n🎉 Insertion terminée!")
             print(f"✅ {success_count} images ajoutées avec succès")
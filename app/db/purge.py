@@ -0,0 +1,252 @@
+"""
+Bulk deletion of images, and clean-up of what they leave behind.
+
+``purge`` deletes the images of a user, a date range and / or a location in
+batches of set-based SQL:
+
+    DELETE FROM image WHERE id IN (SELECT id ... ORDER BY id LIMIT n) RETURNING path
+
+one short transaction per batch: locks are held briefly, the dashboard keeps
+working during a million-row purge, progress is reported after every batch
+and an interrupted purge loses at most one batch (run it again to finish).
+No ORM object is loaded.
+
+The returned paths go to the ``Unlinker`` thread, which removes the files in
+the background. Files are content-addressed (identical uploads share one),
+so a file is only removed if no remaining image references it, checked by the
+unlinker right before deleting it, and if it wasn't written during the grace
+period: an identical upload may be waiting for its confirmation. A chunk
+whose check fails (database error) is counted as failed and its files are
+left to ``gc_files``.
+
+``gc_locations`` then removes the ``Location`` rows no image references any
+more (among those the purge touched), and ``gc_files`` the stored files no
+image references (abandoned or rejected uploads, videos, extracted frames
+never confirmed) once older than the grace period.
+
+``delete_user`` chains them for an account; the admin page runs it as a
+background job (``app/jobs.py``).
+"""
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.cache import bump_data_version
+from app.db.models import Image, Location, User
+from app.extensions import database
+from app.storage import get_storage
+
+_STOP = object()
+GRACE_HOURS = 24.0
+
+
+class Unlinker:
+    """Background thread deleting the stored files of purged images."""
+
+    def __init__(self, app, chunk_size: int = 500, max_pending: int = 100,
+                 grace_hours: float = GRACE_HOURS):
+        self.app        = app
+        self.chunk_size = chunk_size
+        self.grace      = grace_hours * 3600
+        self.queue      = queue.Queue(maxsize=max_pending)   # chunks: back-pressure
+        self.deleted = self.shared = self.recent = self.failed = 0
+        self.thread  = threading.Thread(target=self._run, name="unlinker", daemon=True)
+        self.thread.start()
+
+    def submit(self, paths) -> None:
+        paths = [p for p in set(paths) if p]
+        for i in range(0, len(paths), self.chunk_size):
+            self._put(paths[i:i + self.chunk_size])
+
+    def close(self) -> None:
+        """Wait until every submitted file is handled."""
+        try:
+            self._put(_STOP)
+        except RuntimeError:
+            pass                                  # already stopped
+        self.thread.join()
+
+    def _put(self, item) -> None:
+        # a dead thread never drains the queue: don't block on it forever
+        while True:
+            if not self.thread.is_alive():
+                raise RuntimeError("the unlinker thread has stopped")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self) -> None:
+        with self.app.app_context():
+            storage = get_storage()
+            while True:
+                paths = self.queue.get()
+                if paths is _STOP:
+                    return
+                try:
+                    still_used = set(database.session.execute(
+                        select(Image.path).where(Image.path.in_(paths)).distinct()
+                    ).scalars())
+                except SQLAlchemyError:
+                    database.session.rollback()
+                    self.failed += len(paths)     # left to gc_files
+                    continue
+                database.session.rollback()       # end the read transaction
+                for path in paths:
+                    if path in still_used:
+                        self.shared += 1
+                        continue
+                    try:
+                        mtime = storage.mtime(path)
+                        if mtime is not None and mtime > time.time() - self.grace:
+                            self.recent += 1          # left to gc_files
+                            continue
+                        storage.delete(path)
+                        self.deleted += 1
+                    except Exception:             # S3 / disk errors: keep going
+                        self.failed += 1
+
+
+def image_filter(user_id: int = None, start: datetime = None, end: datetime = None,
+                 location_id: int = None, address: str = None) -> list:
+    """WHERE clauses selecting the images to purge."""
+    clauses = []
+    if user_id is not None:
+        clauses.append(Image.user_id == user_id)
+    if start is not None:
+        clauses.append(Image.timestamp >= start)
+    if end is not None:
+        clauses.append(Image.timestamp < end)
+    if location_id is not None:
+        clauses.append(Image.location_id == location_id)
+    if address:
+        clauses.append(Image.location_id.in_(
+            select(Location.id).where(Location.address == address)))
+    return clauses
+
+
+def count(clauses: list) -> int:
+    return database.session.execute(
+        select(func.count(Image.id)).where(*clauses)).scalar()
+
+
+def purge(clauses: list, batch_size: int = 5000, unlinker: Unlinker = None,
+          progress=None, locations: set = None) -> int:
+    """Delete the images matching ``clauses`` (all of them if empty); return
+    the number of rows deleted. Files go to ``unlinker`` (one is started and
+    drained if not given); the location ids of the deleted rows are added to
+    ``locations`` if given."""
+    own = unlinker is None
+    if own:
+        unlinker = Unlinker(current_app._get_current_object())
+    done = 0
+    try:
+        while True:
+            batch = select(Image.id).where(*clauses).order_by(Image.id).limit(batch_size)
+            rows = database.session.execute(
+                delete(Image).where(Image.id.in_(batch)).returning(Image.path, Image.location_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if not rows:
+                database.session.rollback()
+                break
+            bump_data_version()
+            database.session.commit()
+            unlinker.submit([r.path for r in rows])
+            if locations is not None:
+                locations.update(r.location_id for r in rows)
+            done += len(rows)
+            if progress:
+                progress(done)
+    finally:
+        if own:
+            unlinker.close()
+    return done
+
+
+def gc_locations(batch_size: int = 5000, progress=None, location_ids=None) -> int:
+    """Delete the locations no image references, among ``location_ids`` (the
+    whole table if None); return how many."""
+    orphan = ~exists().where(Image.location_id == Location.id)
+    done = 0
+    if location_ids is not None:
+        ids = sorted(location_ids)
+        for i in range(0, len(ids), batch_size):
+            done += database.session.execute(
+                delete(Location).where(Location.id.in_(ids[i:i + batch_size]), orphan)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            database.session.commit()
+            if progress:
+                progress(done)
+        return done
+    while True:
+        batch = select(Location.id).where(orphan).limit(batch_size)
+        n = database.session.execute(
+            delete(Location).where(Location.id.in_(batch))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        database.session.commit()
+        if not n:
+            break
+        done += n
+        if progress:
+            progress(done)
+    return done
+
+
+def delete_user(user_id: int, batch_size: int = 5000) -> dict:
+    """Purge the images of an account, the account, then the locations only
+    it used; return the counts."""
+    touched  = set()
+    unlinker = Unlinker(current_app._get_current_object())
+    try:
+        images = purge(image_filter(user_id=user_id), batch_size, unlinker, locations=touched)
+        database.session.execute(delete(User).where(User.id == user_id)
+                                 .execution_options(synchronize_session=False))
+        database.session.commit()
+        locations = gc_locations(batch_size, location_ids=touched)
+    finally:
+        unlinker.close()
+    return {"images": images, "locations": locations, "files": unlinker.deleted}
+
+
+def gc_files(grace_hours: float = GRACE_HOURS, unlinker: Unlinker = None, progress=None) -> int:
+    """Queue for deletion the stored files older than ``grace_hours`` that no
+    image references; return how many were queued (the unlinker checks the
+    references again right before deleting)."""
+    own = unlinker is None
+    if own:
+        unlinker = Unlinker(current_app._get_current_object(), grace_hours=grace_hours)
+    limit, queued, chunk = time.time() - grace_hours * 3600, 0, []
+
+    def flush():
+        nonlocal queued
+        used = set(database.session.execute(
+            select(Image.path).where(Image.path.in_(chunk)).distinct()).scalars())
+        database.session.rollback()
+        orphans = [k for k in chunk if k not in used]
+        unlinker.submit(orphans)
+        queued += len(orphans)
+        chunk.clear()
+        if progress:
+            progress(queued)
+
+    try:
+        for key, mtime in get_storage().iter_keys():
+            if mtime < limit:
+                chunk.append(key)
+                if len(chunk) >= unlinker.chunk_size:
+                    flush()
+        if chunk:
+            flush()
+    finally:
+        if own:
+            unlinker.close()
+    return queued
@@ -0,0 +1,105 @@
+"""
+Image counts over time.
+
+Rows are selected with a plain range on ``image.timestamp`` (served by the
+``(timestamp, label)`` index, no function applied to the column) and grouped
+with ``date_trunc``, so a year of data at city scale is a single index-only
+scan. Empty buckets are filled in Python and long series are downsampled to
+at most ``max_points`` points by summing consecutive buckets.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+from app.db.models import Image, Location
+
+BUCKETS = {
+    "hour": timedelta(hours=1),
+    "day" : timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+LABELS = ("full", "empty")
+MAX_BUCKETS = 10_000        # dense points built in Python, per request
+
+
+def floor_bucket(ts: datetime, bucket: str) -> datetime:
+    """Python twin of ``date_trunc(bucket, ts)`` (weeks start on Monday)."""
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if bucket == "hour":
+        return ts
+    ts = ts.replace(hour=0)
+    if bucket == "week":
+        ts -= timedelta(days=ts.weekday())
+    return ts
+
+
+def ceil_bucket(ts: datetime, bucket: str) -> datetime:
+    """Start of the first bucket at or after ``ts``."""
+    floor = floor_bucket(ts, bucket)
+    return floor if floor == ts else floor + BUCKETS[bucket]
+
+
+def naive_utc(ts: datetime) -> datetime:
+    """``ts`` as the naive UTC datetime stored in ``image.timestamp``."""
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def counts(session, start: datetime, end: datetime, bucket: str = "day",
+           label: str = None, address: str = None) -> dict:
+    """{bucket start: {"full": n, "empty": n, "other": n}} for ``start <= t < end``."""
+    slot = func.date_trunc(bucket, Image.timestamp).label("slot")
+    query = (
+        session.query(slot, Image.label, func.count(Image.id))
+        .filter(Image.timestamp >= start, Image.timestamp < end)
+    )
+    if label:
+        query = query.filter(Image.label == label)
+    if address:
+        query = query.join(Location, Image.location_id == Location.id).filter(Location.address == address)
+
+    result = {}
+    for when, lbl, n in query.group_by(slot, Image.label).all():
+        key = lbl if lbl in LABELS else "other"
+        bucket_counts = result.setdefault(when, dict.fromkeys((*LABELS, "other"), 0))
+        bucket_counts[key] += n
+    return result
+
+
+def series(session, start: datetime, end: datetime, bucket: str = "day",
+           label: str = None, address: str = None, max_points: int = None) -> dict:
+    """Dense series of the counts, downsampled to ``max_points`` if needed."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    if end <= start:
+        raise ValueError("end must be after start")
+    if (end - start) / BUCKETS[bucket] > MAX_BUCKETS:
+        raise ValueError(f"at most {MAX_BUCKETS} {bucket} buckets")
+
+    found = counts(session, start, end, bucket, label, address)
+    step  = BUCKETS[bucket]
+    zero  = dict.fromkeys((*LABELS, "other"), 0)
+    points, t = [], floor_bucket(start, bucket)
+    while t < end:
+        points.append({"t": t, **found.get(t, zero)})
+        t += step
+
+    group = math.ceil(len(points) / max_points) if max_points and len(points) > max_points else 1
+    if group > 1:
+        merged = []
+        for i in range(0, len(points), group):
+            chunk = points[i:i + group]
+            merged.append({"t": chunk[0]["t"],
+                           **{k: sum(p[k] for p in chunk) for k in zero}})
+        points = merged
+
+    for p in points:
+        p["total"] = sum(p[k] for k in zero)
+        p["t"] = p["t"].isoformat()
+    return {
+        "bucket"      : bucket,
+        "group"       : group,           # buckets summed per point
+        "start"       : start.isoformat(),
+        "end"         : end.isoformat(),
+        "points"      : points,
+    }
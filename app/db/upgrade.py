@@ -0,0 +1,42 @@
+"""
+Idempotent schema upgrades.
+
+``flask create-db`` only creates the missing tables; databases created before
+a column was added to an existing model (or restored from ``base.sql``) are
+brought up to date with ``flask upgrade-db``, which runs every statement
+below. Each one must be safe to run again.
+"""
+from sqlalchemy import text
+
+from app.extensions import database
+
+STATEMENTS = [
+    # rules versioning (Image.rules_version, RulesVersion)
+    "ALTER TABLE image ADD COLUMN IF NOT EXISTS rules_version INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_image_rules_version ON image (rules_version)",
+    # near-duplicate detection (Image.phash)
+    "ALTER TABLE image ADD COLUMN IF NOT EXISTS phash BIGINT",
+    # (a b-tree on phash can't serve the Hamming search: the lookup narrows
+    # on ix_image_timestamp_label and the location instead)
+    "DROP INDEX IF EXISTS ix_image_phash",
+    # address typeahead / filter (needs the pg_trgm contrib extension)
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_location_address_trgm ON location USING gin (address gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_image_location_id ON image (location_id)",
+    # time series (range predicates on image.timestamp)
+    "CREATE INDEX IF NOT EXISTS ix_image_timestamp_label ON image (timestamp, label)",
+    # packed feature vectors (Image.features_vec), filled by `flask backfill-features`
+    "ALTER TABLE image ADD COLUMN IF NOT EXISTS features_vec BYTEA",
+    "ALTER TABLE image ADD COLUMN IF NOT EXISTS features_version SMALLINT",
+    # cache invalidation counter (DataVersion)
+    "INSERT INTO data_version (id, version, updated_at) VALUES (1, 0, now() at time zone 'utc') "
+    "ON CONFLICT (id) DO NOTHING",
+]
+
+
+def upgrade_db() -> None:
+    database.create_all()
+    with database.engine.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))   # index builds are long
+        for statement in STATEMENTS:
+            conn.execute(text(statement))
@@ -0,0 +1,142 @@
+"""
+Offloading of blocking work out of the request handlers.
+
+In the async server mode (gunicorn ``-k eventlet`` / ``-k gevent`` workers,
+see the README) one process serves thousands of connections on green threads,
+so nothing may hold the CPU or block the event loop for long:
+
+* ``offload(fn, ...)``  – CPU-bound work (feature extraction) runs in a
+  process pool of ``CLASSIFY_WORKERS`` processes; the green thread waits for
+  the result without blocking the others;
+* ``blocking(fn, ...)`` – blocking calls that green threads cannot switch out
+  of (disk writes) run in the hub's OS thread pool.
+
+In the default sync mode both run inline (``CLASSIFY_WORKERS = 0``) and
+behave exactly as plain calls. The mode comes from the process itself: green
+only once eventlet / gevent has actually monkey-patched it (the gunicorn
+worker class), not merely because eventlet is installed.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_args = None
+_async_mode = "threading"
+log = logging.getLogger("wdp")
+
+
+def detect_async_mode() -> str:
+    """"eventlet" / "gevent" if the process is monkey-patched, else "threading"."""
+    if "eventlet" in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched("socket"):
+            return "eventlet"
+    if "gevent" in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched("socket"):
+            return "gevent"
+    return "threading"
+
+
+def async_mode() -> str:
+    """The current mode. Checked again until the process is found patched:
+    gunicorn patches its workers after loading a preloaded app."""
+    global _async_mode
+    if _async_mode == "threading":
+        _async_mode = detect_async_mode()
+        if _async_mode != "threading":
+            _green_psycopg2()
+    return _async_mode
+
+
+def _wait(future):
+    """Wait for ``future`` without blocking the other green threads."""
+    mode = async_mode()
+    if mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(future.result)
+    if mode == "gevent":
+        import gevent
+        return gevent.get_hub().threadpool.apply(future.result)
+    return future.result()
+
+
+def offload(fn, *args):
+    """Run picklable ``fn(*args)`` in the process pool (inline if disabled)."""
+    if _pool is None:
+        return fn(*args)
+    return _wait(_pool.submit(fn, *args))
+
+
+def offload_map(fn, items) -> list:
+    """``[fn(item) for item in items]``, spread over the process pool."""
+    if _pool is None:
+        return [fn(item) for item in items]
+    futures = [_pool.submit(fn, item) for item in items]
+    return [_wait(f) for f in futures]
+
+
+def green_threads() -> bool:
+    """True when serving with eventlet / gevent workers."""
+    return async_mode() in ("eventlet", "gevent")
+
+
+def blocking(fn, *args):
+    """Run a blocking call in an OS thread when serving green threads."""
+    mode = async_mode()
+    if mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    if mode == "gevent":
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def classify(image_path: str, max_side: int = 0):
+    """Feature extraction + scoring, run in a pool process: returns
+    (label, features, per-stage timings)."""
+    from app.classification.rules import classify_image_by_rules
+    timings = {}
+    label, features = classify_image_by_rules(image_path, timings, max_side=max_side)
+    return label, features, timings
+
+
+def _green_psycopg2() -> None:
+    """psycopg2 blocks in C: make it yield to the event loop."""
+    try:
+        if _async_mode == "eventlet":
+            from psycogreen.eventlet import patch_psycopg
+        else:
+            from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        log.warning("psycogreen not installed: database queries block the %s worker", _async_mode)
+        return
+    patch_psycopg()
+
+
+def init_app(app) -> None:
+    global _pool, _pool_args
+    async_mode()
+
+    workers = app.config["CLASSIFY_WORKERS"]
+    if workers and _pool is None:
+        # forkserver: children never inherit the monkey-patched / threaded parent
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in
+                                          multiprocessing.get_all_start_methods() else "spawn")
+        _pool_args = {"max_workers": workers, "mp_context": ctx}
+        _pool = ProcessPoolExecutor(**_pool_args)
+
+
+def _after_fork() -> None:
+    # app preloaded by the gunicorn master: each worker needs its own pool,
+    # the inherited one shares its queues with the other workers
+    global _pool
+    if _pool is not None:
+        _pool = ProcessPoolExecutor(**_pool_args)
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,221 @@
+"""
+Lightweight instrumentation: stage timers, counters and a Prometheus-style
+``/metrics`` endpoint, plus ``log_event`` for level-gated structured logs.
+
+Each process keeps its own registry. When ``METRICS_DIR`` is configured every
+gunicorn worker also dumps its registry to ``<METRICS_DIR>/<pid>.json`` (at
+most every ``METRICS_FLUSH_SECONDS``) and ``/metrics`` sums the files of all
+workers, so whichever worker answers the scrape reports the whole server.
+The files of workers that are gone are removed at the next scrape.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+logger = logging.getLogger("wdp")
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_lock       = threading.Lock()
+_flush_lock = threading.Lock()    # one thread writes <pid>.json at a time
+_counters   = {}    # (name, labels) -> float
+_histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+_metrics_dir: str = None
+_flush_every: float = 5.0
+_last_flush: float = 0.0
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels: dict = None, value: float = 1.0) -> None:
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _maybe_flush()
+
+
+def observe(name: str, seconds: float, labels: dict = None) -> None:
+    """Record one observation in a latency histogram."""
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        h[-2] += seconds
+        h[-1] += 1
+    _maybe_flush()
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the block into ``wdp_stage_seconds{stage=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("wdp_stage_seconds", time.perf_counter() - start, {"stage": stage})
+
+
+def log_event(event: str, level: int = logging.DEBUG, **fields) -> None:
+    """Emit ``event`` with ``fields`` as one JSON log line, only if ``level``
+    is enabled (so nothing is serialised for disabled debug logs)."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+
+# --------------------------------------------------------------------------- #
+# Multi-process aggregation
+# --------------------------------------------------------------------------- #
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "counters"  : [[n, list(l), v] for (n, l), v in _counters.items()],
+            "histograms": [[n, list(l), list(h)] for (n, l), h in _histograms.items()],
+        }
+
+
+def _flush(wait: bool = True) -> None:
+    global _last_flush
+    if not _metrics_dir:
+        return
+    if not _flush_lock.acquire(blocking=wait):
+        return          # another thread of the worker is writing it right now
+    try:
+        _last_flush = time.monotonic()
+        path = os.path.join(_metrics_dir, f"{os.getpid()}.json")
+        tmp  = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(_snapshot(), fh)
+        os.replace(tmp, path)
+    finally:
+        _flush_lock.release()
+
+
+def _maybe_flush() -> None:
+    if _metrics_dir and time.monotonic() - _last_flush > _flush_every:
+        _flush(wait=False)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass            # exists, owned by another user
+    return True
+
+
+def _collect() -> tuple:
+    """Merge the registries of every worker (or just this one)."""
+    if not _metrics_dir:
+        snapshots = [_snapshot()]
+    else:
+        _flush()
+        snapshots = []
+        for name in os.listdir(_metrics_dir):
+            if name.endswith(".json"):
+                path = os.path.join(_metrics_dir, name)
+                pid  = name[:-len(".json")]
+                if pid.isdigit() and not _alive(int(pid)):
+                    # dead / restarted worker: its totals must not stay forever
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    with open(path) as fh:
+                        snapshots.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue    # worker is rewriting its file, skip this round
+
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, h in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            acc = histograms.setdefault(key, [0] * len(h))
+            histograms[key] = [a + b for a, b in zip(acc, h)]
+    return counters, histograms
+
+
+def _fmt_labels(labels, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    counters, histograms = _collect()
+    lines = []
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_fmt_labels(labels, {'le': le})} {cumulative}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------------------------- #
+# Flask wiring
+# --------------------------------------------------------------------------- #
+def init_app(app) -> None:
+    global _metrics_dir, _flush_every
+    _metrics_dir = app.config.get("METRICS_DIR")
+    _flush_every = app.config.get("METRICS_FLUSH_SECONDS", 5.0)
+    if _metrics_dir:
+        os.makedirs(_metrics_dir, exist_ok=True)
+        atexit.register(_flush)
+
+    logger.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+
+    @app.before_request
+    def _start_timer():
+        g.wdp_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get("wdp_start")
+        if start is not None and request.endpoint != "metrics":
+            labels = {"endpoint": request.endpoint or "unknown"}
+            observe("wdp_http_request_seconds", time.perf_counter() - start, labels)
+            inc("wdp_http_requests_total", {**labels, "status": response.status_code})
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,56 @@
+"""
+Background jobs for the operations a page starts but that take longer than a
+request may (rescoring after a rules edit, deleting an account, sampling an
+hours-long video).
+
+``start`` records a ``Job`` row and runs the function with
+``socketio.start_background_task`` (an OS thread with sync workers, a green
+thread with eventlet / gevent) in its own app context; the return value
+(JSON-serialisable) is stored as the job's result. The state lives in the
+database, so whichever worker serves the next request can report it.
+
+A job interrupted by a worker restart stays ``running``: the jobs below are
+all safe to start again, and each has a CLI equivalent.
+"""
+import logging
+import uuid
+from datetime import datetime
+
+from flask import current_app
+
+from app.db.models import Job
+from app.extensions import database, socketio
+
+log = logging.getLogger("wdp")
+
+
+def start(kind: str, fn, *args, user_id: int = None) -> str:
+    """Run ``fn(*args)`` in the background; return the job id."""
+    job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, state="running")
+    database.session.add(job)
+    database.session.commit()
+    socketio.start_background_task(_run, current_app._get_current_object(), job.id, fn, args)
+    return job.id
+
+
+def get(job_id: str) -> Job:
+    return database.session.get(Job, job_id)
+
+
+def _run(app, job_id: str, fn, args) -> None:
+    with app.app_context():
+        result, error = None, None
+        try:
+            result = fn(*args)
+        except Exception as e:
+            log.exception("job %s failed", job_id)
+            database.session.rollback()
+            error = f"{type(e).__name__}: {e}"
+        database.session.query(Job).filter(Job.id == job_id).update({
+            Job.state      : "failed" if error else "done",
+            Job.result     : result,
+            Job.error      : error,
+            Job.finished_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        database.session.commit()
+        database.session.remove()
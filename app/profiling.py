@@ -0,0 +1,158 @@
+"""
+Opt-in request profiler.
+
+A request is profiled when an admin adds ``?_profile=1`` (or the header
+``X-WDP-Profile: 1``), or when it is picked by the 1-in-``PROFILE_SAMPLE_RATE``
+sampler. The profile (pyinstrument if installed, cProfile otherwise) and the
+SQL statements it issued are kept in a bounded in-memory ring buffer of the
+worker that served it, browsable at ``/admin/profiles``.
+
+Only one request per process is profiled at a time: both profilers hook the
+interpreter globally, and starting a second one raises (Python 3.12+). A
+request that arrives while another is being profiled is served unprofiled.
+"""
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:          # optional dependency
+    _Pyinstrument = None
+
+SLOWEST_QUERIES = 5
+
+_profiles: deque = deque(maxlen=50)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_active = threading.Lock()   # held while a profiler is running
+_sample_rate = 0
+
+
+def _wants_profile() -> bool:
+    if request.endpoint in (None, "static", "metrics") or request.path.startswith("/admin/profiles"):
+        return False
+    if request.args.get("_profile") == "1" or request.headers.get("X-WDP-Profile") == "1":
+        from app.db.models import User
+        uid = session.get("user_id")
+        user = User.query.get(uid) if uid else None
+        return bool(user and user.is_admin)
+    return _sample_rate > 0 and random.randrange(_sample_rate) == 0
+
+
+def _start():
+    if not _active.acquire(blocking=False):
+        return
+    try:
+        if _Pyinstrument is not None:
+            profiler = _Pyinstrument()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except (RuntimeError, ValueError):
+        # another profiler (not ours) is already hooked in: skip this request
+        _active.release()
+        return
+    g.wdp_queries = []
+    g.wdp_profiler = profiler
+    g.wdp_profile_start = time.perf_counter()
+
+
+def _halt(profiler) -> None:
+    try:
+        if _Pyinstrument is not None:
+            profiler.stop()
+        else:
+            profiler.disable()
+    finally:
+        _active.release()
+
+
+def _stop(response):
+    profiler = g.pop("wdp_profiler")
+    duration = time.perf_counter() - g.pop("wdp_profile_start")
+    queries  = g.pop("wdp_queries")
+
+    _halt(profiler)
+    if _Pyinstrument is not None:
+        report, fmt = profiler.output_html(), "html"
+    else:
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(40)
+        report, fmt = buf.getvalue(), "text"
+
+    entry = {
+        "id"           : next(_ids),
+        "time"         : datetime.utcnow(),
+        "method"       : request.method,
+        "path"         : request.full_path.rstrip("?"),
+        "status"       : response.status_code,
+        "duration_ms"  : duration * 1000,
+        "query_count"  : len(queries),
+        "query_ms"     : sum(q[1] for q in queries) * 1000,
+        "slowest"      : sorted(queries, key=lambda q: q[1], reverse=True)[:SLOWEST_QUERIES],
+        "report"       : report,
+        "format"       : fmt,
+    }
+    with _lock:
+        _profiles.appendleft(entry)
+
+
+# SQL statements are recorded only while a profiled request is running
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "wdp_queries" in g:
+        conn.info.setdefault("wdp_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "wdp_queries" in g and conn.info.get("wdp_query_start"):
+        elapsed = time.perf_counter() - conn.info["wdp_query_start"].pop()
+        g.wdp_queries.append((statement, elapsed))
+
+
+def list_profiles() -> list:
+    with _lock:
+        return list(_profiles)
+
+
+def get_profile(profile_id: int):
+    with _lock:
+        return next((p for p in _profiles if p["id"] == profile_id), None)
+
+
+def init_app(app) -> None:
+    global _profiles, _sample_rate
+    _profiles = deque(maxlen=app.config.get("PROFILE_BUFFER_SIZE", 50))
+    _sample_rate = app.config.get("PROFILE_SAMPLE_RATE", 0)
+
+    @app.before_request
+    def _maybe_start_profile():
+        if _wants_profile():
+            _start()
+
+    @app.after_request
+    def _maybe_stop_profile(response):
+        if "wdp_profiler" in g:
+            _stop(response)
+        return response
+
+    @app.teardown_request
+    def _discard_profile(exc):
+        # the request failed before after_request: don't leave the profiler on
+        profiler = g.pop("wdp_profiler", None)
+        if profiler is not None:
+            g.pop("wdp_queries", None)
+            _halt(profiler)
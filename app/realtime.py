@@ -0,0 +1,82 @@
+"""
+Socket.IO fan-out between processes.
+
+Each gunicorn worker (or server) only knows the dashboards connected to it.
+With ``SOCKETIO_MESSAGE_QUEUE`` set, an ``emit`` goes through a message queue
+that every process listens to, so all the dashboards get every update:
+
+* ``redis://host:6379/0`` (or any kombu URL: ``amqp://``...) – the queue
+  managers shipped with python-socketio;
+* ``postgresql://...`` – ``PostgresManager`` below, LISTEN / NOTIFY on the
+  database the app already uses (no extra service).
+
+Unset, events stay in the process (single worker / dev server).
+"""
+import json
+import select
+import time
+
+import socketio
+
+NOTIFY_MAX_BYTES = 7900          # PostgreSQL limits a NOTIFY payload to 8000 bytes
+
+
+class PostgresManager(socketio.PubSubManager):
+    """python-socketio client manager over PostgreSQL LISTEN / NOTIFY."""
+
+    name = "postgresql"
+
+    def __init__(self, url: str, channel: str = "flask-socketio", write_only: bool = False,
+                 logger=None):
+        self.url = url
+        self._pub_conn = None
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.url)
+        conn.autocommit = True
+        return conn
+
+    def _publish(self, data):
+        payload = json.dumps(data, default=str)
+        if len(payload.encode()) > NOTIFY_MAX_BYTES:
+            raise ValueError(f"socket.io message too large for NOTIFY ({len(payload)} bytes)")
+        import psycopg2
+        for attempt in (1, 2):
+            try:
+                if self._pub_conn is None or self._pub_conn.closed:
+                    self._pub_conn = self._connect()
+                with self._pub_conn.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                return
+            except psycopg2.OperationalError:
+                self._pub_conn = None         # connection lost: retry once on a new one
+                if attempt == 2:
+                    raise
+
+    def _listen(self):
+        import psycopg2
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                while True:
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        yield conn.notifies.pop(0).payload
+            except psycopg2.OperationalError:
+                self._get_logger().warning("socket.io queue: connection lost, reconnecting")
+                time.sleep(1)
+
+
+def socketio_options(queue_url: str, write_only: bool = False) -> dict:
+    """Keyword arguments of ``socketio.init_app`` for ``SOCKETIO_MESSAGE_QUEUE``."""
+    if not queue_url:
+        return {}
+    if queue_url.startswith(("postgres://", "postgresql://")):
+        return {"client_manager": PostgresManager(queue_url, write_only=write_only)}
+    return {"message_queue": queue_url}
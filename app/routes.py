@@ -2,26 +2,35 @@ import time
 import uuid
 import os
 import json
+import logging
 import pathlib
 import threading
 import base64
-import cv2
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, flash, session, abort, jsonify
-from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+from contextlib import ExitStack
+import io
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, flash, session, abort, jsonify, Response, stream_with_context
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
-from app.classification.rules import classify_image_by_rules
-from app.classification.rules_store import get_rules, save_rules
+from app.classification.dedup import dhash, find_duplicate, hamming, is_batch_duplicate, parse_hex
+from app.classification.registry import get_model
+from app.classification.rules_store import EDITABLE, get_compiled_rules, get_rules
+from app.classification.versioning import (
+    current_version, label_stats_by_version, publish_rules, reclassify_stale, sync_rules_once,
+)
+from app.cache import bump_data_version, cached, data_version, make_etag, not_modified, set_validators
+from app.db import timeseries
+from app.db.engines import read_session
 from app.db.models import Image, User, Location
+from app import jobs
+from app.executors import blocking, classify, offload, offload_map
 from app.extensions import database, csrf, socketio
-from datetime import datetime, timedelta
-from PIL import Image as PILImage
-from PIL.ExifTags import TAGS, GPSTAGS
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
-from geopy.geocoders import Nominatim
-from ultralytics import YOLO
+from app.instrumentation import inc, log_event, observe, timed
+from app.profiling import get_profile, list_profiles
+from app.security import KDFBusy, hash_password, needs_rehash, verify_password
+from app.storage import get_storage
+from datetime import datetime, timedelta, timezone
+from functools import partial, wraps
 from typing import Dict, Any
 
 RULES_PATH   = pathlib.Path(__file__).with_name("rules.json")
@@ -57,10 +66,57 @@ def _reload_rules_if_needed() -> Dict[str, Any]:
             _rules_mtime  = mtime
         return _rules_cache
 
+def classify_upload(filepath: str, source: str):
+    """``classify_image_by_rules`` (offloaded to the process pool if enabled)
+    with its stages recorded in the metrics."""
+    with timed("classification"):
+        label, features, timings = offload(classify, filepath, current_app.config["FEATURE_MAX_SIDE"])
+    observe("wdp_stage_seconds", timings.get("decode", 0.0), {"stage": "decode"})
+    observe("wdp_stage_seconds",
+            sum(v for k, v in timings.items() if k != "decode"),
+            {"stage": "feature_extraction"})
+    inc("wdp_classifications_total", {"source": source, "label": label})
+    log_event("classified", source=source, path=filepath, label=label, features=features)
+    return label, features
+
+def is_duplicate(filepath: str, timestamp, lat=None, lon=None, seen: list = None,
+                 phash: int = None) -> bool:
+    """True if the image is a near-duplicate of a stored image of the same
+    place / time window (or of an earlier image of the batch in ``seen``).
+    Cheap: runs before the feature extraction. ``phash`` saves hashing the
+    file again when it is already known."""
+    cfg = current_app.config
+    if not cfg["DEDUP_ENABLED"]:
+        return False
+    if phash is None:
+        phash = dhash(filepath)
+    duplicate = (seen is not None and is_batch_duplicate(phash, seen, cfg["DEDUP_MAX_DISTANCE"])) or \
+        find_duplicate(phash, timestamp, lat, lon,
+                       cfg["DEDUP_WINDOW_HOURS"], cfg["DEDUP_MAX_DISTANCE"], cfg["DEDUP_RADIUS_M"]) is not None
+    if duplicate:
+        inc("wdp_duplicates_total")
+        log_event("duplicate_upload", path=filepath, phash=phash)
+    return duplicate
+
+def check_client_phash(value: str, phash: int) -> None:
+    """Compare the dHash computed by the capture page with the server's.
+
+    Only the server's hash is used for the deduplication (a client can send
+    anything); a mismatch is counted, as it means the browser's resize
+    drifted from ``dhash``."""
+    if not value or phash is None:
+        return
+    client = parse_hex(value)
+    if client is None or hamming(phash, [client])[0] > current_app.config["DEDUP_MAX_DISTANCE"]:
+        inc("wdp_client_phash_mismatch_total")
+        log_event("client_phash_mismatch", logging.WARNING, client=value, server=phash)
+
 def str_to_bool(val: str) -> bool:
     return (val or "").lower() == "true"
 
 def extract_exif_location(image_path):
+    from PIL import Image as PILImage
+    from PIL.ExifTags import TAGS, GPSTAGS
     img = PILImage.open(image_path)
     exif_data = img._getexif()
     if not exif_data:
@@ -87,6 +143,8 @@ def extract_exif_location(image_path):
     return None
 
 def extract_exif_timestamp(image_path):
+        from PIL import Image as PILImage
+        from PIL.ExifTags import TAGS
         img = PILImage.open(image_path)
         exif = img._getexif()
         if not exif:
@@ -99,7 +157,7 @@ def extract_exif_timestamp(image_path):
 
         return None
 
-def add_image_to_db(filename, address, timestamp_str, label, label_manual, timestamp_manual, address_manual, features, address_is_location = False):
+def add_image_to_db(key, address, timestamp_str, label, label_manual, timestamp_manual, address_manual, features, address_is_location = False, phash = None):
     timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M")
 
     if address_is_location:
@@ -114,13 +172,16 @@ def add_image_to_db(filename, address, timestamp_str, label, label_manual, times
 
         # Else geocode it
         if not location and address:
+            from geopy.exc import GeocoderServiceError
+            from geopy.geocoders import Nominatim
             geolocator = Nominatim(user_agent="wdp/1.0", timeout=5)
             try:
                 # Nominatim courtesy delay: 1 req/sec max from one client
                 time.sleep(1.1)
-                loc = geolocator.geocode(address, exactly_one=True)
-            except GeocoderServiceError:
-                print("GeocoderServiceError")
+                with timed("geocoding"):
+                    loc = geolocator.geocode(address, exactly_one=True)
+            except GeocoderServiceError as e:
+                log_event("geocode_failed", logging.WARNING, address=address, error=str(e))
                 loc = None
 
             lat = float(loc.latitude) if loc else None
@@ -145,17 +206,21 @@ def add_image_to_db(filename, address, timestamp_str, label, label_manual, times
         "color_clusters", "aspect_dev", "fill_ratio"
     ]
     
-    for key in required_keys:
-        if key in features_dict:
-            features_dict[key] = float(features_dict[key])
+    for name in required_keys:
+        if name in features_dict:
+            features_dict[name] = float(features_dict[name])
         else:
-            features_dict[key] = 0.0  # Default value for missing keys
+            features_dict[name] = 0.0  # Default value for missing keys
 
     # Use features_dict for the Image creation
     features = features_dict
 
+    if phash is None:
+        with get_storage().local_path(key) as filepath:
+            phash = dhash(filepath)
+
     img = Image(
-        path=os.path.join(current_app.config["UPLOAD_FOLDER"], filename),
+        path=key,
         label=label,
         timestamp=timestamp,
         location=location,
@@ -163,6 +228,8 @@ def add_image_to_db(filename, address, timestamp_str, label, label_manual, times
         label_manual=label_manual,
         timestamp_manual=timestamp_manual,
         location_manual=address_manual,
+        rules_version=current_version(),
+        phash=phash,
 
         dark_ratio=features["dark_ratio"],
         edge_density=features["edge_density"],
@@ -177,7 +244,10 @@ def add_image_to_db(filename, address, timestamp_str, label, label_manual, times
         fill_ratio=features["fill_ratio"],
     )
     database.session.add(img)
-    database.session.commit()
+    bump_data_version()
+    with timed("db_commit"):
+        database.session.commit()
+    inc("wdp_images_saved_total", {"label": label})
 
     # Get updated stats and location data for real-time updates
     from sqlalchemy import func
@@ -205,12 +275,13 @@ def add_image_to_db(filename, address, timestamp_str, label, label_manual, times
             "address": img.location.address
         }
     
-    socketio.emit('update', {
-        'filename': filename, 
-        'label': label,
-        'stats': stats,
-        'location': location_data
-    })
+    with timed("socketio_emit"):
+        socketio.emit('update', {
+            'filename': key,
+            'label': label,
+            'stats': stats,
+            'location': location_data
+        })
 
 # --------- Décorateur pour accès admin ---------
 def admin_required(f):
@@ -263,6 +334,8 @@ def login_required(f):
     return decorated_function
 
 main = Blueprint('main', __name__)
+main.before_app_request(sync_rules_once)     # rules.json vs. the database's version
+
 @main.app_context_processor
 def inject_current_user():
     uid = session.get("user_id")
@@ -288,7 +361,6 @@ def index():
 @main.route("/upload", methods=["GET", "POST"])
 @login_required
 def upload():
-    print("post upload")
     user = User.query.get(session["user_id"])  # we know it exists
 
     # ------------------------ GET ------------------------ #
@@ -309,34 +381,48 @@ def upload():
         # We're uploading multiple images
         files = request.files.getlist('images')
         filenames = []
+        names = []
         labels = []
         timestamps = []
         locations = []
         feats = []
+        seen, skipped = [], []
+        storage = get_storage()
         for file in files:
             filename = secure_filename(file.filename)
-            filenames.append(filename)
-            filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            file.save(filepath)
-
-            # Feature extraction
-            label_auto, features = classify_image_by_rules(filepath)
+            key = blocking(storage.save, file.stream, filename)
+
+            with storage.local_path(key) as filepath:
+                exif_timestamp = extract_exif_timestamp(filepath)
+                timestamp = exif_timestamp or datetime.utcnow()
+                location = extract_exif_location(filepath) or ""
+                lat, lon = lat_lon_from_string(location) if location else (None, None)
+
+                # Near-duplicates are dropped before the feature extraction
+                if is_duplicate(filepath, timestamp, lat, lon, seen):
+                    # its file is left to `flask purge --gc-files`: an upload
+                    # still waiting for confirmation may share it
+                    skipped.append(filename)
+                    continue
+
+                # Feature extraction
+                label_auto, features = classify_upload(filepath, "upload_multiple")
+            filenames.append(key)
+            names.append(filename)
             labels.append(label_auto)
-            import json as json_module
-            feats.append(json_module.dumps(features))
-            print(f"DEBUG UPLOAD_MULTIPLE: Image {filename} features: {features}")
-            print(f"DEBUG UPLOAD_MULTIPLE: Features type: {type(features)}")
-            print(f"DEBUG UPLOAD_MULTIPLE: JSON string: {json_module.dumps(features)}")
-            
-            exif_timestamp = extract_exif_timestamp(filepath)
-            timestamp = exif_timestamp or datetime.utcnow()
+            feats.append(json.dumps(features))
             timestamps.append(timestamp.strftime("%Y-%m-%dT%H:%M"))
-            location = extract_exif_location(filepath) or ""
             locations.append(location)
 
+        if skipped:
+            flash(f"{len(skipped)} doublon(s) ignoré(s) : {', '.join(skipped)}", "warning")
+        if not filenames:
+            return redirect(url_for("main.upload"))
+
         # We render the confirm step for multiple images
         return render_template("confirm_upload_multiple.html",
             filenames=filenames,
+            names=names,
             auto_labels=labels,
             auto_timestamps=timestamps,
             auto_locations=locations,
@@ -349,47 +435,33 @@ def upload():
             flash("Aucun fichier", "danger")
             return redirect(request.url)
 
-        filename = secure_filename(video_file.filename)
-        filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-        video_file.save(filepath)
+        key = blocking(get_storage().save, video_file.stream, secure_filename(video_file.filename))
 
         # On montre maintenant le lecteur vidéo
         return render_template(
             "select_timestamps.html",
-            video_filename=filename
+            video_filename=key
         )
 
     # We're uploading one image
     file = request.files["image"]
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    file.save(filepath)
-
-    # Feature extraction
-    label_auto, features = classify_image_by_rules(filepath)
-    print(f"DEBUG UPLOAD: classify_image_by_rules returned:")
-    print(f"  label_auto = {label_auto} (type: {type(label_auto)})")
-    print(f"  features = {features} (type: {type(features)})")
-    print(f"  features keys: {list(features.keys()) if isinstance(features, dict) else 'NOT A DICT'}")
-    
-    # Test JSON serialization
-    try:
-        import json
-        json_str = json.dumps(features)
-        print(f"  JSON serialization test: SUCCESS")
-        print(f"  JSON string length: {len(json_str)}")
-        print(f"  JSON string preview: {json_str[:100]}...")
-    except Exception as e:
-        print(f"  JSON serialization test: FAILED - {e}")
-    
-    exif_timestamp = extract_exif_timestamp(filepath)
-    timestamp = exif_timestamp or datetime.utcnow()
-    location = extract_exif_location(filepath) or ""
+    storage = get_storage()
+    key = blocking(storage.save, file.stream, secure_filename(file.filename))
+
+    with storage.local_path(key) as filepath:
+        exif_timestamp = extract_exif_timestamp(filepath)
+        timestamp = exif_timestamp or datetime.utcnow()
+        location = extract_exif_location(filepath) or ""
+        lat, lon = lat_lon_from_string(location) if location else (None, None)
+        if is_duplicate(filepath, timestamp, lat, lon):
+            flash("Cette image ressemble fortement à une image déjà enregistrée.", "warning")
+
+        # Feature extraction
+        label_auto, features = classify_upload(filepath, "upload")
 
     # Render confirm step for one image
-    print(f"DEBUG UPLOAD: About to render template with features = {features}")
     return render_template("confirm_upload.html",
-        filename=filename,
+        filename=key,
         auto_label=label_auto,
         auto_timestamp=timestamp.strftime("%Y-%m-%dT%H:%M"),
         auto_location=location,
@@ -399,8 +471,11 @@ def upload():
 @main.route("/confirm", methods=["POST"])
 @admin_required
 def confirm_upload():
-    print("post confirm upload")
     filename = request.form.get("filename")
+    try:
+        get_storage().check_key(filename)
+    except ValueError:
+        abort(400)
     label = request.form.get("label")
     timestamp_str = request.form.get("timestamp")
     address = request.form.get("location", "").strip()
@@ -410,28 +485,16 @@ def confirm_upload():
     
     # Handle features with proper error checking
     features_str = request.form.get("features")
-    print(f"DEBUG CONFIRM: Received from form:")
-    print(f"  features_str = {repr(features_str)}")
-    print(f"  features_str type = {type(features_str)}")
-    print(f"  features_str length = {len(features_str) if features_str else 0}")
-    
     if not features_str:
-        print("DEBUG CONFIRM: features_str is empty/None")
+        log_event("confirm_missing_features", logging.WARNING, filename=filename)
         flash("Erreur: données de caractéristiques manquantes.", "danger")
         return redirect(url_for("main.upload"))
     
-    print(f"DEBUG CONFIRM: Raw features string: {features_str[:200]}...")
-    
     try:
         features = json.loads(features_str)
-        print(f"DEBUG CONFIRM: Successfully parsed features:")
-        print(f"  features = {features}")
-        print(f"  features type = {type(features)}")
-        print(f"  features keys = {list(features.keys()) if isinstance(features, dict) else 'NOT A DICT'}")
     except json.JSONDecodeError as e:
-        print(f"DEBUG CONFIRM: JSON decode error: {e}")
-        print(f"DEBUG CONFIRM: Error at position: {e.pos if hasattr(e, 'pos') else 'unknown'}")
-        print(f"DEBUG CONFIRM: Raw string causing error: {repr(features_str)}")
+        log_event("confirm_bad_features", logging.WARNING,
+                  filename=filename, error=str(e), raw=features_str[:200])
         flash("Erreur: format des caractéristiques invalide.", "danger")
         return redirect(url_for("main.upload"))
 
@@ -445,6 +508,11 @@ def confirm_upload():
 @admin_required
 def confirm_upload_multiple():
     filenames = request.form.getlist("filenames")
+    try:
+        for filename in filenames:
+            get_storage().check_key(filename)
+    except ValueError:
+        abort(400)
 
     for idx, filename in enumerate(filenames):
         label          = request.form.get(f"label_{idx}")
@@ -460,8 +528,8 @@ def confirm_upload_multiple():
         try:
             features = json.loads(features_str)
         except json.JSONDecodeError as e:
-            print(f"DEBUG CONFIRM_MULTIPLE: JSON decode error for image {idx+1}: {e}")
-            print(f"DEBUG CONFIRM_MULTIPLE: Raw features_str: {repr(features_str)}")
+            log_event("confirm_bad_features", logging.WARNING,
+                      filename=filename, error=str(e), raw=features_str[:200])
             flash(f"Erreur: format des caractéristiques invalide pour l'image {idx+1}.", "danger")
             return redirect(url_for("main.upload"))
 
@@ -478,7 +546,10 @@ def confirm_upload_multiple():
 @main.route("/user_upload")
 @login_required          # or @admin_required if only admins can use it
 def user_upload():
-    return render_template("capture_upload.html")
+    cfg = current_app.config
+    return render_template("capture_upload.html",
+                           max_side=cfg["CAPTURE_MAX_SIDE"],
+                           jpeg_quality=cfg["CAPTURE_JPEG_QUALITY"])
 
 def lat_lon_from_string(latlon_str):
     lat, lon = latlon_str.split(",")
@@ -490,21 +561,28 @@ def lat_lon_from_string(latlon_str):
 @main.route("/quick_upload", methods=["POST"])
 @login_required
 def quick_upload():
-    print("quick upload")
     file = request.files.get("image")
-    print("got image")
     if not file:
         flash("Erreur : aucune image reçue.", "danger")
         return redirect(url_for("main.upload"))
 
-    filename  = secure_filename(file.filename)
-    filepath  = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    file.save(filepath)
-    print("saved image")
-
-    # Auto-label from rules
-    label_auto, features = classify_image_by_rules(filepath)
-    print("got label")
+    # The capture page resizes / re-encodes the photo before sending it, so
+    # the upload is small enough to hash in memory: duplicates are rejected
+    # without writing them to the storage. Anything bigger (another client,
+    # an old copy of the page) is streamed to the storage as before.
+    storage = get_storage()
+    limit   = current_app.config["CAPTURE_MAX_BYTES"]
+    data    = file.stream.read(limit + 1)
+    key     = None
+    if len(data) > limit:
+        file.stream.seek(0)
+        data = None
+        key  = blocking(storage.save, file.stream, secure_filename(file.filename))
+        with storage.local_path(key) as filepath:
+            phash = dhash(filepath)
+    else:
+        phash = dhash(data=data)
+    check_client_phash(request.form.get("phash"), phash)
 
     # Values provided by the client (timestamp already ISO-ish)
     timestamp_str = request.form.get("timestamp")
@@ -522,18 +600,38 @@ def quick_upload():
         flash("Format attendu : latitude,longitude", "danger")
         return redirect(url_for("main.upload"))
 
+    # --- 3. same bin, same place, shortly before: keep the first report ------
+    try:
+        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M")
+    except (TypeError, ValueError):
+        timestamp = datetime.utcnow()
+    if is_duplicate(None, timestamp, lat, lon, phash=phash):
+        # a file already stored is left to `flask purge --gc-files`
+        flash("Ce dépôt a déjà été signalé, merci !", "info")
+        return redirect(url_for("main.upload"))
+
+    if key is None:
+        key = blocking(storage.save, io.BytesIO(data), secure_filename(file.filename))
+    with storage.local_path(key) as filepath:
+        # Auto-label from rules
+        label_auto, features = classify_upload(filepath, "quick_upload")
+
+    from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+    from geopy.geocoders import Nominatim
     geolocator = Nominatim(user_agent="wdp/1.0", timeout=5)
     try:
         # supply a *tuple* so geopy never tries to re-parse a string
-        geo = geolocator.reverse((lat, lon), exactly_one=True)
+        with timed("geocoding"):
+            geo = geolocator.reverse((lat, lon), exactly_one=True)
         address = geo.address if geo else "Adresse inconnue"
     except (GeocoderTimedOut, GeocoderServiceError) as e:
-        current_app.logger.warning(f"reverse-geocode failed: {e}")
+        log_event("reverse_geocode_failed", logging.WARNING, lat=lat, lon=lon, error=str(e))
         address = "Adresse inconnue"
 
     location = Location(address = address, latitude = lat, longitude = lon)
 
-    add_image_to_db(filename, location, timestamp_str, label_auto, False, False, False, json.dumps(features), True)
+    add_image_to_db(key, location, timestamp.strftime("%Y-%m-%dT%H:%M"), label_auto,
+                    False, False, False, json.dumps(features), True, phash)
     flash("Image enregistrée !", 'success')
     return redirect(url_for("main.upload"))
 
@@ -541,44 +639,152 @@ def quick_upload():
 @main.route("/extract_from_video", methods=["POST"])
 @admin_required
 def extract_from_video():
+    import cv2
     video_name = request.args.get("video")
     ts_list = [float(t) for t in request.form.getlist("timestamps")]
 
-    video_path = os.path.join(current_app.config["UPLOAD_FOLDER"], video_name)
-    cap = cv2.VideoCapture(video_path)
-    saved_frames, labels, timestamps, locations, feats = [], [], [], [], []
-
-    for sec in ts_list:
-        cap.set(cv2.CAP_PROP_POS_MSEC, sec * 1000)
-        ok, frame = cap.read()
-        if not ok:
-            continue
-        img_name = f"frame_{uuid.uuid4().hex}.jpg"
-        img_path = os.path.join(current_app.config['UPLOAD_FOLDER'], img_name)
-        cv2.imwrite(img_path, frame)
-        saved_frames.append(img_name)
-
-        # Auto-détection pour chaque frame
-        label_auto, features = classify_image_by_rules(img_path)
-        labels.append(label_auto)
-        import json as json_module
-        feats.append(json_module.dumps(features))
-        ts_iso = datetime.utcnow().strftime("%Y-%m-%dT%H:%M")
-        timestamps.append(ts_iso)
-        locations.append("")   # ou ta fonction EXIF si besoin
-
-    cap.release()
+    storage = get_storage()
+    try:
+        storage.check_key(video_name)
+    except ValueError:
+        abort(400)
+    saved_frames, names, labels, timestamps, locations, feats = [], [], [], [], [], []
+    seen = []
+
+    with storage.local_path(video_name) as video_path:
+        cap = cv2.VideoCapture(video_path)
+        for sec in ts_list:
+            cap.set(cv2.CAP_PROP_POS_MSEC, sec * 1000)
+            ok, frame = cap.read()
+            if not ok:
+                continue
+            # frames picked close to each other are often the same picture
+            if is_batch_duplicate(dhash(img=frame), seen, current_app.config["DEDUP_MAX_DISTANCE"]):
+                continue
+            ok, jpeg = cv2.imencode(".jpg", frame)
+            if not ok:
+                continue
+            key = blocking(storage.save, io.BytesIO(jpeg.tobytes()), "frame.jpg")
+            saved_frames.append(key)
+            names.append(f"frame_{sec:.1f}s.jpg")
+
+            # Auto-détection pour chaque frame
+            with storage.local_path(key) as img_path:
+                label_auto, features = classify_upload(img_path, "video")
+            labels.append(label_auto)
+            feats.append(json.dumps(features))
+            ts_iso = datetime.utcnow().strftime("%Y-%m-%dT%H:%M")
+            timestamps.append(ts_iso)
+            locations.append("")   # ou ta fonction EXIF si besoin
+        cap.release()
 
     # On réutilise ton template multiple
     return render_template(
         "confirm_upload_multiple.html",
         filenames=saved_frames,
+        names=names,
         auto_labels=labels,
         auto_timestamps=timestamps,
         auto_locations=locations,
         feats=feats
     )
 
+@main.route("/auto_extract_from_video", methods=["POST"])
+@admin_required
+def auto_extract_from_video():
+    """Keyframes picked automatically (scene change + bin visible), classified
+    in batches, then the usual confirm step. Hours of footage take longer than
+    a request may: the sampling runs as a background job (``job_status``)."""
+    video_name = request.args.get("video")
+    try:
+        get_storage().check_key(video_name)
+    except ValueError:
+        abort(400)
+    job_id = jobs.start("video_keyframes", sample_video, video_name, user_id=session.get("user_id"))
+    return redirect(url_for("main.job_status", job_id=job_id))
+
+def sample_video(video_name: str) -> dict:
+    """The frames of ``video_name`` to confirm, as ``confirm_upload_multiple.html``
+    takes them, plus the sampler's ``report``."""
+    import cv2
+    from app.classification.keyframes import SamplerStats, batched, sample_keyframes
+    storage = get_storage()
+    cfg = current_app.config
+    stats = SamplerStats()
+    saved_frames, names, labels, timestamps, locations, feats = [], [], [], [], [], []
+    seen = []
+    ts_iso = datetime.utcnow().strftime("%Y-%m-%dT%H:%M")
+
+    with storage.local_path(video_name) as video_path:
+        frames = sample_keyframes(
+            video_path, stats,
+            sample_fps=cfg["KEYFRAME_SAMPLE_FPS"],
+            scene_threshold=cfg["KEYFRAME_SCENE_THRESHOLD"],
+            min_gap=cfg["KEYFRAME_MIN_GAP_S"],
+            max_keyframes=cfg["KEYFRAME_MAX"],
+        )
+        for batch in batched(frames, cfg["KEYFRAME_BATCH_SIZE"]):
+            keys = []
+            for frame in batch:
+                if is_batch_duplicate(dhash(img=frame.image), seen, cfg["DEDUP_MAX_DISTANCE"]):
+                    continue
+                ok, jpeg = cv2.imencode(".jpg", frame.image)
+                if not ok:
+                    continue
+                keys.append(blocking(storage.save, io.BytesIO(jpeg.tobytes()), "frame.jpg"))
+                names.append(time.strftime("%H:%M:%S", time.gmtime(frame.time)))
+
+            # one batch = one round-trip to the classification pool
+            with ExitStack() as stack:
+                paths = [stack.enter_context(storage.local_path(k)) for k in keys]
+                with timed("classification"):
+                    results = offload_map(partial(classify, max_side=cfg["FEATURE_MAX_SIDE"]), paths)
+            for key, (label_auto, features, _) in zip(keys, results):
+                inc("wdp_classifications_total", {"source": "video_auto", "label": label_auto})
+                saved_frames.append(key)
+                labels.append(label_auto)
+                feats.append(json.dumps(features))
+                timestamps.append(ts_iso)
+                locations.append("")
+
+    report = stats.report()
+    log_event("keyframes_sampled", logging.INFO, video=video_name, **report)
+    return {
+        "filenames"      : saved_frames,
+        "names"          : names,
+        "auto_labels"    : labels,
+        "auto_timestamps": timestamps,
+        "auto_locations" : locations,
+        "feats"          : feats,
+        "report"         : report,
+    }
+
+@main.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    """Waiting page of a background job, then its outcome."""
+    job = jobs.get(job_id)
+    if job is None or job.user_id != session.get("user_id"):
+        abort(404)
+    if job.state == "running":
+        return render_template("job_status.html", message="Extraction des images de la vidéo…"
+                               if job.kind == "video_keyframes" else "Veuillez patienter.")
+    if job.state == "failed":
+        flash("Le traitement a échoué, réessayez.", "danger")
+        return redirect(url_for("main.upload"))
+
+    if job.kind != "video_keyframes":
+        flash("Traitement terminé.", "success")
+        return redirect(url_for("main.index"))
+    result = dict(job.result)
+    report = result.pop("report")
+    if not result["filenames"]:
+        flash("Aucune poubelle détectée dans la vidéo.", "warning")
+        return redirect(url_for("main.upload"))
+    flash(f"{len(result['filenames'])} image(s) extraite(s) de {report['video_seconds']} s de vidéo "
+          f"({report['fps']} images/s, ×{report['realtime_x']} temps réel).", "info")
+    return render_template("confirm_upload_multiple.html", **result)
+
 @main.route("/delete_image/<int:image_id>", methods=["POST"])
 @login_required
 def delete_image(image_id):
@@ -589,14 +795,13 @@ def delete_image(image_id):
     if not (user.is_admin or img.user_id == user.id):
         return render_template("unauthorized.html"), 403
 
-    # --- delete file from disk
-    try:
-        os.remove(img.path)
-    except OSError:
-        pass  # file already gone / cannot delete -> ignore
+    # --- delete the file, unless another image shares it (same content)
+    if Image.query.filter(Image.path == img.path, Image.id != img.id).count() == 0:
+        get_storage().delete(img.path)
 
     # --- delete DB row ---
     database.session.delete(img)
+    bump_data_version()
     database.session.commit()
 
     flash("Image supprimée.",'success')
@@ -626,7 +831,7 @@ def edit_image(image_id):
         "confirm_upload.html",        # same template!
         edit_mode=True,               # flag
         image_id=img.id,
-        filename=img.path.split("/")[-1],  # for <img src>
+        filename=img.path,            # for <img src>
         auto_label=img.label or "full",
         auto_timestamp=img.timestamp.strftime("%Y-%m-%dT%H:%M"),
         auto_location=img.location.address if img.location else "",
@@ -664,9 +869,12 @@ def update_image():
         # reuse existing row if same addr already in DB
         loc = Location.query.filter_by(address=address).first()
         if not loc:
+            from geopy.exc import GeocoderServiceError
+            from geopy.geocoders import Nominatim
             geolocator = Nominatim(user_agent="wdp/1.0", timeout=5)
             try:
-                geo = geolocator.geocode(address, exactly_one=True)
+                with timed("geocoding"):
+                    geo = geolocator.geocode(address, exactly_one=True)
             except GeocoderServiceError:
                 geo = None
             lat = geo.latitude if geo else None
@@ -680,6 +888,7 @@ def update_image():
 
     # ---------- COMMIT ----------
     if changed:
+        bump_data_version()
         database.session.commit()
         flash("Image mise à jour.", 'success')
     else:
@@ -690,18 +899,50 @@ def update_image():
 
 @main.route("/dashboard")
 def dashboard():
+    filters = {k: request.args.get(k) for k in ("start_date", "end_date", "location_filter")}
+    version, last_modified = data_version()
+    uid, rules_version = session.get("user_id"), current_version()
+
+    # The page embeds the user's menu and a CSRF token (valid 1 h): the ETag
+    # covers the data version, the filters, the user and a 30 min window.
+    etag = make_etag(version, rules_version, sorted(filters.items()), uid, session.get("csrf_token"),
+                     int(time.time() // 1800))
+    if not_modified(etag, last_modified) and not session.get("_flashes"):
+        return set_validators(Response(status=304), etag, last_modified)
+
+    context = cached("dashboard", filters, lambda: dashboard_context(**filters))
+    viewer = User.query.get(uid) if uid else None
+    if not (viewer and viewer.is_admin):
+        context = {**context, "version_stats": None}
+
+    response = current_app.make_response(render_template(
+        "dashboard.html", **context, rules_version=rules_version,
+    ))
+    return set_validators(response, etag, last_modified)
+
+
+def escape_like(text: str) -> str:
+    """Make ``text`` match literally inside a LIKE / ILIKE pattern."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def dashboard_context(start_date=None, end_date=None, location_filter=None) -> dict:
+    """Everything the dashboard shows for these filters (cacheable)."""
+    # Read-only aggregates: served by the replica when one is configured
+    db = read_session()
+
     # -------------------------------------------------- #
     # Base query (eager-load Location to avoid N+1)
     # -------------------------------------------------- #
     query = (
-        Image.query
+        db.query(Image)
         .options(joinedload(Image.location))
         .filter(Image.location_id.isnot(None))  # only images with a location row
     )
 
     # ---------------- Date filter --------------------- #
-    start_date_str = request.args.get("start_date")
-    end_date_str = request.args.get("end_date")
+    start_date_str = start_date
+    end_date_str = end_date
     if start_date_str and end_date_str:
         try:
             start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
@@ -711,42 +952,31 @@ def dashboard():
             pass  # silently ignore bad date format
 
     # ---------------- Address filter ------------------ #
-    location_filter = request.args.get('location_filter')
     if location_filter:
         query = (
             query.join(Image.location)
-                 .filter(Location.address.ilike(f"%{location_filter}%"))
+                 .filter(Location.address.ilike(f"%{escape_like(location_filter)}%", escape="\\"))
         )
 
-    # --- Last 7 days stats for histogram ---
+    # --- Last 7 days stats for histogram (index-friendly range, see app/db/timeseries.py) ---
     today = datetime.utcnow().date()
-    seven_days_ago = today - timedelta(days=6)
-    
-    daily_counts_query = (
-        database.session.query(
-            func.date(Image.timestamp).label('date'),
-            func.count(Image.id).label('count')
-        )
-        .filter(func.date(Image.timestamp) >= seven_days_ago)
-        .group_by(func.date(Image.timestamp))
-        .order_by(func.date(Image.timestamp))
-    )
-    
+    days = [datetime.combine(today - timedelta(days=i), datetime.min.time()) for i in range(6, -1, -1)]
+    hist_start, hist_end = days[0], days[-1] + timedelta(days=1)
+
     # Apply filters to histogram query as well
     if start_date_str and end_date_str:
         try:
             start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
             end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-            daily_counts_query = daily_counts_query.filter(Image.timestamp.between(start_date, end_date))
+            hist_start = max(hist_start, start_date)
+            hist_end = min(hist_end, end_date + timedelta(microseconds=1))   # BETWEEN is inclusive
         except ValueError:
             pass
-    
-    daily_counts = daily_counts_query.all()
-    
-    counts_dict = {row.date.strftime('%Y-%m-%d'): row.count for row in daily_counts}
-    
-    histogram_labels = [(today - timedelta(days=i)).strftime('%a %d') for i in range(6, -1, -1)]
-    histogram_values = [counts_dict.get((today - timedelta(days=i)).strftime('%Y-%m-%d'), 0) for i in range(6, -1, -1)]
+
+    daily_counts = timeseries.counts(db, hist_start, hist_end, "day") if hist_start < hist_end else {}
+
+    histogram_labels = [d.strftime('%a %d') for d in days]
+    histogram_values = [sum(daily_counts.get(d, {}).values()) for d in days]
 
     # --- Radar Chart data ---
     feature_labels = [
@@ -798,16 +1028,6 @@ def dashboard():
         elif label == "empty":
             stats["empty"] = count
 
-    # ------------- Distinct addresses ----------------- #
-    all_locations = (
-        database.session.query(Location.address)
-        .join(Image)
-        .distinct()
-        .order_by(Location.address)
-        .all()
-    )
-    all_locations = [addr for (addr,) in all_locations]
-
     # ------------- Map markers ------------------------ #
     locations_coords = []
     for img in query.all():  # Execute query here
@@ -858,19 +1078,83 @@ def dashboard():
     hourly_labels = [f"{h:02d}:00" for h in range(24)]
     hourly_values = [counts_dict_hourly.get(f"{h:02d}", 0) for h in range(24)]
 
-    return render_template(
-        "dashboard.html",
+    # --- Automatic labels per rules version (shown to admins only) ---
+    version_stats = [tuple(row) for row in label_stats_by_version(db)]
+
+    return dict(
         stats=stats,
-        locations=all_locations,
         locations_coords=locations_coords,
         danger_zones=danger_zones,
         histogram_labels=histogram_labels,
         histogram_values=histogram_values,
         radar_data=radar_data,
         hourly_labels=hourly_labels,
-        hourly_values=hourly_values
+        hourly_values=hourly_values,
+        version_stats=version_stats,
     )
 
+@main.route("/api/timeseries")
+def api_timeseries():
+    """Image counts per hour / day / week over an arbitrary range.
+
+    ``start`` / ``end`` (ISO date or datetime, default: the last 30 days),
+    ``bucket`` (hour, day, week), ``label``, ``location`` (exact address) and
+    ``max_points`` (consecutive buckets are summed above it).
+    """
+    args   = request.args
+    bucket = args.get("bucket", "day")
+    if bucket not in timeseries.BUCKETS:
+        return jsonify(error=f"bucket must be one of {', '.join(timeseries.BUCKETS)}"), 400
+    try:
+        end   = datetime.fromisoformat(args["end"]) if args.get("end") else datetime.utcnow()
+        start = datetime.fromisoformat(args["start"]) if args.get("start") else end - timedelta(days=30)
+        # naive UTC like the column, and whole buckets: every request within
+        # one bucket gets the same cache key
+        start = timeseries.floor_bucket(timeseries.naive_utc(start), bucket)
+        end   = timeseries.ceil_bucket(timeseries.naive_utc(end), bucket)
+    except (ValueError, OverflowError):
+        return jsonify(error="start / end must be ISO dates"), 400
+    if end <= start:
+        return jsonify(error="end must be after start"), 400
+    if (end - start) / timeseries.BUCKETS[bucket] > timeseries.MAX_BUCKETS:
+        return jsonify(error=f"at most {timeseries.MAX_BUCKETS} {bucket} buckets, "
+                             f"use a larger bucket"), 400
+    params = {
+        "start"     : start,
+        "end"       : end,
+        "bucket"    : bucket,
+        "label"     : args.get("label") or None,
+        "address"   : args.get("location") or None,
+        "max_points": min(args.get("max_points", 500, type=int), 5000),
+    }
+
+    data = cached("timeseries", params, lambda: timeseries.series(read_session(), **params))
+    return jsonify(data)
+
+@main.route("/locations/autocomplete")
+def locations_autocomplete():
+    """Top-k addresses containing ``q``, with their number of images.
+    Served by the pg_trgm GIN index on location.address."""
+    q = (request.args.get("q") or "").strip()
+    k = min(request.args.get("k", 10, type=int), 50)
+    if len(q) < 2:
+        return jsonify([])
+
+    def search():
+        n = func.count(Image.id).label("n")
+        rows = (
+            read_session().query(Location.address, n)
+            .join(Image, Image.location_id == Location.id)
+            .filter(Location.address.ilike(f"%{escape_like(q)}%", escape="\\"))
+            .group_by(Location.address)
+            .order_by(func.similarity(Location.address, q).desc(), n.desc())
+            .limit(k)
+            .all()
+        )
+        return [{"address": address, "count": count} for address, count in rows]
+
+    return jsonify(cached("autocomplete", {"q": q.lower(), "k": k}, search))
+
 @main.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
@@ -878,9 +1162,6 @@ def register():
         email = request.form.get("email")
         password = request.form.get("password")
 
-        # Hash du mot de passe
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
-
         # Vérifie d'abord l'adresse mail, puis le nom d'utilisateur pour fournir un message précis
         existing_email = User.query.filter_by(mail=email).first()
         if existing_email:
@@ -894,6 +1175,13 @@ def register():
             flash(error_msg, 'danger')
             return render_template("register.html", error=error_msg, name=name, email=email)
 
+        # Hash du mot de passe (après les vérifications : le KDF est coûteux)
+        try:
+            hashed_password = hash_password(password)
+        except KDFBusy:
+            flash("Trop de demandes en cours, réessayez dans quelques secondes.", "warning")
+            return render_template("register.html", name=name, email=email), 503
+
         # Création de l'utilisateur
         user = User(name=name, mail=email, password=hashed_password, is_admin=False)
         database.session.add(user)
@@ -920,11 +1208,24 @@ def login():
             return render_template("login.html", error=error_msg, email=email)
 
         # Priorité 2 : vérifier le mot de passe si l'email est valide
-        if not check_password_hash(user.password, password):
+        try:
+            valid = verify_password(user.password, password)
+        except KDFBusy:
+            flash("Trop de connexions en cours, réessayez dans quelques secondes.", "warning")
+            return render_template("login.html", email=email), 503
+        if not valid:
             error_msg = "Mot de passe incorrect."
             flash(error_msg,  'danger')
             return render_template("login.html", error=error_msg, email=email)
 
+        # Hash d'un ancien coût / algorithme : mis à niveau au passage
+        if needs_rehash(user.password):
+            try:
+                user.password = hash_password(password)
+                database.session.commit()
+            except KDFBusy:
+                pass            # la prochaine connexion s'en chargera
+
         # Succès
         session["user_id"] = user.id
         flash("Connexion réussie !", "success")
@@ -944,6 +1245,36 @@ def admin_dashboard():
     users = User.query.order_by(User.id).all()
     return render_template("admin_dashboard.html", users=users)
 
+@main.route("/admin/export/features")
+@admin_required
+def export_features():
+    """Download every image's features, streamed chunk by chunk."""
+    from app.db.export import pa, stream_export
+    if pa is not None:
+        name, mimetype = "features.arrow", "application/vnd.apache.arrow.stream"
+    else:
+        name, mimetype = "features.csv", "text/csv"
+    return Response(
+        stream_with_context(stream_export()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={name}"},
+    )
+
+@main.route("/admin/profiles")
+@admin_required
+def admin_profiles():
+    return render_template("admin_profiles.html", profiles=list_profiles(), profile=None)
+
+@main.route("/admin/profiles/<int:profile_id>")
+@admin_required
+def admin_profile(profile_id):
+    profile = get_profile(profile_id)
+    if profile is None:
+        abort(404)
+    if profile["format"] == "html":
+        return profile["report"]          # pyinstrument's self-contained page
+    return render_template("admin_profiles.html", profiles=None, profile=profile)
+
 @main.route("/admin/users/<int:user_id>/toggle-admin", methods=["POST"])
 @superadmin_required
 def toggle_admin(user_id):
@@ -963,47 +1294,52 @@ def delete_user(user_id):
     if user.is_superadmin:
         flash("Impossible de supprimer le super-admin.", "danger")
     else:
-        database.session.delete(user)
-        database.session.commit()
-        flash("Compte supprimé.", "success")
+        # images in batches, then the account: minutes for a big account
+        from app.db.purge import delete_user as purge_user
+        jobs.start("delete_user", purge_user, user.id, user_id=session.get("user_id"))
+        flash("Suppression du compte en cours : ses images disparaissent progressivement.", "info")
     return redirect(url_for("main.admin_dashboard"))
 
 @main.route("/rules", methods=["GET"])
 @admin_required
 def rules_get():
-    return jsonify(get_rules()), 200
+    snapshot = get_compiled_rules()
+    etag = make_etag("rules", snapshot.values["version"], snapshot.mtime)
+    last_modified = datetime.fromtimestamp(snapshot.mtime, timezone.utc)
+    if not not_modified(etag, last_modified):
+        response = jsonify(dict(snapshot.values))
+    else:
+        response = Response(status=304)
+    return set_validators(response, etag, last_modified)
 
 @main.route("/rules/edit", methods=["GET", "POST"])
 @admin_required
 def rules_edit():
     if request.method == "POST":
         incoming = request.form.to_dict()
-        schema = {
-          "DARK_RATIO_TH": float,
-          "EDGE_DENSITY_TH": float,
-          "CONTOUR_COUNT_TH": int,
-          "COLOR_DIVERSITY_TH": int,
-          "SAT_MEAN_TH": float,
-          "BRIGHT_RATIO_TH": float,
-          "STD_INTENSITY_TH": float,
-          "ENTROPY_TH": float,
-          "COLOR_CLUSTERS_TH": int,
-          "ASPECT_DEV_TH": float,
-          "FILL_RATIO_TH": float,
-          "FULL_SCORE_THRESH": int
-        }
 
-        try:
-            cleaned = {k: schema[k](incoming[k]) for k in schema}
-        except Exception as e:
-            flash(f"Champ invalide : {e}", "warning")
-            return redirect(request.url)
-
-        save_rules(cleaned)
-        flash("Règles mises à jour !", "success")
+        cleaned = {}
+        for k, cast in EDITABLE.items():
+            try:
+                # the same keys as rules.json / classify_image_by_rules
+                value = float(incoming[k])
+            except (KeyError, ValueError):
+                flash(f"Champ invalide : {k}", "warning")
+                return redirect(request.url)
+            if cast is int and not value.is_integer():
+                flash(f"Champ invalide : {k} doit être un entier", "warning")
+                return redirect(request.url)
+            cleaned[k] = cast(value)
+
+        uid     = session.get("user_id")
+        version = publish_rules(cleaned, uid)
+        # rescoring every automatic label takes minutes at city scale
+        jobs.start("reclassify", reclassify_stale, user_id=uid)
+        flash(f"Règles mises à jour (version {version.id}) : les images sont reclassées "
+              f"en arrière-plan.", "success")
         return redirect(url_for("main.rules_edit"))
 
-    return render_template("rules_editor.html", rules=get_rules())
+    return render_template("rules_editor.html", rules=get_rules(), editable=EDITABLE)
 
 # --- POST séparé pour tester une image ------------------------------------
 @main.route("/rules/test", methods=["POST"])
@@ -1019,7 +1355,7 @@ def rules_test():
     os.makedirs(os.path.dirname(tmp), exist_ok=True)
     f.save(tmp)
 
-    result, _ = classify_image_by_rules(tmp)   # ⇒ 'full' ou 'empty'
+    result, _, _ = offload(classify, tmp, current_app.config["FEATURE_MAX_SIDE"])   # ⇒ 'full' ou 'empty'
     os.remove(tmp)
 
     flash(f"Résultat : {result}", "success")
@@ -1038,19 +1374,18 @@ def classifier():
             flash('No selected file')
             return redirect(request.url)
         if file:
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            storage = get_storage()
+            key = blocking(storage.save, file.stream, secure_filename(file.filename))
 
             # Get selected model
             selected_model = request.form.get('selected_model', 'yolo')
 
             if selected_model == 'yolo':
                 # YOLO model prediction
-                model_path = os.path.join(current_app.root_path, 'classification', 'models', 'yolo.pt')
-                model = YOLO(model_path)
+                model = get_model('yolo')   # loaded once per process
 
-                results = model.predict(filepath, conf=0.25, verbose=False)
+                with storage.local_path(key) as filepath:
+                    results = model.predict(filepath, conf=0.25, verbose=False)
                 result = results[0]
                 pred_class = result.probs.top1
                 confidence = result.probs.top1conf.item()
@@ -1078,7 +1413,7 @@ def classifier():
                 inference_time = random.uniform(5, 15)  # PKL models are typically faster
 
             # Prepare result for the template
-            with open(filepath, "rb") as img_file:
+            with storage.open(key) as img_file:
                 img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
 
             classification_result = {
@@ -0,0 +1,96 @@
+"""
+Password hashing off the request threads.
+
+The KDF is slow on purpose (PBKDF2 with 600 000 iterations: ~0.3 s of CPU).
+Run inline, a login burst (campaign launch) holds every worker on it and the
+uploads queue behind. Here:
+
+* the KDF runs in a pool of ``KDF_WORKERS`` OS threads per process (hashlib
+  releases the GIL during PBKDF2 / scrypt, so they really run in parallel);
+  under eventlet / gevent, in the hub's OS thread pool (``blocking``), so
+  the other green threads keep running;
+* at most ``KDF_WORKERS`` hashes run at once per process; the others wait
+  for a slot, and a request that can't get one within ``KDF_QUEUE_TIMEOUT``
+  seconds gets ``KDFBusy`` (503) instead of piling up;
+* the cost is ``PASSWORD_HASH_METHOD`` (``pbkdf2:sha256:<iterations>`` or
+  ``scrypt:<n>:<r>:<p>``), per deployment. Hashes stored with another method
+  are upgraded at the next successful login (``needs_rehash``).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.executors import blocking, green_threads
+
+_method       = "pbkdf2:sha256:600000"
+_salt_length  = 16
+_workers      = 2
+_timeout      = 5.0
+_pool         = None
+_slots        = threading.BoundedSemaphore(_workers)
+_pool_lock    = threading.Lock()
+_prefix       = None      # "method$" as written by werkzeug, for needs_rehash
+
+
+class KDFBusy(Exception):
+    """Too many password hashes in flight: try again later."""
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="kdf")
+    return _pool
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=_timeout):
+        raise KDFBusy()
+    try:
+        if green_threads():
+            return blocking(fn, *args)
+        return _executor().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    return _run(generate_password_hash, password, _method, _salt_length)
+
+
+def verify_password(stored: str, password: str) -> bool:
+    return _run(check_password_hash, stored, password)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True if ``stored`` was hashed with another method / cost or salt size."""
+    global _prefix
+    if _prefix is None:
+        # werkzeug fills in the default cost of a bare "pbkdf2:sha256"
+        _prefix = generate_password_hash("", _method, 1).split("$")[0]
+    method, _, rest = stored.partition("$")
+    salt = rest.partition("$")[0]
+    return method != _prefix or len(salt) < _salt_length
+
+
+def _after_fork() -> None:
+    # the threads of the pool don't survive fork(): start a new one lazily
+    global _pool, _pool_lock, _slots
+    _pool, _pool_lock = None, threading.Lock()
+    _slots = threading.BoundedSemaphore(_workers)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def init_app(app) -> None:
+    global _method, _salt_length, _workers, _timeout, _slots, _prefix
+    cfg = app.config
+    _method, _salt_length = cfg["PASSWORD_HASH_METHOD"], cfg["PASSWORD_SALT_LENGTH"]
+    _workers, _timeout    = cfg["KDF_WORKERS"], cfg["KDF_QUEUE_TIMEOUT"]
+    _slots  = threading.BoundedSemaphore(_workers)
+    _prefix = None
@@ -0,0 +1,307 @@
+"""
+Image / video storage.
+
+Files are stored under a key derived from their content,
+``ab/cd/<sha256><ext>``: two uploads never overwrite each other, identical
+uploads share one file, and no directory holds more than a few hundred
+entries. ``Image.path`` holds that key.
+
+Two backends implement the same interface:
+
+* ``LocalStorage`` – a directory (``UPLOAD_FOLDER``, served as static files);
+* ``S3Storage``    – any S3-compatible object store (AWS, MinIO...), needs boto3.
+
+Paths written before the storage layer (``app/static/uploads/<name>``) are
+still readable; ``flask migrate-storage`` moves them to sharded keys.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from flask import current_app, url_for
+
+CHUNK  = 1 << 20
+KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{1,4}$")
+
+
+def _ext(filename: str, default: str = ".jpg") -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if 1 < len(ext) <= 5 else default
+
+
+def _spool(stream, tmp_dir: str = None):
+    """Copy ``stream`` to a temp file chunk by chunk while hashing it.
+    Returns (temp path, sha256 hex)."""
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir, prefix=".upload-")
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            chunk = stream.read(CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return tmp, digest.hexdigest()
+
+
+def shard_key(sha256: str, ext: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+class Storage:
+    """Interface shared by the backends."""
+
+    def __init__(self, legacy_root: str):
+        self.legacy_root = os.path.normpath(legacy_root)
+
+    def is_legacy(self, key: str) -> bool:
+        """Paths stored before the storage layer: ``<UPLOAD_FOLDER>/<name>``."""
+        return os.path.normpath(os.path.dirname(key)) == self.legacy_root
+
+    @staticmethod
+    def check_key(key: str) -> str:
+        """Keys come back from forms: refuse anything but a sharded key."""
+        if not KEY_RE.match(key or ""):
+            raise ValueError(f"invalid storage key {key!r}")
+        return key
+
+    def save(self, stream, filename: str = None) -> str:
+        """Store the content of ``stream`` and return its key."""
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """Binary file object to stream the content."""
+        raise NotImplementedError
+
+    @contextmanager
+    def local_path(self, key: str):
+        """A path on the local disk (OpenCV / PIL need one)."""
+        raise NotImplementedError
+        yield
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def iter_keys(self):
+        """(key, mtime as a Unix timestamp) of every stored sharded file."""
+        raise NotImplementedError
+
+    def mtime(self, key: str):
+        """Last write of ``key`` as a Unix timestamp (saving identical content
+        again refreshes it), or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def _legacy_url(self, key: str) -> str:
+        return url_for("static", filename="uploads/" + os.path.basename(key))
+
+
+class LocalStorage(Storage):
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return key if self.is_legacy(key) else os.path.join(self.root, self.check_key(key))
+
+    def save(self, stream, filename: str = None) -> str:
+        tmp, sha = _spool(stream, self.root)
+        key  = shard_key(sha, _ext(filename))
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp, dest)               # same content -> same file
+        return key
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    @contextmanager
+    def local_path(self, key: str):
+        yield self._path(key)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass  # file already gone / cannot delete -> ignore
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def mtime(self, key: str):
+        try:
+            return os.stat(self._path(key)).st_mtime
+        except OSError:
+            return None
+
+    def iter_keys(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            for name in filenames:
+                key = f"{rel}/{name}"
+                if KEY_RE.match(key):
+                    try:
+                        yield key, os.stat(os.path.join(dirpath, name)).st_mtime
+                    except OSError:
+                        continue        # deleted meanwhile
+
+    def url(self, key: str) -> str:
+        if self.is_legacy(key):
+            return self._legacy_url(key)
+        return url_for("static", filename="uploads/" + key)
+
+
+class S3Storage(Storage):
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None,
+                 legacy_root: str = "", url_expiry: int = 3600):
+        import boto3                        # optional dependency
+        super().__init__(legacy_root)
+        self.bucket, self.prefix, self.url_expiry = bucket, prefix, url_expiry
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object(self, key: str) -> str:
+        return self.prefix + self.check_key(key)
+
+    def save(self, stream, filename: str = None) -> str:
+        tmp, sha = _spool(stream)
+        key = shard_key(sha, _ext(filename))
+        try:
+            self.client.upload_file(tmp, self.bucket, self._object(key))
+        finally:
+            os.remove(tmp)
+        return key
+
+    def open(self, key: str):
+        if self.is_legacy(key):
+            return open(key, "rb")
+        return self.client.get_object(Bucket=self.bucket, Key=self._object(key))["Body"]
+
+    @contextmanager
+    def local_path(self, key: str):
+        if self.is_legacy(key):
+            yield key
+            return
+        fd, tmp = tempfile.mkstemp(suffix=_ext(key))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                body = self.open(key)
+                shutil.copyfileobj(body, out, CHUNK)
+            yield tmp
+        finally:
+            os.remove(tmp)
+
+    def delete(self, key: str) -> None:
+        if self.is_legacy(key):
+            try:
+                os.remove(key)
+            except OSError:
+                pass
+            return
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def exists(self, key: str) -> bool:
+        if self.is_legacy(key):
+            return os.path.exists(key)
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+            return True
+        except ClientError:
+            return False
+
+    def mtime(self, key: str):
+        if self.is_legacy(key):
+            try:
+                return os.stat(key).st_mtime
+            except OSError:
+                return None
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError:
+            return None
+        return head["LastModified"].timestamp()
+
+    def iter_keys(self):
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self.prefix)
+        for page in pages:
+            for obj in page.get("Contents", []):
+                key = obj["Key"][len(self.prefix):]
+                if KEY_RE.match(key):
+                    yield key, obj["LastModified"].timestamp()
+
+    def url(self, key: str) -> str:
+        if self.is_legacy(key):
+            return self._legacy_url(key)
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object(key)},
+            ExpiresIn=self.url_expiry,
+        )
+
+
+def get_storage() -> Storage:
+    return current_app.extensions["storage"]
+
+
+def image_url(key: str) -> str:
+    """Jinja helper: URL of a stored image / video."""
+    return get_storage().url(key) if key else ""
+
+
+def init_app(app) -> None:
+    cfg = app.config
+    if cfg["STORAGE_BACKEND"] == "s3":
+        storage = S3Storage(cfg["S3_BUCKET"], cfg["S3_PREFIX"], cfg["S3_ENDPOINT_URL"],
+                            legacy_root=cfg["UPLOAD_FOLDER"])
+    else:
+        storage = LocalStorage(cfg["UPLOAD_FOLDER"])
+    app.extensions["storage"] = storage
+    app.jinja_env.globals["image_url"] = image_url
+
+
+def migrate_legacy(batch_size: int = 500, progress=None) -> int:
+    """Move every ``<UPLOAD_FOLDER>/<name>`` image to a sharded key and update
+    ``Image.path``. Returns the number of rows migrated."""
+    from app.db.models import Image
+    from app.extensions import database
+
+    storage = get_storage()
+    done, last_id, old_files = 0, 0, set()
+    while True:
+        images = (
+            Image.query.filter(Image.id > last_id)
+            .order_by(Image.id).limit(batch_size).all()
+        )
+        if not images:
+            break
+        for img in images:
+            last_id = img.id
+            if not img.path or not storage.is_legacy(img.path) or not os.path.exists(img.path):
+                continue
+            with open(img.path, "rb") as fh:
+                new_key = storage.save(fh, img.path)
+            old_files.add(img.path)
+            img.path = new_key
+            done += 1
+        database.session.commit()
+        if progress:
+            progress(done)
+
+    for path in old_files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return done
@@ -0,0 +1,33 @@
+"""
+Benchmark scripts. They are plain scripts (no Flask app needed unless stated)
+and append their results under ``benchmarks/results/`` so runs can be compared
+across commits.
+"""
+import json
+import pathlib
+import subprocess
+import time
+
+RESULTS_DIR = pathlib.Path(__file__).with_name("results")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def append_result(name: str, record: dict) -> pathlib.Path:
+    """Append ``record`` (tagged with the commit and time) to ``results/<name>.jsonl``."""
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{name}.jsonl"
+    with path.open("a") as fh:
+        fh.write(json.dumps({
+            "revision": git_revision(),
+            "time"    : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **record,
+        }) + "\n")
+    return path
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Features of a capture resized in the browser vs. the full-resolution upload.
+
+    python -m benchmarks.capture                          # defaults: no resize, q=0.95
+    python -m benchmarks.capture --max-side 1600 --quality 0.85
+
+The capture page (``capture_upload.html``) downscales the photo to
+``CAPTURE_MAX_SIDE`` (0: not at all) and encodes it as JPEG at
+``CAPTURE_JPEG_QUALITY`` before the upload. Run this before changing either:
+the contour count, edge density and colour diversity depend on the
+resolution, so resizing stays off until they are normalised and the rules
+re-tuned. For each reference image of ``benchmarks/rules.py`` (plus
+a 12 MP phone-sized one), this does the same with OpenCV (area resampling,
+like the browser's high-quality smoothing) and compares the features and
+the label with those of the original, as the server would compute them
+(``--server-max-side``: its ``FEATURE_MAX_SIDE``).
+
+A feature differs when ``|client - full| > tolerance * max(|full|, floor)``
+(the floor keeps near-zero ratios from failing on noise). Any different label
+or feature makes the script exit with status 1. Also reported: the upload
+size of both versions and the dHash distance between them. Results are
+appended to ``benchmarks/results/capture.jsonl``.
+"""
+import argparse
+import sys
+
+import cv2
+import numpy as np
+
+from app.classification.dedup import dhash, hamming
+from app.classification.rules import classify_image_by_rules
+from app.classification.scoring import FEATURE_KEYS
+from benchmarks import append_result
+from benchmarks.rules import RESOLUTIONS, make_reference_image
+
+SIZES = {**RESOLUTIONS, "12mp": (4000, 3000)}
+CAMERA_QUALITY = 95         # what the phone camera would have sent
+
+
+def client_version(img: np.ndarray, max_side: int, quality: float) -> bytes:
+    h, w  = img.shape[:2]
+    scale = max_side / max(w, h)
+    if 0 < scale < 1:
+        img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return encode(img, round(quality * 100))
+
+
+def encode(img: np.ndarray, quality: int) -> bytes:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    assert ok
+    return buf.tobytes()
+
+
+def classify(data: bytes, max_side: int):
+    # k-means uses random centres: fix the seed so both runs are comparable
+    cv2.setRNGSeed(0)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return classify_image_by_rules(None, img=img, max_side=max_side)
+
+
+def compare(full: dict, client: dict, tolerance: float, floor: float) -> dict:
+    """feature -> (full, client) of the features out of tolerance."""
+    out = {}
+    for k in FEATURE_KEYS:
+        a, b = float(full[k]), float(client[k])
+        if abs(b - a) > tolerance * max(abs(a), floor):
+            out[k] = (a, b)
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-side", type=int, default=0, help="CAPTURE_MAX_SIDE (0: no resize)")
+    parser.add_argument("--quality", type=float, default=0.95, help="CAPTURE_JPEG_QUALITY")
+    parser.add_argument("--server-max-side", type=int, default=0, help="FEATURE_MAX_SIDE")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="max relative difference of a feature")
+    parser.add_argument("--floor", type=float, default=0.05,
+                        help="smallest magnitude the tolerance is relative to")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    rows, failures = [], []
+    print(f"{'image':<12}{'full kB':>9}{'client kB':>11}{'dhash':>7}  label")
+    for i, (res, (w, h)) in enumerate(SIZES.items()):
+        for full in (False, True):
+            name = f"{res}_{'full' if full else 'empty'}"
+            img  = make_reference_image(w, h, full, seed=i)
+            original = encode(img, CAMERA_QUALITY)
+            resized  = client_version(img, args.max_side, args.quality)
+
+            label_full, feat_full     = classify(original, args.server_max_side)
+            label_client, feat_client = classify(resized, args.server_max_side)
+            distance = int(hamming(dhash(data=original), [dhash(data=resized)])[0])
+            diff = compare(feat_full, feat_client, args.tolerance, args.floor)
+
+            row = {
+                "image"    : name,
+                "full_kb"  : round(len(original) / 1024, 1),
+                "client_kb": round(len(resized) / 1024, 1),
+                "dhash"    : distance,
+                "label"    : [label_full, label_client],
+                "differs"  : diff,
+            }
+            rows.append(row)
+            same = label_full == label_client
+            print(f"{name:<12}{row['full_kb']:>9}{row['client_kb']:>11}{distance:>7}  "
+                  f"{label_full}{'' if same else ' -> ' + label_client}")
+            if not same:
+                failures.append(f"{name}: label {label_full} -> {label_client}")
+            for k, (a, b) in diff.items():
+                failures.append(f"{name}: {k} {a:.4g} -> {b:.4g}")
+
+    full_kb   = sum(r["full_kb"] for r in rows)
+    client_kb = sum(r["client_kb"] for r in rows)
+    print(f"\nupload bytes: {client_kb:,.0f} kB instead of {full_kb:,.0f} kB "
+          f"({100 * (1 - client_kb / full_kb):.0f}% less)")
+
+    if not args.no_save:
+        append_result("capture", {"max_side": args.max_side, "quality": args.quality,
+                                  "server_max_side": args.server_max_side,
+                                  "tolerance": args.tolerance, "results": rows})
+    if failures:
+        print(f"\n❌ Client-resized captures out of tolerance ({args.tolerance:.0%}):")
+        for f in failures:
+            print("   ", f)
+        return 1
+    print(f"\n✓ labels identical, features within {args.tolerance:.0%} of the full-resolution path")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Login throughput vs. upload latency during a login burst.
+
+    # terminal 1 – the server to measure
+    gunicorn -c gunicorn.conf.py
+
+    # terminal 2
+    python -m benchmarks.login --email user@example.com --password secret \\
+        --admin-email admin@example.com --admin-password secret --image photo.jpg
+
+Phase 1 (``--duration`` s): an admin uploads ``--image`` (``/upload``, the
+classification + confirm page, nothing is saved) once per ``--interval`` s,
+alone. Phase 2: the same while ``--concurrency`` clients log in as fast as
+they can. Reported: logins/s, login latency, 503s (KDF queue full, see
+``app/security.py``) and the upload latency of both phases – the login burst
+should cost the uploads little. Results are appended to
+``benchmarks/results/login.jsonl``.
+"""
+import argparse
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from benchmarks import append_result
+from benchmarks.preload import Client
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[int(q * (len(samples) - 1))] * 1000, 1)
+
+
+def upload(client: Client, image: bytes) -> float:
+    token    = client.csrf("/upload")
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="csrf_token"\r\n\r\n{token}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="b.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f"\r\n--{boundary}--\r\n".encode()
+    req = urllib.request.Request(client.base + "/upload", body, {
+        "Content-Type": f"multipart/form-data; boundary={boundary}"})
+    start = time.perf_counter()
+    client.opener.open(req, timeout=120).read()
+    return time.perf_counter() - start
+
+
+def probe(base, args, image, stop: threading.Event) -> list:
+    client = Client(base)
+    client.login(args.admin_email, args.admin_password)
+    latencies = []
+    while not stop.is_set():
+        latencies.append(upload(client, image))
+        stop.wait(args.interval)
+    return latencies
+
+
+def login_loop(base, args, stop: threading.Event, stats: dict, lock: threading.Lock):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            Client(base).login(args.email, args.password)
+            key = "ok"
+        except urllib.error.HTTPError as e:
+            key = "busy" if e.code == 503 else "errors"
+        except OSError:
+            key = "errors"
+        with lock:
+            stats[key] += 1
+            if key == "ok":
+                stats["latencies"].append(time.perf_counter() - start)
+
+
+def phase(base, args, image, logins: bool) -> dict:
+    stop, lock = threading.Event(), threading.Lock()
+    stats = {"ok": 0, "busy": 0, "errors": 0, "latencies": []}
+    result = {}
+    prober = threading.Thread(target=lambda: result.setdefault("upload", probe(base, args, image, stop)))
+    clients = [threading.Thread(target=login_loop, args=(base, args, stop, stats, lock))
+               for _ in range(args.concurrency if logins else 0)]
+    for t in (prober, *clients):
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in (prober, *clients):
+        t.join()
+    return {
+        "logins_s"       : round(stats["ok"] / args.duration, 2),
+        "login_p50_ms"   : percentile(stats["latencies"], 0.5),
+        "login_p95_ms"   : percentile(stats["latencies"], 0.95),
+        "login_503"      : stats["busy"],
+        "login_errors"   : stats["errors"],
+        "upload_p50_ms"  : percentile(result["upload"], 0.5),
+        "upload_p95_ms"  : percentile(result["upload"], 0.95),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--admin-email", required=True)
+    parser.add_argument("--admin-password", required=True)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--concurrency", type=int, default=32, help="clients logging in")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between uploads")
+    parser.add_argument("--label", default="", help="e.g. the PASSWORD_HASH_METHOD tested")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    with open(args.image, "rb") as fh:
+        image = fh.read()
+
+    idle  = phase(args.url, args, image, logins=False)
+    burst = phase(args.url, args, image, logins=True)
+    print(f"{'':<16}{'uploads only':>14}{'login burst':>14}")
+    for key in burst:
+        print(f"{key:<16}{str(idle[key]):>14}{str(burst[key]):>14}")
+    if not args.no_save:
+        append_result("login", {"label": args.label, "concurrency": args.concurrency,
+                                "idle": idle, "burst": burst})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
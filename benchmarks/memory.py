@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the feature extraction vs. input resolution.
+
+    python -m benchmarks.memory                       # full vs. FEATURE_MAX_SIDE=1600
+    python -m benchmarks.memory --max-side 1024 --budget-mb 120
+
+Each (input, mode) pair runs in a freshly spawned process. After a warm-up
+on a small image (imports and library pools are not counted), the peak RSS
+of the process is reset (``/proc/self/clear_refs``) and the growth of one
+extraction is read from ``VmHWM`` in ``/proc/self/status``. (``ru_maxrss``
+can't be used: it survives fork + exec, so the child would report the peak
+of the parent that generated the images.) The inputs are JPEG and PNG
+versions of the reference images of ``benchmarks/rules.py``, up to a 48 MP
+panorama. Linux only.
+
+The bounded mode must stay under ``--budget-mb`` for every input (exit
+status 1 otherwise); non-JPEG inputs above ``MAX_FULL_DECODE_PIXELS`` are
+refused by it, reported as "refused". The full-resolution mode is reported
+for comparison and grows with the pixel count. Results are appended to
+``benchmarks/results/memory.jsonl``.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from benchmarks import append_result
+
+# name -> (width, height)
+SIZES = {
+    "fhd"     : (1920, 1080),
+    "uhd"     : (3840, 2160),
+    "24mp"    : (6000, 4000),
+    "panorama": (12000, 4000),
+}
+FORMATS = ("jpg", "png")
+
+
+def _status_kb(field: str) -> int:
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} not in /proc/self/status")
+
+
+def _peak(path, warmup, max_side, out):
+    import cv2
+    from app.classification.rules import extract_features
+    cv2.setRNGSeed(0)
+    extract_features(warmup, max_side=max_side)
+    # reset VmHWM to the current RSS (needs Linux >= 4.0)
+    with open("/proc/self/clear_refs", "w") as fh:
+        fh.write("5")
+    before   = _status_kb("VmRSS")
+    features = extract_features(path, max_side=max_side)
+    after    = _status_kb("VmHWM")
+    out.put(((after - before) / 1024, features is not None))
+
+
+def peak_mb(path: str, warmup: str, max_side: int):
+    """(peak RSS growth in MB, whether features were extracted)."""
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_peak, args=(path, warmup, max_side, out))
+    proc.start()
+    mb, ok = out.get()
+    proc.join()
+    return round(mb, 1), ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-side", type=int, default=1600, help="FEATURE_MAX_SIDE to check")
+    parser.add_argument("--budget-mb", type=float, default=150.0,
+                        help="max peak growth of the bounded mode")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    import cv2
+    from benchmarks.rules import make_reference_image
+
+    rows, failures = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        warmup = os.path.join(tmp, "warmup.jpg")
+        cv2.imwrite(warmup, make_reference_image(640, 480, True, seed=0))
+
+        print(f"{'input':<14}{'MP':>6}{'full MB':>10}{'bounded MB':>12}")
+        for i, (name, (w, h)) in enumerate(SIZES.items()):
+            img = make_reference_image(w, h, True, seed=i)
+            for fmt in FORMATS:
+                path = os.path.join(tmp, f"{name}.{fmt}")
+                cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90] if fmt == "jpg" else [])
+                full_mb, _          = peak_mb(path, warmup, 0)
+                bounded_mb, decoded = peak_mb(path, warmup, args.max_side)
+                row = {
+                    "input"     : f"{name}.{fmt}",
+                    "megapixels": round(w * h / 1e6, 1),
+                    "full_mb"   : full_mb,
+                    "bounded_mb": bounded_mb,
+                    "refused"   : not decoded,
+                }
+                rows.append(row)
+                print(f"{row['input']:<14}{row['megapixels']:>6}{full_mb:>10}{bounded_mb:>12}"
+                      f"{'  refused' if row['refused'] else ''}")
+                if bounded_mb > args.budget_mb:
+                    failures.append(f"{row['input']}: {bounded_mb} MB > {args.budget_mb} MB")
+            del img
+
+    if not args.no_save:
+        append_result("memory", {"max_side": args.max_side, "budget_mb": args.budget_mb,
+                                 "results": rows})
+    if failures:
+        print(f"\n❌ Bounded mode (max side {args.max_side}) over budget:")
+        for f in failures:
+            print("   ", f)
+        return 1
+    print(f"\n✓ bounded mode within {args.budget_mb} MB at every resolution")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory and cold ``/classifier`` latency, gunicorn preload on / off.
+
+    python -m benchmarks.preload --email admin@example.com --password secret \\
+        --image app/static/uploads/sample.jpg --workers 3
+
+For ``PRELOAD=0`` then ``PRELOAD=1`` it starts ``gunicorn -c gunicorn.conf.py``
+on ``--port``, logs in, and sends one ``/classifier`` (YOLO) request per
+worker at once (cold: the first request each worker serves) then a second
+round (warm). Reported per mode, from ``/proc/<pid>/smaps_rollup``:
+
+* ``rss``     – resident memory of a worker, shared pages included;
+* ``pss``     – shared pages divided among the processes sharing them, the
+  fair share of a worker: ``pss`` x workers + master is what the server costs;
+* ``private`` – pages only this worker has (what copy-on-write failed to share).
+
+Needs a running database with the given account and Linux (``/proc``).
+Results are appended to ``benchmarks/results/preload.jsonl``.
+"""
+import argparse
+import http.cookiejar
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import append_result
+
+CSRF_RE = re.compile(rb'name="csrf_token" value="([^"]+)"')
+
+
+def memory(pid: int) -> dict:
+    """rss / pss / private (MB) of ``pid``."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss"    : fields.get("Rss", 0.0),
+        "pss"    : fields.get("Pss", 0.0),
+        "private": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as fh:
+        return [int(p) for p in fh.read().split()]
+
+
+class Client:
+    """Logged-in session (cookies + CSRF token scraped from the forms)."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def csrf(self, path: str) -> str:
+        html = self.opener.open(self.base + path, timeout=30).read()
+        return CSRF_RE.search(html).group(1).decode()
+
+    def login(self, email: str, password: str) -> None:
+        data = urllib.parse.urlencode({"csrf_token": self.csrf("/login"),
+                                       "email": email, "password": password}).encode()
+        self.opener.open(self.base + "/login", data, timeout=30).read()
+
+    def classify(self, image: bytes, token: str) -> float:
+        boundary = uuid.uuid4().hex
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="csrf_token"\r\n\r\n{token}\r\n',
+            f'--{boundary}\r\nContent-Disposition: form-data; name="selected_model"\r\n\r\nyolo\r\n',
+            f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="b.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n',
+        ]
+        body = "".join(parts).encode() + image + f"\r\n--{boundary}--\r\n".encode()
+        req = urllib.request.Request(self.base + "/classifier", body, {
+            "Content-Type": f"multipart/form-data; boundary={boundary}"})
+        start = time.perf_counter()
+        self.opener.open(req, timeout=300).read()
+        return time.perf_counter() - start
+
+
+def wait_until_up(base: str, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base + "/login", timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("gunicorn did not start")
+
+
+def measure(preload: bool, args, image: bytes) -> dict:
+    base = f"http://127.0.0.1:{args.port}"
+    env  = {**os.environ, "PRELOAD": "1" if preload else "0",
+            "WEB_CONCURRENCY": str(args.workers), "BIND": f"127.0.0.1:{args.port}"}
+    started = time.perf_counter()
+    server  = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], env=env)
+    try:
+        wait_until_up(base)
+        ready = time.perf_counter() - started
+        time.sleep(2.0)                          # every worker booted
+        workers = children(server.pid)
+        idle = [memory(p) for p in workers]
+
+        client = Client(base)
+        client.login(args.email, args.password)
+        rounds = []
+        with ThreadPoolExecutor(args.workers) as pool:
+            for _ in range(2):                   # cold, then warm
+                tokens = [client.csrf("/classifier") for _ in range(args.workers)]
+                rounds.append(list(pool.map(lambda t: client.classify(image, t), tokens)))
+        served = [memory(p) for p in workers]
+        master = memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    def mean(samples, key):
+        return round(statistics.mean(s[key] for s in samples), 1)
+
+    return {
+        "preload"        : preload,
+        "workers"        : args.workers,
+        "ready_s"        : round(ready, 2),
+        "idle_rss_mb"    : mean(idle, "rss"),
+        "idle_pss_mb"    : mean(idle, "pss"),
+        "rss_mb"         : mean(served, "rss"),
+        "pss_mb"         : mean(served, "pss"),
+        "private_mb"     : mean(served, "private"),
+        "master_pss_mb"  : round(master["pss"], 1),
+        "total_pss_mb"   : round(sum(s["pss"] for s in served) + master["pss"], 1),
+        "cold_max_ms"    : round(max(rounds[0]) * 1000, 1),
+        "cold_mean_ms"   : round(statistics.mean(rounds[0]) * 1000, 1),
+        "warm_mean_ms"   : round(statistics.mean(rounds[1]) * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--image", required=True, help="JPEG sent to /classifier")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    with open(args.image, "rb") as fh:
+        image = fh.read()
+
+    results = [measure(preload, args, image) for preload in (False, True)]
+    print(f"{'':<15}{'preload off':>14}{'preload on':>14}")
+    for key in results[0]:
+        if key != "preload":
+            print(f"{key:<15}{results[0][key]:>14}{results[1][key]:>14}")
+    if not args.no_save:
+        for r in results:
+            append_result("preload", r)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
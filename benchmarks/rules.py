@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the classification hot path
+(``extract_features`` + ``classify_image_by_rules``).
+
+    python -m benchmarks.rules                    # run + compare to last run
+    python -m benchmarks.rules --update-baseline  # accept new features/labels
+
+For each reference image (synthetic, deterministic, several resolutions) it
+reports the time of every stage of ``extract_features`` and the peak memory
+allocated, appends the results to ``benchmarks/results/rules.jsonl`` tagged
+with the current git commit, and flags stages that got slower than the
+previous run by more than ``--tolerance``.
+
+Feature parity: the features and label of every reference image are compared
+with ``benchmarks/rules_parity.json``, which is committed next to this script
+(not under the ignored ``results/``) so every checkout checks against the same
+baseline. Any difference, or a missing baseline, makes the script exit with
+status 1, so an optimisation can't silently change the labels.
+"""
+
+import argparse
+import json
+import pathlib
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from app.classification.rules import classify_image_by_rules
+from benchmarks import RESULTS_DIR, git_revision
+
+HISTORY_PATH  = RESULTS_DIR / "rules.jsonl"
+PARITY_PATH   = pathlib.Path(__file__).with_name("rules_parity.json")
+
+# name -> (width, height)
+RESOLUTIONS = {
+    "vga"   : (640, 480),
+    "hd"    : (1280, 720),
+    "fhd"   : (1920, 1080),
+    "uhd"   : (3840, 2160),
+}
+
+FEATURE_TOLERANCE = 1e-6
+
+
+def make_reference_image(width: int, height: int, full: bool, seed: int) -> np.ndarray:
+    """A deterministic 'bin' picture: textured background, a grey bin and,
+    when ``full``, dark clutter inside and on top of it."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(90, 140, size=(height, width, 3), dtype=np.uint8)
+    img[..., 0] = np.clip(img[..., 0].astype(int) + 40, 0, 255)   # bluish ground
+
+    x0, y0 = int(width * 0.30), int(height * 0.25)
+    x1, y1 = int(width * 0.70), int(height * 0.90)
+    cv2.rectangle(img, (x0, y0), (x1, y1), (120, 125, 120), thickness=-1)
+    cv2.rectangle(img, (x0, y0), (x1, y0 + (y1 - y0) // 10), (60, 140, 60), thickness=-1)
+
+    if full:
+        for _ in range(60):
+            cx = int(rng.integers(x0, x1))
+            cy = int(rng.integers(y0, y1))
+            r  = int(rng.integers(max(2, width // 200), max(3, width // 40)))
+            color = tuple(int(c) for c in rng.integers(0, 90, size=3))
+            cv2.circle(img, (cx, cy), r, color, thickness=-1)
+    return img
+
+
+def write_reference_images(folder: pathlib.Path) -> dict:
+    """Write every reference image as PNG (lossless) and return name -> path."""
+    paths = {}
+    for i, (res, (w, h)) in enumerate(RESOLUTIONS.items()):
+        for full in (False, True):
+            name = f"{res}_{'full' if full else 'empty'}"
+            path = folder / f"{name}.png"
+            cv2.imwrite(str(path), make_reference_image(w, h, full, seed=i))
+            paths[name] = str(path)
+    return paths
+
+
+def run_once(path: str):
+    # k-means uses random centres: fix the seed so features are reproducible
+    cv2.setRNGSeed(0)
+    timings = {}
+    start = time.perf_counter()
+    label, features = classify_image_by_rules(path, timings)
+    timings["total"] = time.perf_counter() - start
+    return label, features, timings
+
+
+def peak_memory(path: str) -> int:
+    """Peak bytes allocated by one classification, in a separate untimed pass
+    (tracemalloc hooks every allocation and would inflate the timings)."""
+    cv2.setRNGSeed(0)
+    tracemalloc.start()
+    classify_image_by_rules(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark(paths: dict, repeat: int) -> dict:
+    results = {}
+    for name, path in paths.items():
+        runs = [run_once(path) for _ in range(repeat)]
+        label, features = runs[0][0], runs[0][1]
+        stages = {
+            stage: statistics.median(r[2].get(stage, 0.0) for r in runs)
+            for stage in runs[0][2]
+        }
+        results[name] = {
+            "label"      : label,
+            "features"   : features,
+            "stages_ms"  : {k: round(v * 1000, 3) for k, v in stages.items()},
+            "peak_mb"    : round(peak_memory(path) / 2**20, 2),
+        }
+    return results
+
+
+def last_run():
+    if not HISTORY_PATH.exists():
+        return None
+    lines = HISTORY_PATH.read_text().strip().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def check_parity(results: dict) -> list:
+    """Return the list of mismatches with the stored baseline."""
+    if not PARITY_PATH.exists():
+        return [f"no baseline at {PARITY_PATH}: run with --update-baseline and commit it"]
+    baseline = json.loads(PARITY_PATH.read_text())
+    errors = []
+    for name, res in results.items():
+        ref = baseline.get(name)
+        if ref is None:
+            continue
+        if ref["label"] != res["label"]:
+            errors.append(f"{name}: label {ref['label']} -> {res['label']}")
+        for key, value in ref["features"].items():
+            if abs(value - res["features"].get(key, float("nan"))) > FEATURE_TOLERANCE:
+                errors.append(f"{name}: {key} {value} -> {res['features'].get(key)}")
+    return errors
+
+
+def print_report(results: dict, previous, tolerance: float) -> list:
+    regressions = []
+    prev = previous["results"] if previous else {}
+    for name, res in results.items():
+        print(f"\n{name}  label={res['label']}  peak={res['peak_mb']} MB")
+        for stage, ms in res["stages_ms"].items():
+            line = f"  {stage:<16}{ms:>10.3f} ms"
+            old = prev.get(name, {}).get("stages_ms", {}).get(stage)
+            if old:
+                delta = (ms - old) / old
+                line += f"  ({delta:+.0%} vs {previous['revision']})"
+                if delta > tolerance and ms - old > 0.5:
+                    regressions.append(f"{name}/{stage}: {old} -> {ms} ms")
+            print(line)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="relative slow-down reported as a regression")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the current features/labels as the parity baseline")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    previous = last_run()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_reference_images(pathlib.Path(tmp))
+        results = benchmark(paths, args.repeat)
+
+    regressions = print_report(results, previous, args.tolerance)
+    parity_errors = check_parity(results)
+
+    if args.update_baseline:
+        PARITY_PATH.write_text(json.dumps(
+            {n: {"label": r["label"], "features": r["features"]} for n, r in results.items()},
+            indent=2,
+        ))
+        print(f"\n✓ Parity baseline written to {PARITY_PATH}")
+        parity_errors = []
+
+    if not args.no_save:
+        with HISTORY_PATH.open("a") as fh:
+            fh.write(json.dumps({
+                "revision" : git_revision(),
+                "time"     : time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "results"  : results,
+            }) + "\n")
+
+    if regressions:
+        print("\n⚠️  Slower than previous run:")
+        for r in regressions:
+            print("   ", r)
+    if parity_errors:
+        print("\n❌ Feature parity broken:")
+        for e in parity_errors:
+            print("   ", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Load test of a running server: idle dashboard sockets + slow uploads.
+
+    # terminal 1 – the server in the mode to measure
+    gunicorn "app:create_app()" -b 127.0.0.1:8000 -w 3                         # sync
+    CLASSIFY_WORKERS=4 gunicorn "app:create_app()" -b 127.0.0.1:8000 -w 1 -k eventlet
+
+    # terminal 2
+    python -m benchmarks.server --label sync --sockets 1000 --slow 50
+    python -m benchmarks.server --label eventlet --sockets 1000 --slow 50
+
+While ``--sockets`` Socket.IO clients hold a long-polling request open (what an
+idle dashboard does) and ``--slow`` clients trickle a multipart body at
+``--rate`` bytes/s (a phone on a bad connection), a probe requests ``--probe``
+once per 100 ms. Reported: connected sockets, probe latency percentiles and
+errors. Results are appended to ``benchmarks/results/server.jsonl``.
+
+Only the standard library is used (no Flask app needed).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+from benchmarks import append_result
+
+
+async def http(host, port, method, path, body=b"", headers=None, rate=None, timeout=60):
+    """Minimal HTTP/1.1 request; ``rate`` (bytes/s) trickles the body.
+    Returns (status, body)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close",
+                f"Content-Length: {len(body)}", *(f"{k}: {v}" for k, v in (headers or {}).items())]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+        if rate:
+            step = max(rate // 10, 1)
+            for i in range(0, len(body), step):
+                writer.write(body[i:i + step])
+                await writer.drain()
+                await asyncio.sleep(0.1)
+        else:
+            writer.write(body)
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(data.split(b" ", 2)[1]) if data else 0
+    return status, data.partition(b"\r\n\r\n")[2]
+
+
+async def dashboard_socket(host, port, stop: asyncio.Event, stats: dict):
+    """Engine.IO polling client: handshake, then keep a poll request open."""
+    try:
+        status, body = await http(host, port, "GET", "/socket.io/?EIO=4&transport=polling")
+        sid = json.loads(body[body.index(b"{"):body.rindex(b"}") + 1])["sid"]
+        stats["connected"] += 1
+    except Exception:
+        stats["failed"] += 1
+        return
+    path = f"/socket.io/?EIO=4&transport=polling&sid={sid}"
+    while not stop.is_set():
+        try:
+            await http(host, port, "GET", path, timeout=40)
+        except Exception:
+            stats["dropped"] += 1
+            return
+
+
+async def slow_upload(host, port, size, rate, stats: dict):
+    boundary = "wdpbench"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"b.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + b"\0" * size + f"\r\n--{boundary}--\r\n".encode()
+    start = time.perf_counter()
+    try:
+        # rejected without a session / CSRF token, but only once the body is read
+        await http(host, port, "POST", "/quick_upload", body,
+                   {"Content-Type": f"multipart/form-data; boundary={boundary}"}, rate=rate)
+        stats["uploads"].append(time.perf_counter() - start)
+    except Exception:
+        stats["upload_errors"] += 1
+
+
+async def probe(host, port, path, stop: asyncio.Event, latencies: list, stats: dict):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status, _ = await http(host, port, "GET", path, timeout=30)
+            if status >= 500:
+                stats["probe_errors"] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+        except Exception:
+            stats["probe_errors"] += 1
+        await asyncio.sleep(0.1)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run(args) -> dict:
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    stop = asyncio.Event()
+    stats = {"connected": 0, "failed": 0, "dropped": 0, "uploads": [],
+             "upload_errors": 0, "probe_errors": 0}
+    latencies = []
+
+    tasks = []
+    for i in range(args.sockets):
+        tasks.append(asyncio.create_task(dashboard_socket(host, port, stop, stats)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)      # don't overflow the listen backlog
+    tasks += [asyncio.create_task(slow_upload(host, port, args.size, args.rate, stats))
+              for _ in range(args.slow)]
+    tasks.append(asyncio.create_task(probe(host, port, args.probe, stop, latencies, stats)))
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        "sockets_connected": stats["connected"],
+        "sockets_failed"   : stats["failed"] + stats["dropped"],
+        "uploads_done"     : len(stats["uploads"]),
+        "upload_errors"    : stats["upload_errors"],
+        "probe_requests"   : len(latencies),
+        "probe_errors"     : stats["probe_errors"],
+        "probe_p50_ms"     : ms(percentile(latencies, 0.50)),
+        "probe_p95_ms"     : ms(percentile(latencies, 0.95)),
+        "probe_max_ms"     : ms(max(latencies) if latencies else None),
+        "probe_mean_ms"    : ms(statistics.mean(latencies) if latencies else None),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--label", default="sync", help="server mode, stored with the results")
+    parser.add_argument("--sockets", type=int, default=500, help="idle dashboard clients")
+    parser.add_argument("--slow", type=int, default=20, help="concurrent slow uploads")
+    parser.add_argument("--size", type=int, default=2_000_000, help="upload size (bytes)")
+    parser.add_argument("--rate", type=int, default=200_000, help="upload speed (bytes/s)")
+    parser.add_argument("--probe", default="/login", help="path whose latency is measured")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(f"{args.label}:")
+    for k, v in result.items():
+        print(f"  {k:<18} {v}")
+    if not args.no_save:
+        append_result("server", {"label": args.label, "params": vars(args), "result": result})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+App startup budget.
+
+    python -m benchmarks.startup                 # check against the budget
+    python -m benchmarks.startup --budget 2.5    # seconds, per command
+
+Runs ``create_app()`` and the ``flask`` CLI commands in fresh interpreters
+with ``-X importtime`` and checks that
+
+* none of the heavy ML / vision stacks (torch, ultralytics, cv2, geopy, PIL,
+  pyarrow) is imported – they belong behind the classification modules and
+  ``app.classification.registry``, loaded on first use;
+* each command starts within ``--budget`` seconds (best of ``--repeat``).
+
+Prints the slowest imports of each command, appends the timings to
+``benchmarks/results/startup.jsonl`` and exits with status 1 on failure.
+No database is needed: the commands only run up to ``--help``.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+from benchmarks import append_result
+
+HEAVY = ("torch", "ultralytics", "cv2", "geopy", "PIL", "pyarrow")
+
+COMMANDS = {
+    "create_app"      : ["-c", "from app import create_app; create_app()"],
+    "create-db"       : ["-m", "flask", "--app", "run", "create-db", "--help"],
+    "drop-db"         : ["-m", "flask", "--app", "run", "drop-db", "--help"],
+    "create-superuser": ["-m", "flask", "--app", "run", "create-superuser", "--help"],
+}
+
+# import time: self [us] | cumulative | imported package
+LINE_RE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)")
+
+
+def run(args: list) -> tuple:
+    """Wall-clock seconds and ``{module: cumulative us}`` of one run."""
+    start = time.perf_counter()
+    proc  = subprocess.run([sys.executable, "-X", "importtime", *args],
+                           capture_output=True, text=True, env={**os.environ, "PYTHONWARNINGS": "ignore"})
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+    modules = {}
+    for m in LINE_RE.finditer(proc.stderr):
+        modules[m.group(2)] = int(m.group(1))
+    return elapsed, modules
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per command")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports shown")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    failures, record = [], {"budget_s": args.budget}
+    for name, cmd in COMMANDS.items():
+        runs = [run(cmd) for _ in range(args.repeat)]
+        elapsed, modules = min(runs, key=lambda r: r[0])
+        heavy = sorted({m.split(".")[0] for m in modules} & set(HEAVY))
+        record[name] = round(elapsed, 3)
+
+        print(f"{name:<17} {elapsed:6.2f} s   ({len(modules)} modules)")
+        top = sorted(((us, m) for m, us in modules.items() if "." not in m), reverse=True)
+        for us, module in top[:args.top]:
+            print(f"    {us / 1e6:6.3f} s  {module}")
+        if heavy:
+            failures.append(f"{name}: imports {', '.join(heavy)}")
+        if elapsed > args.budget:
+            failures.append(f"{name}: {elapsed:.2f} s > budget {args.budget:.2f} s")
+
+    if not args.no_save:
+        append_result("startup", record)
+    if failures:
+        print("\n❌ Startup budget exceeded:")
+        for f in failures:
+            print("   ", f)
+        return 1
+    print("\n✓ startup within budget, no heavy import")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Throughput of the classification for processes x native threads.
+
+    python -m benchmarks.threads                                   # default matrix
+    python -m benchmarks.threads --workers 1,2,4,8 --threads 1,2,4 --yolo
+
+For every (workers, threads) pair, ``workers`` processes (gunicorn workers or
+``CLASSIFY_WORKERS``) each classify ``--images`` reference images at once,
+with OpenCV (and torch with ``--yolo``) limited to ``threads`` threads through
+``app.concurrency`` – as ``CV2_THREADS`` / ``TORCH_THREADS`` do in the app.
+Reported: images/s over all processes and the per-image latency p50 / p95.
+Pick the fastest pair whose p95 is acceptable and set ``config.py``
+accordingly. Results are appended to ``benchmarks/results/threads.jsonl``.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import append_result
+
+
+def worker(paths, threads, images, yolo, barrier, results):
+    from app import concurrency
+    concurrency.configure(threads, threads)
+    import cv2
+    from app.classification.rules import classify_image_by_rules
+    model = None
+    if yolo:
+        from app.classification.registry import get_model
+        model = get_model("yolo")
+    concurrency.apply()
+
+    def one(path):
+        cv2.setRNGSeed(0)
+        classify_image_by_rules(path)
+        if model is not None:
+            model.predict(path, conf=0.25, verbose=False)
+
+    one(paths[0])                               # warm-up (imports, model)
+    barrier.wait()
+    latencies, start = [], time.perf_counter()
+    for i in range(images):
+        t = time.perf_counter()
+        one(paths[i % len(paths)])
+        latencies.append(time.perf_counter() - t)
+    results.put((time.perf_counter() - start, latencies))
+
+
+def run(paths, workers, threads, images, yolo) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(paths, threads, images, yolo, barrier, results))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    runs = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies = sorted(l for _, ls in runs for l in ls)
+    elapsed   = max(e for e, _ in runs)
+    return {
+        "workers"   : workers,
+        "threads"   : threads,
+        "images_s"  : round(len(latencies) / elapsed, 2),
+        "p50_ms"    : round(statistics.median(latencies) * 1000, 1),
+        "p95_ms"    : round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default=None, help="comma list (default: 1,2,cores/2,cores)")
+    parser.add_argument("--threads", default="1,2,4")
+    parser.add_argument("--images", type=int, default=20, help="per process")
+    parser.add_argument("--resolution", default="fhd", help="vga, hd, fhd or uhd")
+    parser.add_argument("--yolo", action="store_true", help="add the YOLO inference (torch)")
+    parser.add_argument("--no-save", action="store_true", help="don't append to the history")
+    args = parser.parse_args(argv)
+
+    import cv2
+    from benchmarks.rules import RESOLUTIONS, make_reference_image
+
+    cores   = os.cpu_count() or 1
+    workers = [int(w) for w in args.workers.split(",")] if args.workers else \
+        sorted({1, 2, max(cores // 2, 1), cores})
+    threads = [int(t) for t in args.threads.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        w, h  = RESOLUTIONS[args.resolution]
+        paths = []
+        for i, full in enumerate((False, True)):
+            paths.append(os.path.join(tmp, f"{i}.png"))
+            cv2.imwrite(paths[-1], make_reference_image(w, h, full, seed=i))
+
+        print(f"{cores} cores, {args.resolution}, {args.images} images per process"
+              f"{', + YOLO' if args.yolo else ''}\n")
+        print(f"{'workers':>7} {'threads':>7} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        rows = []
+        for n in workers:
+            for t in threads:
+                row = run(paths, n, t, args.images, args.yolo)
+                rows.append(row)
+                flag = "  (oversubscribed)" if n * t > cores else ""
+                print(f"{n:>7} {t:>7} {row['images_s']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8}{flag}")
+
+    best = max(rows, key=lambda r: r["images_s"])
+    print(f"\nbest throughput: {best['workers']} processes x {best['threads']} thread(s)")
+    if not args.no_save:
+        append_result("threads", {"cores": cores, "resolution": args.resolution,
+                                  "yolo": args.yolo, "matrix": rows})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
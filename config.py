@@ -1,5 +1,34 @@
 import os
 
+
+def engine_options(pool_size: int, max_overflow: int, statement_timeout_ms: int) -> dict:
+    """SQLAlchemy engine / pool settings (``statement_timeout_ms`` 0 = none)."""
+    options = {
+        "pool_size"    : pool_size,
+        "max_overflow" : max_overflow,
+        "pool_timeout" : int(os.environ.get("DB_POOL_TIMEOUT", 10)),  # seconds waiting for a connection
+        "pool_recycle" : 1800,
+        "pool_pre_ping": True,
+    }
+    if statement_timeout_ms:
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+def replica_binds(options: dict) -> dict:
+    """Read replica for the dashboard aggregates (``DATABASE_REPLICA_URL``),
+    with the pool ``options`` of the primary and read-only transactions."""
+    url = os.environ.get("DATABASE_REPLICA_URL")
+    if not url:
+        return {}
+    pg_options = options.get("connect_args", {}).get("options", "")
+    return {"replica": {
+        **options,
+        "url"         : url,
+        "connect_args": {"options": f"{pg_options} -c default_transaction_read_only=on".strip()},
+    }}
+
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-key")
     UPLOAD_FOLDER = os.path.join("app", "static", "uploads")
@@ -11,9 +40,112 @@ class Config:
     )
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        statement_timeout_ms=int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0)),
+    )
+    SQLALCHEMY_BINDS = replica_binds(SQLALCHEMY_ENGINE_OPTIONS)
+
+    # Observability
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # Shared directory where each gunicorn worker dumps its metrics so that
+    # /metrics reports all workers (unset = single process)
+    METRICS_DIR = os.environ.get("METRICS_DIR")
+    METRICS_FLUSH_SECONDS = 5.0
+
+    # Request profiler (admins can always add ?_profile=1)
+    PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", 0))  # 1-in-N, 0 = off
+    PROFILE_BUFFER_SIZE = 50
+
+    # Near-duplicate uploads (perceptual hash)
+    DEDUP_ENABLED = True
+    DEDUP_WINDOW_HOURS = 24     # same bin reported again within this window...
+    DEDUP_RADIUS_M = 50         # ...and this distance
+    DEDUP_MAX_DISTANCE = 6      # max differing bits out of 64
+
+    # Processes running the feature extraction (0 = inline, in the request).
+    # Set it with eventlet / gevent workers so that one upload does not stall
+    # every connection of the worker.
+    CLASSIFY_WORKERS = int(os.environ.get("CLASSIFY_WORKERS", 0))
+
+    # Memory-bounded feature extraction (app/classification/bounded.py):
+    # images are decoded / analysed with at most this many pixels on their
+    # longest side, whatever the upload. 0 = full resolution (default, the
+    # mode the rules were tuned in).
+    FEATURE_MAX_SIDE = int(os.environ.get("FEATURE_MAX_SIDE", 0))
+
+    # Capture page: the browser resizes the photo to this longest side (0 = no
+    # resize) and encodes it as JPEG at this quality (0-1) before the upload.
+    # Off by default: contour_count, edge_density and color_diversity depend on
+    # the resolution, so resized captures fail benchmarks/capture.py until
+    # those features are normalised and the rules re-tuned. Keep it
+    # >= FEATURE_MAX_SIDE when that is set.
+    CAPTURE_MAX_SIDE = int(os.environ.get("CAPTURE_MAX_SIDE", 0))
+    CAPTURE_JPEG_QUALITY = float(os.environ.get("CAPTURE_JPEG_QUALITY", 0.95))
+    # Largest capture hashed in memory; bigger uploads are streamed to the storage
+    CAPTURE_MAX_BYTES = int(os.environ.get("CAPTURE_MAX_BYTES", 4 << 20))
+
+    # Password hashing (app/security.py). The method carries the cost:
+    # pbkdf2:sha256:<iterations> or scrypt:<n>:<r>:<p>. Stored hashes made
+    # with another method are upgraded at the next login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    PASSWORD_SALT_LENGTH = 16
+    KDF_WORKERS = int(os.environ.get("KDF_WORKERS", 2))   # hashes computed at once, per process
+    KDF_QUEUE_TIMEOUT = 5.0     # seconds a login waits for a slot before a 503
+
+    # Native threads per process (app/concurrency.py): OpenCV in the feature
+    # extraction, torch in the YOLO inference. Keep
+    # WEB_CONCURRENCY x (max(CV2, TORCH) + CLASSIFY_WORKERS x CV2) <= cores
+    # (every gunicorn worker has its own CLASSIFY_WORKERS processes).
+    WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))   # gunicorn workers
+    CV2_THREADS = int(os.environ.get("CV2_THREADS", 1))
+    TORCH_THREADS = int(os.environ.get("TORCH_THREADS", 1))
+
+    # Automatic keyframes of uploaded videos (app/classification/keyframes.py)
+    KEYFRAME_SAMPLE_FPS = 2.0         # frames analysed per second of video
+    KEYFRAME_SCENE_THRESHOLD = 0.3    # histogram distance (0..1) = new scene
+    KEYFRAME_MIN_GAP_S = 2.0
+    KEYFRAME_MAX = 100                # per video (size of the confirm page)
+    KEYFRAME_BATCH_SIZE = 16          # frames classified per batch
+
+    # Live dashboard updates across workers / servers: redis://..., amqp://...
+    # or postgresql://... (LISTEN / NOTIFY). Unset = single process.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+
+    # Dashboard cache: "lru" (per process), "redis" (shared) or "none"
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "lru")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    CACHE_MAX_ENTRIES = 256
+    CACHE_TTL_SECONDS = 3600
+
+    # Image / video storage: "local" (UPLOAD_FOLDER) or "s3" (needs boto3;
+    # credentials from the usual AWS_* variables)
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+    S3_BUCKET = os.environ.get("S3_BUCKET", "wdp-images")
+    S3_PREFIX = os.environ.get("S3_PREFIX", "")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO
 
 class DevConfig(Config):
     DEBUG = True
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
 
 class ProdConfig(Config):
     DEBUG = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 10)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        statement_timeout_ms=int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30_000)),
+    )
+    SQLALCHEMY_BINDS = replica_binds(SQLALCHEMY_ENGINE_OPTIONS)
+
+CONFIGS = {"dev": DevConfig, "prod": ProdConfig}
+
+
+def get_config():
+    """Config class selected by ``APP_CONFIG`` ("dev" by default, "prod")."""
+    name = os.environ.get("APP_CONFIG", "dev")
+    try:
+        return CONFIGS[name]
+    except KeyError:
+        raise RuntimeError(f"APP_CONFIG must be one of {', '.join(CONFIGS)}, not {name!r}")
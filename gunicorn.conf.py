@@ -0,0 +1,88 @@
+"""
+gunicorn settings (``gunicorn -c gunicorn.conf.py``).
+
+With ``PRELOAD=1`` (default) the app, the YOLO weights and the compiled rules
+are loaded once in the master, then frozen (``gc.freeze``) before the workers
+are forked: the workers share those pages copy-on-write instead of holding
+one copy of torch + weights each, and their first ``/classifier`` request
+doesn't pay for loading the model. ``PRELOAD=0`` loads everything in each
+worker, on first use.
+
+The torch / OpenCV threads of every worker follow ``CV2_THREADS`` and
+``TORCH_THREADS`` (``config.py``, applied by ``app.concurrency``).
+
+    PRELOAD=1 WEB_CONCURRENCY=3 gunicorn -c gunicorn.conf.py
+
+The app runs with ``ProdConfig`` (no debug, pool sizing, statement timeout)
+unless ``APP_CONFIG`` says otherwise.
+
+Preloading is turned off for eventlet / gevent workers (``-k`` or
+``WORKER_CLASS``): they monkey-patch the standard library after the fork, so
+an app built in the unpatched master would pick Socket.IO's "threading" mode
+and keep blocking sockets and locks. Each green worker builds its own app.
+"""
+import gc
+import os
+import shlex
+import sys
+
+os.environ.setdefault("APP_CONFIG", "prod")          # ProdConfig (config.py)
+
+wsgi_app    = "app:create_app()"
+bind        = os.environ.get("BIND", "127.0.0.1:8000")
+workers     = int(os.environ.setdefault("WEB_CONCURRENCY", "3"))   # also read by config.py
+timeout     = 120
+
+GREEN_WORKERS = ("eventlet", "gevent")
+
+
+def _worker_class() -> str:
+    """-k / --worker-class from the command line, else WORKER_CLASS."""
+    from gunicorn.config import Config
+    argv = [*shlex.split(os.environ.get("GUNICORN_CMD_ARGS", "")), *sys.argv[1:]]
+    cli  = Config().parser().parse_known_args(argv)[0].worker_class
+    return cli or os.environ.get("WORKER_CLASS", "sync")
+
+
+worker_class = _worker_class()
+GREEN        = any(name in worker_class.lower() for name in GREEN_WORKERS)
+preload_app  = os.environ.get("PRELOAD", "1") == "1" and not GREEN
+
+PRELOAD_MODELS = [m for m in os.environ.get("PRELOAD_MODELS", "yolo").split(",") if m]
+
+
+def when_ready(server):
+    """Master, app loaded, before the first fork."""
+    if not preload_app:
+        return
+    from app.classification import registry, rules_store
+    # no inference here: OpenMP thread pools started in the master don't
+    # survive fork()
+    names = registry.preload(PRELOAD_MODELS)
+    rules_store.get_compiled_rules()
+    # move everything allocated so far out of the collector's reach: a
+    # collection in a worker would otherwise write to (and copy) every page
+    gc.collect()
+    gc.freeze()
+    server.log.info("preloaded %s, %d objects frozen", ", ".join(names) or "no model",
+                    gc.get_freeze_count())
+
+
+def post_worker_init(worker):
+    # eventlet / gevent workers are monkey-patched after the fork: make the
+    # database driver cooperative before the first request
+    from app import executors
+    executors.async_mode()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app import concurrency
+    concurrency.apply()
+
+    # connections opened by the master must not be shared with the workers
+    from app.extensions import database
+    with server.app.wsgi().app_context():
+        for engine in database.engines.values():
+            engine.dispose(close=False)